@@ -78,6 +78,26 @@ class Admin(commands.Cog):
 
 
 
+    @commands.command(name="render-stats", description="查看抽卡繪圖執行池的狀態")
+    @is_bot_admin()
+    async def render_stats(self, ctx: commands.Context):
+        gacha_cog = self.bot.get_cog('Gacha')
+        if not gacha_cog or not hasattr(gacha_cog, 'render_pool'):
+            return await ctx.send("❌ 錯誤：找不到 'Gacha' Cog 或繪圖執行池。")
+        stats = gacha_cog.render_pool.stats()
+        lines = [f"`{key}`: {value}" for key, value in stats.items()]
+        await ctx.send("🖼️ 繪圖執行池狀態\n" + "\n".join(lines))
+
+    @commands.command(name="record-stats", description="查看抽卡記錄寫入佇列的狀態")
+    @is_bot_admin()
+    async def record_stats(self, ctx: commands.Context):
+        gacha_cog = self.bot.get_cog('Gacha')
+        if not gacha_cog or not hasattr(gacha_cog, 'pull_recorder'):
+            return await ctx.send("❌ 錯誤：找不到 'Gacha' Cog 或抽卡記錄佇列。")
+        stats = gacha_cog.pull_recorder.stats()
+        lines = [f"`{key}`: {value}" for key, value in stats.items()]
+        await ctx.send("📝 抽卡記錄寫入佇列狀態\n" + "\n".join(lines))
+
     @commands.group(name="simtime", invoke_without_command=True, description="管理模擬時間以測試卡池。")
     @is_bot_admin() # 使用您已有的權限檢查器
     async def simtime(self, ctx: commands.Context):
@@ -1,318 +1,88 @@
 # cogs/gacha.py
+import asyncio
 import datetime
+import io
 import discord
 from discord.ext import commands
 from discord import app_commands
-from pathlib import Path
-import random
-import math
-import PIL.Image
-import PIL.ImageChops
 
 
 from .utils import gacha_db # 使用我們更新後的 gacha_db
+from .utils import gacha_engine
+from .utils import gacha_render
+from .utils import gacha_snapshot
+from .utils import pull_recorder
+from .utils import render_pool
+
+SIM_MIN_PULLS = 10_000
+SIM_MAX_PULLS = 1_000_000
 
-ASSETS_DIR = Path(__file__).parent.parent / "assets"
-IMAGE_DIR = Path(__file__).parent.parent / "gacha_data" / "images"
-
-try:
-    
-    STAR_1 = PIL.Image.open(ASSETS_DIR / "star.png")
-    STAR_2 = PIL.Image.open(ASSETS_DIR / "two_star.png")
-    STAR_3 = PIL.Image.open(ASSETS_DIR / "three_star.png")
-    BACKGROUND = PIL.Image.open(ASSETS_DIR / "BackGround.png") 
-    PURPLE_GLOW = PIL.Image.open(ASSETS_DIR / "purple_glow.png")
-    YELLOW_GLOW = PIL.Image.open(ASSETS_DIR / "yellow_glow.png")
-    BORDER = PIL.Image.open(ASSETS_DIR / "border.png")
-    PURPLE_BORDER = PIL.Image.open(ASSETS_DIR / "purple_border.png")
-    YELLOW_BORDER = PIL.Image.open(ASSETS_DIR / "yellow_border.png")
-    BLUE_BORDER = PIL.Image.open(ASSETS_DIR / "blue_border.png")
-
-
-    # 縮小 MASK 圖標尺寸
-    original_mask = PIL.Image.open(ASSETS_DIR / "mask.png")
-    original_mask_width, original_mask_height = original_mask.size
-    new_mask_width = int(original_mask_width * 0.875)
-    new_mask_height = int(original_mask_height * 0.875)
-    MASK = original_mask.resize((new_mask_width, new_mask_height), PIL.Image.Resampling.LANCZOS)
-    
-    # 縮小 Pickup 圖標尺寸
-    original_Pickup= PIL.Image.open(ASSETS_DIR / "Pickup.png")
-    original_Pickup_width, original_Pickup_height = original_Pickup.size
-    new_width = int(original_Pickup_width * 0.35)
-    new_height = int(original_Pickup_height * 0.35)
-    PICKUP_ICON = original_Pickup.resize((new_width, new_height), PIL.Image.Resampling.LANCZOS)
-except FileNotFoundError as e:
-    raise FileNotFoundError(f"缺少核心素材圖片，請檢查 assets 資料夾: {e}")
 
 class Gacha(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.load_data_from_db()
-
-    def load_data_from_db(self):
         print("正在從資料庫載入轉蛋資料...")
-        self.pools_gl = gacha_db.get_character_pools("global")
-        self.banners_gl = gacha_db.get_current_banners("global")
-        
-        self.pools_jp = gacha_db.get_character_pools("japan")
-        self.banners_jp = gacha_db.get_current_banners("japan")
+        # 目前的資料快照；更新時整個替換，互動開始時取用一次並一路用到結束
+        self.snapshot = gacha_snapshot.load_snapshot()
         print("轉蛋資料載入完成。")
 
-    def pull_logic(self, server: str, choice: int, last_pull: bool):
-        pools_source = self.pools_gl if server == "global" else self.pools_jp
-        all_banners_for_server = self.banners_gl if server == "global" else self.banners_jp
-        
-        # 深拷貝基礎卡池
-        pool_r = pools_source["R"].copy()
-        pool_sr = pools_source["SR"].copy()
-        pool_ssr_permanent = pools_source["SSR"].copy() # 常駐三星
-        pool_limited_normal = pools_source["Limited_Normal"].copy() # 普通限定
-        pool_limited_fes = pools_source["Limited_Fes"].copy() # Fes 限定
-
-        current_pickup_char = None # 當前卡池的 Pick Up 角色 (字典)
-        
-        # 預設權重: R, SR, SSR_常駐, SSR_PickUp, SSR_Limited_Normal_Other, SSR_Limited_Fes_PickUp, SSR_Limited_Fes_Other
-        # 索引:     0,  1,  2,         3,            4,                        5,                         6
-        weights = [78.5, 18.5, 3.0, 0, 0, 0, 0] 
-        result_categories = ["R", "SR", "SSR_Perm", "SSR_PickUp", "SSR_Lim_Norm_Other", "SSR_Fes_PickUp", "SSR_Fes_Other"]
-        
-        gacha_type = "NormalGacha"
+    @property
+    def catalog(self):
+        return self.snapshot.catalog
 
-        if choice > -1 and choice < len(all_banners_for_server):
-            selected_banner = all_banners_for_server[choice]
-            gacha_type = selected_banner["gachaType"]
-            
-            if selected_banner.get("rateups") and selected_banner["rateups"]:
-                current_pickup_char = selected_banner["rateups"][0] # 只取第一個 pick up
-                
-                # 從相應卡池中移除 UP 角，避免重複計算機率
-                if current_pickup_char["rarity"] == "SR":
-                    pool_sr = [char for char in pool_sr if char["id"] != current_pickup_char["id"]]
-                else: # SSR Pick Up
-                    if gacha_type == "FesGacha": # current_pickup_char["is_limited_type"] == 3
-                        pool_limited_fes = [char for char in pool_limited_fes if char["id"] != current_pickup_char["id"]]
-                    elif gacha_type == "LimitedGacha": # current_pickup_char["is_limited_type"] == 1
-                        pool_limited_normal = [char for char in pool_limited_normal if char["id"] != current_pickup_char["id"]]
-                    else: # PickupGacha (常駐UP) current_pickup_char["is_limited_type"] == 0
-                        pool_ssr_permanent = [char for char in pool_ssr_permanent if char["id"] != current_pickup_char["id"]]
-            
-            # --- 權重調整 ---
-            if gacha_type == "PickupGacha": # 常駐 UP
-                if current_pickup_char and current_pickup_char["rarity"] == "SSR":
-                    weights[2] -= 0.7  # 常駐SSR機率降低
-                    weights[3] += 0.7  # Pickup SSR 機率增加
-                # SR UP 暫不改變總SR機率，僅提高特定SR出率 (這部分需細化，目前簡化)
-            
-            elif gacha_type == "LimitedGacha": # 普通限定 UP
-                # 總三星率 3%
-                weights[3] = 0.7 # 當期 UP 的限定 SSR (current_pickup_char)
-                
-                # 「同期其他 UP 的限定 SSR」: 機率與常駐 SSR 一樣
-                # 需要找出所有當前活躍的 LimitedGacha 的 UP 角 (除了自己)
-                concurrent_limited_up_others_ids = []
-                for b_idx, b_info in enumerate(all_banners_for_server):
-                    if b_idx == choice: continue # 跳過自己
-                    if b_info["gachaType"] == "LimitedGacha" and b_info.get("rateups") and b_info["rateups"]:
-                        # 假設 rateup 的 is_limited_type 都是 1
-                        concurrent_limited_up_others_ids.append(b_info["rateups"][0]["id"])
-                
-                pool_concurrent_limited_others = [
-                    char for char in pool_limited_normal 
-                    if char["id"] in concurrent_limited_up_others_ids and (not current_pickup_char or char["id"] != current_pickup_char["id"])
-                ]
-
-                num_permanent_ssr = len(pool_ssr_permanent)
-                num_concurrent_limited_others = len(pool_concurrent_limited_others)
-                total_off_banner_pool_size = num_permanent_ssr + num_concurrent_limited_others
-                if total_off_banner_pool_size > 0:
-                    weights[2] = (num_permanent_ssr / total_off_banner_pool_size) * 2.3
-                    weights[4] = (num_concurrent_limited_others / total_off_banner_pool_size) * 2.3
-                    #print(f"調整後權重 - SSR_Perm: {weights[2]}, SSR_Lim_Norm_Other: {weights[4]} (總大小: {total_off_banner_pool_size})")
-                else: # 單 UP 角
-                    weights[2] = 2.3
-                    weights[4] = 0
-
-                
-            elif gacha_type == "FesGacha":
-                # 總三星率 6%
-                weights[5] = 0.7  # 當期 UP 的 Fes SSR (current_pickup_char)
-                # 其他 Fes 限定角均分 0.9%
-                num_other_fes = len(pool_limited_fes) # pool_limited_fes 此時已移除了UP角
-                if num_other_fes > 0:
-                    # weights[6] (SSR_Fes_Other) 總共佔 0.9%
-                    # 這裡的 weights[6] 應該是總機率，選擇時再均分
-                    weights[6] = 0.9 
-                else:
-                    weights[6] = 0
-                # 常駐三星均分剩餘 4.4% (6 - 0.7 - 0.9)
-                weights[2] = 4.4 
-
-        # 十連保底 SR
-        if last_pull:
-            r_weight = weights[0]
-            weights[0] = 0
-            weights[1] += r_weight # 簡化：R的機率全給SR
-
-        # 權重正規化 (確保總和為100)
-        active_weights = [w for w in weights if w > 0]
-        if active_weights:
-            current_total_weight = sum(active_weights)
-            if abs(current_total_weight - 100.0) > 1e-5 : # 允許微小誤差
-                if current_total_weight > 0: # 避免除以零
-                    factor = 100.0 / current_total_weight
-                    weights = [w * factor for w in weights]
-                else: # 理論上不應發生，所有權重為0
-                    weights[0] = 100.0 # 強制設為 R
-        else: # 所有權重都為0，強制設為 R
-             weights[0] = 100.0
-
-        # 抽卡
-        try:
-            valid_categories_weights = {cat: weights[i] for i, cat in enumerate(result_categories) if weights[i] > 0}
-            if not valid_categories_weights:
-                raise IndexError("No valid categories with positive weights.")
-
-            chosen_category = random.choices(
-                list(valid_categories_weights.keys()), 
-                list(valid_categories_weights.values())
-            )[0]
-            
-            pulled_char_info = {} # 存放抽出的角色原始資訊 (id, name)
-
-            if chosen_category == "R" and pool_r:
-                pulled_char_info = random.choice(pool_r)
-            elif chosen_category == "SR" and pool_sr:
-                pulled_char_info = random.choice(pool_sr)
-            elif chosen_category == "SSR_Perm" and pool_ssr_permanent:
-                pulled_char_info = random.choice(pool_ssr_permanent)
-            elif chosen_category == "SSR_PickUp" and current_pickup_char and current_pickup_char["rarity"] == "SSR" and gacha_type != "FesGacha" and gacha_type != "LimitedGacha": #常駐UP
-                pulled_char_info = current_pickup_char
-            elif chosen_category == "SSR_PickUp" and current_pickup_char and current_pickup_char["rarity"] == "SSR" and gacha_type == "LimitedGacha": #限定UP
-                pulled_char_info = current_pickup_char
-            elif chosen_category == "SSR_Lim_Norm_Other" and pool_concurrent_limited_others: # 同期其他限定UP
-                pulled_char_info = random.choice(pool_concurrent_limited_others)
-            elif chosen_category == "SSR_Fes_PickUp" and current_pickup_char and gacha_type == "FesGacha":
-                pulled_char_info = current_pickup_char
-            elif chosen_category == "SSR_Fes_Other" and pool_limited_fes:
-                pulled_char_info = random.choice(pool_limited_fes)
-            
-            # Fallback
-            if not pulled_char_info:
-                 if pool_r:
-                    pulled_char_info = random.choice(pool_r)
-                    chosen_category = "R" # 更新抽出的類別
-                 else:
-                    return {"id": 0, "name": "資料錯誤", "rarity": "Error", "server": server}
-
-            final_rarity_display = chosen_category # 用於顯示的稀有度類別
-            if "PickUp" in chosen_category or "PickUp" in final_rarity_display: # 讓圖片顯示 pickup
-                 final_rarity_display = "Pickup_" + ("SR" if pulled_char_info.get("rarity")=="SR" else "SSR") if "PickUp" in chosen_category else chosen_category
-            elif "Fes_PickUp" in chosen_category :
-                 final_rarity_display = "Pickup_Fes"
-            elif "Fes_Other" in chosen_category:
-                 final_rarity_display = "SSR" # Fes其他角色當作普通SSR顯示，但它是限定
-            elif "SSR" in chosen_category: # SSR_Perm or SSR_Lim_Norm_Other
-                 final_rarity_display = "SSR"
-
-
-            return {
-                "id": pulled_char_info["id"],
-                "name": pulled_char_info["name"],
-                "rarity": final_rarity_display, # 用於 create_single_image 判斷
-                "server": server
-            }
-        except IndexError as e:
-            print(f"抽卡錯誤 (IndexError): {e}, Weights: {weights}")
-            if pool_r: fallback = random.choice(pool_r); return {"id": fallback["id"], "name": fallback["name"], "rarity": "R", "server": server}
-            return {"id": 0, "name": "抽卡機大故障", "rarity": "Error", "server": server}
-        except Exception as e:
-            print(f"抽卡時發生未知錯誤: {e}")
-            if pool_r: fallback = random.choice(pool_r); return {"id": fallback["id"], "name": fallback["name"], "rarity": "R", "server": server}
-            return {"id": 0, "name": "系統維護中", "rarity": "Error", "server": server}
-        
-    def create_single_image(self, result: dict):
-        base_char_image = PIL.Image.new("RGBA", (160, 160), (0, 0, 0, 0))
-        try:
-            char_img_path = IMAGE_DIR / f"{result['id']}.png"
-            with PIL.Image.open(char_img_path) as char_pil_img:
-                char_pil_img = char_pil_img.convert("RGBA")
-                original_width, original_height = char_pil_img.size
-                new_width = int(original_width * 0.875)
-                new_height = int(original_height * 0.875)
-                char_pil_img = char_pil_img.resize((new_width, new_height), PIL.Image.Resampling.LANCZOS)
-                char_pil_img = PIL.ImageChops.multiply(char_pil_img, MASK)
-                rarity_display = result["rarity"] 
-                if rarity_display == "R":
-                    base_char_image.alpha_composite(BLUE_BORDER)
-                elif rarity_display == "SR":
-                    base_char_image.alpha_composite(YELLOW_BORDER)
-                elif rarity_display in ("SSR", "Pickup_SSR", "Pickup_Fes", "SSR_Lim_Norm_Other", "SSR_Fes_Other"):
-                    base_char_image.alpha_composite(PURPLE_BORDER)
-                base_char_image.alpha_composite(char_pil_img, (30, 20))
-        except FileNotFoundError:
-            print(f"警告：找不到學生圖片 {result['id']}.png for {result['name']}")
-        except Exception as e:
-            print(f"載入學生圖片 {result['id']}.png 時發生錯誤: {e}")
-
-        is_pickup = "Pickup" in rarity_display # 例如 "Pickup_SR", "Pickup_SSR", "Pickup_Fes"
-        # 這裡獲取BORDER的尺寸以計算居中位置
-        border_width, border_height = BORDER.size
-        border_x = (160 - border_width) // 2
-        border_y = (160 - border_height) // 2
-        if rarity_display == "R":
-            base_char_image.alpha_composite(BORDER, (border_x, border_y))
-            base_char_image.alpha_composite(STAR_1)
-        elif rarity_display == "SR" or rarity_display == "Pickup_SR":
-            base_char_image.alpha_composite(YELLOW_GLOW)
-            base_char_image.alpha_composite(BORDER, (border_x, border_y))
-            base_char_image.alpha_composite(STAR_2)
-            if is_pickup:
-                base_char_image.alpha_composite(PICKUP_ICON , (30, 10))
-        elif rarity_display in ("SSR", "Pickup_SSR", "Pickup_Fes", "SSR_Lim_Norm_Other", "SSR_Fes_Other"):
-            base_char_image.alpha_composite(PURPLE_GLOW)
-            base_char_image.alpha_composite(BORDER, (border_x, border_y))
-            base_char_image.alpha_composite(STAR_3)
-            if is_pickup:
-                base_char_image.alpha_composite(PICKUP_ICON , (30, 10))
-        elif rarity_display == "Error":
-            pass
-        return base_char_image
-        
+    async def publish_snapshot(self, snapshot: gacha_snapshot.GachaSnapshot):
+        """發布資料更新後的新快照：單一參照替換，不重新載入 cog，繪圖執行池與卡片快取都保留。"""
+        self.snapshot = snapshot
+        gacha_render.reset_atlas() # 本行程之後改用新的頭像圖集
+        await self.render_pool.refresh(snapshot.warm_card_keys())
+        print(f"轉蛋資料已替換為新的快照：{self.render_pool.stats()}")
 
-    def generate_gacha_image(self, results: list):
-        char_images = [self.create_single_image(res) for res in results]
-        image_count = len(char_images)
-        
-        final_bg_image = BACKGROUND.convert("RGBA").copy()
-        bg_width, bg_height = final_bg_image.size
-
-        if image_count > 1:
-            cols = 5
-            rows = math.ceil(image_count / cols)
-            img_width, img_height = 120, 140
-            padding = 10
-            grid_width = cols * img_width + padding * 2
-            grid_height = rows * img_height + padding * 2
-            card_grid_image = PIL.Image.new("RGBA", (grid_width, grid_height), (0, 0, 0, 0))
-
-            for i, img in enumerate(char_images):
-                x_on_grid = padding + (i % cols * img_width) + (img_width - 160) // 2
-                y_on_grid = padding + (i // cols * img_height) + (img_height - 160) // 2
-                card_grid_image.alpha_composite(img, (x_on_grid, y_on_grid))
-            
-            grid_x_on_bg = (bg_width - grid_width) // 2
-            grid_y_on_bg = (bg_height - grid_height) // 2
-            final_bg_image.alpha_composite(card_grid_image, (grid_x_on_bg, grid_y_on_bg))
-
-        elif image_count == 1:
-            single_card_image = char_images[0]
-            card_width, card_height = single_card_image.size
-            card_x_on_bg = (bg_width - card_width) // 2
-            card_y_on_bg = (bg_height - card_height) // 2
-            final_bg_image.alpha_composite(single_card_image, (card_x_on_bg, card_y_on_bg))
-            
-        final_bg_image.save("result.png")
+    def pull_logic(self, server: str, choice: int, last_pull: bool):
+        """在目前的快照上抽一次卡，回傳 (學生索引, 稀有度代碼)。"""
+        return self.snapshot.pull_logic(server, choice, last_pull)
+
+    def pull_many(self, server: str, choice: int, n: int, rng=None):
+        """在目前的快照上一次抽 n 次，回傳 (類別, 學生索引) 兩個 NumPy 陣列。"""
+        return self.snapshot.pull_many(server, choice, n, rng)
+
+    def create_single_image(self, result: tuple):
+        return gacha_render.get_card(self.card_key(result))
+
+    async def cog_load(self):
+        gacha_render.reset_atlas()
+        # 繪圖交給獨立的執行池，每個工作者啟動時會預熱卡片快取 (各自 mmap 同一份圖集)
+        self.render_pool = render_pool.RenderPool.from_config(warm_keys=self.snapshot.warm_card_keys())
+        await self.render_pool.start()
+        print(f"繪圖執行池已啟動：{self.render_pool.stats()}")
+        # 抽卡記錄先放進佇列，由背景工作批次寫入資料庫
+        self.pull_recorder = pull_recorder.PullRecorder()
+        self.pull_recorder.start()
+
+    async def cog_unload(self):
+        self.render_pool.shutdown()
+        await self.pull_recorder.close() # 重新載入或關閉 bot 前寫完佇列中的記錄
+
+    def find_student_id(self, text: str):
+        """由自動完成的學生 id 或任一語系的名稱找出學生 id，找不到時回傳 None。"""
+        text = text.strip()
+        if text.isdigit() and int(text) in self.catalog.index:
+            return int(text)
+        for locale in ("tw", "jp", "en"):
+            for idx, name in enumerate(self.catalog.names[locale]):
+                if name and name.lower() == text.lower():
+                    return self.catalog.student_id(idx)
+        return None
+
+    def card_key(self, result: tuple) -> tuple:
+        return self.snapshot.card_key(result)
+
+    def generate_gacha_image(self, results: list, encoder: str = gacha_render.DEFAULT_ENCODER) -> io.BytesIO:
+        """合成抽卡結果圖，直接在記憶體中以指定的模式編碼並回傳。"""
+        return io.BytesIO(gacha_render.render_results([self.card_key(res) for res in results], encoder))
+
+    async def render_gacha_image(self, snapshot: gacha_snapshot.GachaSnapshot, results: list) -> io.BytesIO:
+        """在繪圖執行池中合成結果圖；results 必須是在 snapshot 上抽出的。佇列滿時丟出 RenderQueueFull。"""
+        return io.BytesIO(await self.render_pool.render([snapshot.card_key(res) for res in results]))
 
     @app_commands.command(name="gacha", description="模擬抽卡")
     @app_commands.describe(mode="選擇一次招募的數量")
@@ -324,11 +94,50 @@ class Gacha(commands.Cog):
         view = GachaView(cog=self, mode=mode.value)
         await interaction.response.send_message("請選擇您要進行招募的卡池：", view=view, ephemeral=True)
 
+    @app_commands.command(name="gacha-sim", description="模擬大量抽卡，統計抽到 Pick Up 需要的抽數")
+    @app_commands.describe(pulls="模擬的總抽數 (10000 ~ 1000000)")
+    async def gacha_sim(self, interaction: discord.Interaction, pulls: app_commands.Range[int, SIM_MIN_PULLS, SIM_MAX_PULLS] = 100000):
+        view = GachaSimView(cog=self, pulls=pulls)
+        await interaction.response.send_message("請選擇要模擬的卡池：", view=view, ephemeral=True)
+
+    @app_commands.command(name="gacha-odds", description="計算卡池的精確機率")
+    @app_commands.describe(pulls="計算幾抽內抽到 Pick Up 的機率", ssr_count="計算十連至少抽到幾張 SSR 的機率")
+    async def gacha_odds(self, interaction: discord.Interaction, pulls: app_commands.Range[int, 1, 10000] = 200, ssr_count: app_commands.Range[int, 1, 10] = 1):
+        view = GachaOddsView(cog=self, pulls=pulls, ssr_count=ssr_count)
+        await interaction.response.send_message("請選擇要計算機率的卡池：", view=view, ephemeral=True)
+
     # --- 修改後的 gacha-history 指令 ---
     @app_commands.command(name="gacha-history", description="查看您在特定卡池的招募記錄")
-    async def gacha_history(self, interaction: discord.Interaction):
-        view = GachaHistoryView(cog=self)
+    @app_commands.describe(rarity="只顯示特定稀有度 (預設為 SSR)", character="只顯示特定角色")
+    @app_commands.choices(rarity=[
+        app_commands.Choice(name="SSR", value="SSR"),
+        app_commands.Choice(name="SR", value="SR"),
+        app_commands.Choice(name="R", value="R"),
+        app_commands.Choice(name="全部", value="ALL"),
+    ])
+    async def gacha_history(self, interaction: discord.Interaction, rarity: app_commands.Choice[str] = None, character: str = None):
+        char_id = None
+        if character:
+            char_id = self.find_student_id(character)
+            if char_id is None:
+                await interaction.response.send_message(f"找不到角色「{character}」。", ephemeral=True)
+                return
+        view = GachaHistoryView(cog=self, rarity=rarity.value if rarity else "SSR", char_id=char_id)
         await interaction.response.send_message("請選擇您要查詢記錄的卡池：", view=view)
+
+    @gacha_history.autocomplete("character")
+    async def gacha_history_character_autocomplete(self, interaction: discord.Interaction, current: str):
+        current = current.strip().lower()
+        choices = []
+        for idx in range(len(self.catalog)):
+            names = [self.catalog.names[locale][idx] or "" for locale in ("tw", "jp", "en")]
+            if current and not any(current in name.lower() for name in names):
+                continue
+            label = " / ".join(dict.fromkeys(name for name in names[:2] if name))
+            choices.append(app_commands.Choice(name=label[:100] or str(self.catalog.student_id(idx)), value=str(self.catalog.student_id(idx))))
+            if len(choices) == 25: # Discord 最多顯示 25 個選項
+                break
+        return choices
     # --- 指令修改結束 ---
 
 # --- 用於抽卡的下拉選單和按鈕 ---
@@ -338,21 +147,13 @@ class GachaDropdown(discord.ui.Select):
         self.mode = mode
         
         options = []
-        # 國際服卡池
-        for i, banner in enumerate(self.cog.banners_gl):
-            banner_name = self._get_banner_display_name(banner)
-            options.append(discord.SelectOption(
-                label=f"國際服：{banner_name}",
-                value=f"global_{i}",
-                description=banner["gachaType"]
-            ))
-
-        # 日服卡池
-        for i, banner in enumerate(self.cog.banners_jp):
-            banner_name = self._get_banner_display_name(banner)
+        # 選項的值為卡池的登錄編號 (同一個卡池只列一次)
+        snapshot = self.cog.snapshot
+        for banner_id, (server, choice) in snapshot.banner_slots.items():
+            banner = snapshot.get_banner(server, choice)
             options.append(discord.SelectOption(
-                label=f"日服：{banner_name}",
-                value=f"japan_{i}",
+                label=f"{'國際服' if server == 'global' else '日服'}：{self._get_banner_display_name(banner)}",
+                value=str(banner_id),
                 description=banner["gachaType"]
             ))
 
@@ -361,6 +162,19 @@ class GachaDropdown(discord.ui.Select):
 
         super().__init__(placeholder="選擇卡池", options=options)
 
+    async def _resolve_selection(self, interaction: discord.Interaction):
+        """取得 (快照, (伺服器, 卡池索引))；沒有卡池或選到的卡池已經結束時先回覆使用者，回傳 None。"""
+        if self.values[0] == "no_banner":
+            await interaction.response.send_message("目前沒有可用的卡池資訊。", ephemeral=True)
+            return None
+
+        snapshot = self.cog.snapshot # 這次互動從頭到尾使用同一份快照，資料更新不會影響進行中的抽卡
+        slot = snapshot.banner_slots.get(int(self.values[0]))
+        if slot is None:
+            await interaction.response.send_message("這個卡池已經結束了，請重新輸入指令選擇。", ephemeral=True)
+            return None
+        return snapshot, slot
+
     def _get_banner_display_name(self, banner):
         if banner["gachaType"] == "NormalGacha":
             return "常駐招募"
@@ -371,28 +185,36 @@ class GachaDropdown(discord.ui.Select):
             return "特殊招募"
 
     async def callback(self, interaction: discord.Interaction):
-        if self.values[0] == "no_banner":
-            await interaction.response.send_message("目前沒有可用的卡池資訊。", ephemeral=True)
+        selection = await self._resolve_selection(interaction)
+        if selection is None:
             return
-
+        snapshot, slot = selection
         await interaction.response.defer()
         
-        server_str, choice_str = self.values[0].split("_")
-        choice = int(choice_str)
+        server_str, choice = slot
+        banner = snapshot.get_banner(server_str, choice)
 
         if self.mode == "single":
-            results = [self.cog.pull_logic(server_str, choice, False)]
+            results = [snapshot.pull_logic(server_str, choice, False)]
         else:
-            results = [self.cog.pull_logic(server_str, choice, i == 9) for i in range(10)]
+            results = [snapshot.pull_logic(server_str, choice, i == 9) for i in range(10)]
         
-        self.cog.generate_gacha_image(results)
+        try:
+            image_buffer = await self.cog.render_gacha_image(snapshot, results)
+        except render_pool.RenderQueueFull:
+            await interaction.followup.send("目前招募的老師太多了，請稍後再試一次！", ephemeral=True)
+            return
+        except render_pool.RenderFailed as e:
+            print(f"繪製抽卡結果圖時發生錯誤: {e}")
+            await interaction.followup.send("繪製招募結果時發生錯誤，請再試一次！", ephemeral=True)
+            return
         
-        banner_display_name = self._get_banner_display_name(
-            (self.cog.banners_gl if server_str == "global" else self.cog.banners_jp)[choice]
-        )
+        banner_display_name = self._get_banner_display_name(banner)
         
         try:
-            gacha_db.record_pulls(interaction.user.id, server_str, banner_display_name, results)
+            self.cog.pull_recorder.record(
+                interaction.user.id, server_str, snapshot.history_epochs[server_str], banner["id"], results, snapshot.catalog
+            )
         except Exception as e:
             print(f"寫入抽卡記錄時發生錯誤: {e}")
             
@@ -403,34 +225,47 @@ class GachaDropdown(discord.ui.Select):
         )
         
         try:
-            file = discord.File("result.png", filename="result.png")
-            embed.set_image(url="attachment://result.png")
-            view = GachaView(cog=self.cog, mode=self.mode, server=server_str, choice=choice, is_button=True)
+            filename = f"gacha_{interaction.id}.{self.cog.render_pool.extension}" # 每次互動使用不同的附件名稱
+            file = discord.File(image_buffer, filename=filename)
+            embed.set_image(url=f"attachment://{filename}")
+            view = GachaView(cog=self.cog, mode=self.mode, banner_id=banner["id"], is_button=True)
             await interaction.followup.send(content=interaction.user.mention, file=file, embed=embed, view=view)
         except Exception as e:
             print(f"傳送抽卡結果時發生錯誤: {e}")
             await interaction.followup.send(content=f"{interaction.user.mention} 抱歉，處理您的請求時發生了未預期的錯誤。", embed=embed)
 
 class GachaButton(discord.ui.Button):
-    def __init__(self, cog: Gacha, mode: str, server: str, choice: int):
+    def __init__(self, cog: Gacha, mode: str, banner_id: int):
         super().__init__(label="再抽一次！", style=discord.ButtonStyle.primary)
         self.cog = cog
         self.mode = mode
-        self.server = server
-        self.choice = choice
+        self.banner_id = banner_id
 
     async def callback(self, interaction: discord.Interaction):
+        snapshot = self.cog.snapshot
+        slot = snapshot.banner_slots.get(self.banner_id)
+        if slot is None:
+            await interaction.response.send_message("這個卡池已經結束了，請重新輸入指令選擇。", ephemeral=True)
+            return
         await interaction.response.defer()
+        server, choice = slot
         
         if self.mode == "single":
-            results = [self.cog.pull_logic(self.server, self.choice, False)]
+            results = [snapshot.pull_logic(server, choice, False)]
         else:
-            results = [self.cog.pull_logic(self.server, self.choice, i == 9) for i in range(10)]
+            results = [snapshot.pull_logic(server, choice, i == 9) for i in range(10)]
             
-        self.cog.generate_gacha_image(results)
+        try:
+            image_buffer = await self.cog.render_gacha_image(snapshot, results)
+        except render_pool.RenderQueueFull:
+            await interaction.followup.send("目前招募的老師太多了，請稍後再試一次！", ephemeral=True)
+            return
+        except render_pool.RenderFailed as e:
+            print(f"繪製抽卡結果圖時發生錯誤: {e}")
+            await interaction.followup.send("繪製招募結果時發生錯誤，請再試一次！", ephemeral=True)
+            return
 
-        current_banner_list = self.cog.banners_gl if self.server == "global" else self.cog.banners_jp
-        banner = current_banner_list[self.choice]
+        banner = snapshot.get_banner(server, choice)
         
         banner_display_name = "常駐招募"
         if banner["gachaType"] != "NormalGacha" and banner["rateups"]:
@@ -438,38 +273,152 @@ class GachaButton(discord.ui.Button):
             banner_display_name = " & ".join(pickup_names[:2])
 
         try:
-            gacha_db.record_pulls(interaction.user.id, self.server, banner_display_name, results)
+            self.cog.pull_recorder.record(
+                interaction.user.id, server, snapshot.history_epochs[server], self.banner_id, results, snapshot.catalog
+            )
         except Exception as e:
             print(f"寫入抽卡記錄時發生錯誤: {e}")
 
         embed = discord.Embed(
             title=f"老師，這是您的招募結果！",
-            description=f"**伺服器：** {'國際服' if self.server == 'global' else '日服'}\n**卡池：** {banner_display_name}",
+            description=f"**伺服器：** {'國際服' if server == 'global' else '日服'}\n**卡池：** {banner_display_name}",
             color=discord.Color.blue()
         )
         
         try:
-            file = discord.File("result.png", filename="result.png")
-            embed.set_image(url="attachment://result.png")
-            view = GachaView(cog=self.cog, mode=self.mode, server=self.server, choice=self.choice, is_button=True)
+            filename = f"gacha_{interaction.id}.{self.cog.render_pool.extension}" # 每次互動使用不同的附件名稱
+            file = discord.File(image_buffer, filename=filename)
+            embed.set_image(url=f"attachment://{filename}")
+            view = GachaView(cog=self.cog, mode=self.mode, banner_id=self.banner_id, is_button=True)
             await interaction.followup.send(content=interaction.user.mention, file=file, embed=embed, view=view)
         except Exception as e:
             print(f"傳送抽卡結果時發生錯誤: {e}")
             await interaction.followup.send(content=f"{interaction.user.mention} 抱歉，處理您的請求時發生了未預期的錯誤。", embed=embed)
 
 class GachaView(discord.ui.View):
-    def __init__(self, cog: Gacha, mode: str, server: str = "global", choice: int = -1, is_button: bool = False):
+    def __init__(self, cog: Gacha, mode: str, banner_id: int = None, is_button: bool = False):
         super().__init__(timeout=None)
         self.cog = cog
         if is_button:
-            self.add_item(GachaButton(self.cog, mode, server, choice))
+            self.add_item(GachaButton(self.cog, mode, banner_id))
         else:
             self.add_item(GachaDropdown(self.cog, mode))
 
 
+class GachaSimDropdown(GachaDropdown):
+    def __init__(self, cog: Gacha, pulls: int):
+        super().__init__(cog, mode="sim")
+        self.pulls = pulls
+
+    async def callback(self, interaction: discord.Interaction):
+        selection = await self._resolve_selection(interaction)
+        if selection is None:
+            return
+        snapshot, slot = selection
+
+        await interaction.response.edit_message(content=f"正在模擬 {self.pulls:,} 抽，請稍候...", view=None)
+
+        server_str, choice = slot
+        compiled = snapshot.get_compiled_banner(server_str, choice)
+        banner_display_name = self._get_banner_display_name(snapshot.get_banner(server_str, choice))
+
+        # 大量模擬交給背景執行緒，避免阻塞事件迴圈
+        loop = asyncio.get_running_loop()
+        stats = await loop.run_in_executor(None, gacha_engine.simulate, compiled, self.pulls)
+
+        target_name = "Pick Up" if stats["target"] == "pickup" else "SSR"
+        embed = discord.Embed(
+            title="招募模擬結果",
+            description=(
+                f"**伺服器：** {'國際服' if server_str == 'global' else '日服'}\n"
+                f"**卡池：** {banner_display_name}\n"
+                f"**模擬抽數：** {stats['pulls']:,}"
+            ),
+            color=discord.Color.green()
+        )
+        embed.add_field(
+            name="出率",
+            value=f"**SSR**: {stats['ssr_rate']:.3f}%\n**Pick Up**: {stats['pickup_rate']:.3f}%",
+            inline=False
+        )
+        if stats["hits"]:
+            percentile_text = "\n".join(f"**P{p}**: {v} 抽" for p, v in stats["percentiles"].items())
+            embed.add_field(
+                name=f"抽到 {target_name} 需要的抽數",
+                value=(
+                    f"共抽到 {stats['hits']:,} 次，平均 {stats['mean']:.1f} 抽\n"
+                    f"{percentile_text}\n"
+                    f"200 抽內抽到的機率: {stats['within_200']:.2f}%"
+                ),
+                inline=False
+            )
+        else:
+            embed.add_field(name=f"抽到 {target_name} 需要的抽數", value=f"模擬中一次都沒有抽到 {target_name}", inline=False)
+
+        await interaction.edit_original_response(content=None, embed=embed)
+
+class GachaSimView(discord.ui.View):
+    def __init__(self, cog: Gacha, pulls: int):
+        super().__init__(timeout=300)
+        self.add_item(GachaSimDropdown(cog, pulls))
+
+
+class GachaOddsDropdown(GachaDropdown):
+    def __init__(self, cog: Gacha, pulls: int, ssr_count: int):
+        super().__init__(cog, mode="odds")
+        self.pulls = pulls
+        self.ssr_count = ssr_count
+
+    async def callback(self, interaction: discord.Interaction):
+        selection = await self._resolve_selection(interaction)
+        if selection is None:
+            return
+        snapshot, slot = selection
+
+        server_str, choice = slot
+        odds = snapshot.get_banner_odds(server_str, choice)
+        banner_display_name = self._get_banner_display_name(snapshot.get_banner(server_str, choice))
+
+        embed = discord.Embed(
+            title="卡池機率",
+            description=f"**伺服器：** {'國際服' if server_str == 'global' else '日服'}\n**卡池：** {banner_display_name}",
+            color=discord.Color.purple()
+        )
+        embed.add_field(
+            name="單抽機率",
+            value=f"**SSR**: {odds.ssr_rate * 100:.3f}%\n**Pick Up**: {odds.pickup_rate * 100:.3f}%",
+            inline=False
+        )
+        if odds.pickup_rate > 0:
+            pickup_text = (
+                f"**{self.pulls} 抽內至少一次**: {odds.pickup_within(self.pulls) * 100:.2f}%\n"
+                f"**期望抽數**: {odds.expected_pulls_to_pickup():.1f} 抽"
+            )
+        else:
+            pickup_text = "此卡池沒有 Pick Up 角色"
+        embed.add_field(name="Pick Up", value=pickup_text, inline=False)
+        embed.add_field(
+            name="SSR",
+            value=(
+                f"**{self.pulls} 抽內至少一張**: {odds.ssr_within(self.pulls) * 100:.2f}%\n"
+                f"**期望抽數**: {odds.expected_pulls_to_ssr():.1f} 抽\n"
+                f"**十連至少 {self.ssr_count} 張**: {odds.ten_pull_at_least_ssr(self.ssr_count) * 100:.4f}%"
+            ),
+            inline=False
+        )
+        await interaction.response.edit_message(content=None, embed=embed, view=None)
+
+class GachaOddsView(discord.ui.View):
+    def __init__(self, cog: Gacha, pulls: int, ssr_count: int):
+        super().__init__(timeout=300)
+        self.add_item(GachaOddsDropdown(cog, pulls, ssr_count))
+
+
 class GachaHistoryDropdown(discord.ui.Select):
-    def __init__(self, cog: Gacha):
+    def __init__(self, cog: Gacha, rarity: str, char_id: int):
         self.cog = cog
+        self.rarity = rarity
+        self.char_id = char_id
         
         options = []
         # 輔助函式，避免重複程式碼
@@ -482,21 +431,15 @@ class GachaHistoryDropdown(discord.ui.Select):
             else:
                 return "特殊招募"
 
-        # 國際服卡池
-        for banner in self.cog.banners_gl:
-            banner_name = _get_banner_display_name(banner)
+        # 選項的值為卡池的登錄編號：不同伺服器的同名卡池各自分開
+        self.banner_names = {}
+        snapshot = self.cog.snapshot
+        for banner_id, (server, choice) in snapshot.banner_slots.items():
+            banner = snapshot.get_banner(server, choice)
+            self.banner_names[banner_id] = banner_name = _get_banner_display_name(banner)
             options.append(discord.SelectOption(
-                label=f"國際服：{banner_name}",
-                value=f"global_{banner_name}",
-                description=banner["gachaType"]
-            ))
-
-        # 日服卡池
-        for banner in self.cog.banners_jp:
-            banner_name = _get_banner_display_name(banner)
-            options.append(discord.SelectOption(
-                label=f"日服：{banner_name}",
-                value=f"japan_{banner_name}",
+                label=f"{'國際服' if server == 'global' else '日服'}：{banner_name}",
+                value=str(banner_id),
                 description=banner["gachaType"]
             ))
 
@@ -510,62 +453,186 @@ class GachaHistoryDropdown(discord.ui.Select):
             await interaction.response.edit_message(content="目前沒有可用的卡池資訊可供查詢。", view=None)
             return
 
-        # 使用 split('_', 1) 確保只分割一次，避免卡池名稱中包含底線時出錯
-        server_str, banner_name = self.values[0].split('_', 1)
-        
-        user_history = gacha_db.get_user_history_for_banner(interaction.user.id, banner_name)
+        banner_id = int(self.values[0])
+        snapshot = self.cog.snapshot
+        slot = snapshot.banner_slots.get(banner_id)
+        if slot is None:
+            await interaction.response.edit_message(content="這個卡池已經結束了，請重新輸入指令查詢。", view=None)
+            return
+        server_str = slot[0]
+        banner_name = self.banner_names[banner_id]
 
-        if not user_history:
-            await interaction.response.edit_message(
+        await interaction.response.defer() # 寫入佇列可能要等背景工作的那一批，先回應避免互動逾時
+        await self.cog.pull_recorder.flush() # 先寫入佇列中的記錄 (含背景工作正在寫的那批)，查詢結果才會包含剛剛的抽卡
+        epoch = snapshot.history_epochs[server_str]
+        stats = gacha_db.get_user_banner_stats(interaction.user.id, server_str, epoch, banner_id)
+
+        if not stats:
+            await interaction.edit_original_response(
                 content=f"您在 **{banner_name}** 卡池還沒有任何招募記錄喔！",
                 view=None
             )
             return
 
-        total_pulls = len(user_history)
-        ssr_count = sum(1 for pull in user_history if pull['rarity'] == 'SSR')
-        sr_count = sum(1 for pull in user_history if pull['rarity'] == 'SR')
-        r_count = sum(1 for pull in user_history if pull['rarity'] == 'R')
+        # 最近抽到的 SSR 只取名稱與時間，最多 SSR_HISTORY_LIMIT 筆；翻頁時不會變動，只查一次
+        ssr_history = gacha_db.get_user_ssr_history(interaction.user.id, server_str, epoch, banner_id) if stats['ssr'] else []
+        browser = GachaHistoryBrowser(
+            cog=self.cog, user=interaction.user, server=server_str, epoch=epoch, banner_id=banner_id, banner_name=banner_name,
+            stats=stats, ssr_history=ssr_history, rarity=self.rarity, char_id=self.char_id
+        )
+        browser.load_first_page()
+        # 更新原始訊息，顯示 Embed 與翻頁按鈕
+        await interaction.edit_original_response(content=None, embed=browser.build_embed(), view=browser)
+
+HISTORY_RARITY_ICONS = {"SSR": "✨", "SR": "🔸", "R": "▫️"}
+HISTORY_NAME_MAX = 40 # 一頁 10 行，名稱截短後不會超過 embed 欄位的 1024 字上限
+EMBED_FIELD_MAX = 1024
+
+class GachaHistoryBrowser(discord.ui.View):
+    """以 (pull_time, id) keyset 分頁瀏覽抽卡記錄；每次翻頁只查詢一頁。"""
+    def __init__(self, cog: Gacha, user: discord.abc.User, server: str, epoch: int, banner_id: int, banner_name: str, stats, ssr_history: list, rarity: str, char_id: int):
+        super().__init__(timeout=300)
+        self.cog = cog
+        self.user = user
+        self.server = server
+        self.epoch = epoch
+        self.banner_id = banner_id
+        self.banner_name = banner_name
+        self.stats = stats
+        self.ssr_history = ssr_history
+        self.rarity = rarity
+        self.char_id = char_id
+        self.rows = []
+        self.page_number = 0
+        self.has_prev = False
+        self.has_next = False
+        self.add_item(GachaHistoryRarityFilter(self))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user.id:
+            await interaction.response.send_message("只有查詢記錄的老師可以翻頁喔！", ephemeral=True)
+            return False
+        return True
+
+    def _fetch(self, before=None, after=None) -> list:
+        # 多取一筆，用來判斷該方向是否還有下一頁
+        return gacha_db.get_user_history_page(
+            self.user.id, self.server, self.epoch, self.banner_id,
+            rarity=None if self.rarity == "ALL" else self.rarity, char_id=self.char_id,
+            before=before, after=after, limit=gacha_db.HISTORY_PAGE_SIZE + 1
+        )
+
+    def load_first_page(self):
+        rows = self._fetch()
+        self.has_next = len(rows) > gacha_db.HISTORY_PAGE_SIZE
+        self.rows = rows[:gacha_db.HISTORY_PAGE_SIZE]
+        self.has_prev = False
+        self.page_number = 0
+        self._update_buttons()
+
+    def load_next_page(self):
+        last = self.rows[-1]
+        rows = self._fetch(before=(last['pull_time'], last['id']))
+        if not rows:
+            return
+        self.has_next = len(rows) > gacha_db.HISTORY_PAGE_SIZE
+        self.rows = rows[:gacha_db.HISTORY_PAGE_SIZE]
+        self.has_prev = True
+        self.page_number += 1
+        self._update_buttons()
+
+    def load_prev_page(self):
+        first = self.rows[0]
+        rows = self._fetch(after=(first['pull_time'], first['id']))
+        if not rows:
+            return
+        self.has_prev = len(rows) > gacha_db.HISTORY_PAGE_SIZE
+        self.rows = rows[-gacha_db.HISTORY_PAGE_SIZE:]
+        self.has_next = True
+        self.page_number = max(self.page_number - 1, 0)
+        self._update_buttons()
+
+    def _update_buttons(self):
+        self.prev_page.disabled = not self.has_prev
+        self.next_page.disabled = not self.has_next
+
+    def build_embed(self) -> discord.Embed:
+        total_pulls = self.stats['total']
+        ssr_count = self.stats['ssr']
         ssr_rate = (ssr_count / total_pulls) * 100 if total_pulls > 0 else 0
 
         embed = discord.Embed(
-            title=f"【{interaction.user.display_name}】的招募記錄",
-            description=f"**卡池:** {banner_name}\n此記錄會在卡池更新後自動重置。",
+            title=f"【{self.user.display_name}】的招募記錄",
+            description=f"**卡池:** {self.banner_name}\n此記錄會在卡池更新後自動重置。",
             color=discord.Color.gold()
         )
-        embed.set_thumbnail(url=interaction.user.display_avatar.url)
+        embed.set_thumbnail(url=self.user.display_avatar.url)
         
         stats_text = (
             f"**總招募數**: {total_pulls} 次\n"
             f"**SSR**: {ssr_count} 張 ({ssr_rate:.2f}%)\n"
-            f"**SR**: {sr_count} 張\n"
-            f"**R**: {r_count} 張"
+            f"**SR**: {self.stats['sr']} 張\n"
+            f"**R**: {self.stats['r']} 張"
         )
         embed.add_field(name="統計數據", value=stats_text, inline=False)
 
-        # 篩選出所有 SSR 記錄
-        ssr_pulls = [pull for pull in user_history if pull['rarity'] == 'SSR']
-        
-        if ssr_pulls:
+        if self.ssr_history:
+            ssr_lines = []
+            for char_name, pull_time in self.ssr_history:
+                line = f"✨ {char_name[:HISTORY_NAME_MAX]} ({gacha_db.pull_time_to_datetime(pull_time).strftime('%m-%d')})"
+                if sum(len(l) + 1 for l in ssr_lines) + len(line) > EMBED_FIELD_MAX:
+                    break
+                ssr_lines.append(line)
+            embed.add_field(name=f"最近抽到的 SSR (最多 {gacha_db.SSR_HISTORY_LIMIT} 張)", value="\n".join(ssr_lines), inline=False)
+
+        filters = ["全部" if self.rarity == "ALL" else self.rarity]
+        if self.char_id is not None:
+            student_idx = self.cog.catalog.index.get(self.char_id)
+            filters.append(self.cog.catalog.name(student_idx, self.server) if student_idx is not None else str(self.char_id))
+        field_name = f"招募記錄 ({' / '.join(filters)}，第 {self.page_number + 1} 頁)"
+
+        if self.rows:
             history_text_lines = []
-            for pull in ssr_pulls:
-                # 取得時間並格式化為 YYYY-MM-DD HH:MM
-                pull_time_dt = datetime.datetime.fromisoformat(pull['pull_time'])
-                formatted_time = pull_time_dt.strftime('%m-%d %H:%M')
-                history_text_lines.append(f"✨ `[{formatted_time}]` **{pull['char_name']}**")
-            
-            history_text = "\n".join(history_text_lines)
-            embed.add_field(name="SSR 招募記錄", value=history_text, inline=False)
+            for pull in self.rows:
+                # 取得時間並格式化為 MM-DD HH:MM
+                formatted_time = gacha_db.pull_time_to_datetime(pull['pull_time']).strftime('%m-%d %H:%M')
+                icon = HISTORY_RARITY_ICONS.get(gacha_db.RARITY_NAMES.get(pull['rarity']), "▫️")
+                history_text_lines.append(f"{icon} `[{formatted_time}]` **{pull['char_name'][:HISTORY_NAME_MAX]}**")
+            embed.add_field(name=field_name, value="\n".join(history_text_lines), inline=False)
         else:
-            embed.add_field(name="SSR 招募記錄", value="此卡池尚未招募到 SSR 角色", inline=False)
+            embed.add_field(name=field_name, value="沒有符合條件的招募記錄", inline=False)
+        return embed
+
+    @discord.ui.button(label="◀ 上一頁", style=discord.ButtonStyle.secondary, row=1)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.load_prev_page()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+    @discord.ui.button(label="下一頁 ▶", style=discord.ButtonStyle.secondary, row=1)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.load_next_page()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+class GachaHistoryRarityFilter(discord.ui.Select):
+    def __init__(self, browser: GachaHistoryBrowser):
+        self.browser = browser
+        options = [
+            discord.SelectOption(label=label, value=value, default=value == browser.rarity)
+            for label, value in (("只看 SSR", "SSR"), ("只看 SR", "SR"), ("只看 R", "R"), ("全部", "ALL"))
+        ]
+        super().__init__(placeholder="篩選稀有度", options=options, row=0)
 
-        # 更新原始訊息，顯示 Embed 並移除 View
-        await interaction.response.edit_message(content=None, embed=embed, view=None)
+    async def callback(self, interaction: discord.Interaction):
+        self.browser.rarity = self.values[0]
+        for option in self.options:
+            option.default = option.value == self.browser.rarity
+        self.browser.load_first_page()
+        await interaction.response.edit_message(embed=self.browser.build_embed(), view=self.browser)
 
 class GachaHistoryView(discord.ui.View):
-    def __init__(self, cog: Gacha):
+    def __init__(self, cog: Gacha, rarity: str = "SSR", char_id: int = None):
         super().__init__(timeout=300) 
-        self.add_item(GachaHistoryDropdown(cog))
+        self.add_item(GachaHistoryDropdown(cog, rarity, char_id))
 
 
 
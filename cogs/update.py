@@ -3,10 +3,11 @@ import datetime
 from discord.ext import commands, tasks
 import pytz
 
-from .utils import get_gacha_data
+from .utils import gacha_db, gacha_snapshot, get_gacha_data
 
 TAIPEI_TIMEZONE = pytz.timezone('Asia/Taipei')
 UTC_PLUS_9 = pytz.timezone('Etc/GMT-9')
+PRUNE_BATCH_PAUSE = 0.05 # 秒；每批刪除之間讓出寫入連線，抽卡記錄的寫入不會被長時間擋住
 
 class UpdateTasks(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -29,32 +30,61 @@ class UpdateTasks(commands.Cog):
         log_time = datetime.datetime.now(TAIPEI_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S')
         print(f"[{log_time}] 開始執行排程資料更新...")
         
-        loop = asyncio.get_running_loop()
         try:
-            await loop.run_in_executor(None, get_gacha_data.update)
+            updated = await get_gacha_data.update_async() # 下載在事件迴圈上進行，不佔用執行緒
             
             log_time_after_update = datetime.datetime.now(TAIPEI_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S')
-            print(f"[{log_time_after_update}] 資料更新完成，正在重新載入相關 Cogs...")
-
-            cogs_to_reload = ['cogs.gacha'] 
-            for cog_name in cogs_to_reload:
-                try:
-                    # 如果 gacha Cog 之前因故未載入，reload 會失敗，嘗試 load
-                    try:
-                        await self.bot.reload_extension(cog_name)
-                        print(f"成功重新載入 {cog_name}")
-                    except commands.ExtensionNotLoaded:
-                        print(f"{cog_name} 尚未載入，嘗試直接載入...")
-                        await self.bot.load_extension(cog_name)
-                        print(f"成功載入 {cog_name}")
-                except Exception as e:
-                    print(f"處理 Cog {cog_name} 失敗: {e}")
+            if updated:
+                print(f"[{log_time_after_update}] 資料更新完成，正在建立新的轉蛋資料快照...")
+                await self.publish_gacha_snapshot()
+            else:
+                print(f"[{log_time_after_update}] 資料沒有變動，繼續使用目前的轉蛋資料。")
+                if self.bot.get_cog("Gacha") is None:
+                    await self.publish_gacha_snapshot() # 之前未載入的 gacha Cog 仍要載入
         except Exception as e:
             print(f"執行更新任務時發生嚴重錯誤: {e}")
 
+        await self.prune_old_history()
+
         log_time_end = datetime.datetime.now(TAIPEI_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S')
         print(f"[{log_time_end}] 排程資料更新結束。")
 
+    async def publish_gacha_snapshot(self):
+        """在背景執行緒讀取並編譯新資料，再交給 gacha Cog 替換 (不重新載入 Cog)。"""
+        gacha_cog = self.bot.get_cog("Gacha")
+        if gacha_cog is None:
+            # gacha Cog 之前因故未載入時才直接載入，載入時會自行讀取新資料
+            print("cogs.gacha 尚未載入，嘗試直接載入...")
+            try:
+                await self.bot.load_extension("cogs.gacha")
+                print("成功載入 cogs.gacha")
+            except Exception as e:
+                print(f"載入 cogs.gacha 失敗: {e}")
+            return
+
+        loop = asyncio.get_running_loop()
+        try:
+            snapshot = await loop.run_in_executor(None, gacha_snapshot.load_snapshot)
+            await gacha_cog.publish_snapshot(snapshot)
+        except Exception as e:
+            print(f"替換轉蛋資料快照失敗 (繼續使用舊資料): {e}")
+
+    async def prune_old_history(self):
+        """分批刪除超出保留期數的舊抽卡記錄，每批都是一個短交易。"""
+        loop = asyncio.get_running_loop()
+        total = 0
+        try:
+            while True:
+                deleted = await loop.run_in_executor(None, gacha_db.prune_history_batch)
+                if not deleted:
+                    break
+                total += deleted
+                await asyncio.sleep(PRUNE_BATCH_PAUSE)
+        except Exception as e:
+            print(f"清除舊的抽卡記錄時發生錯誤 (下次更新後繼續): {e}")
+        if total:
+            print(f"已清除 {total} 筆舊卡池期的抽卡記錄。")
+
     @update_data_loop.before_loop
     async def before_update_loop(self):
         await self.bot.wait_until_ready()
@@ -0,0 +1,108 @@
+# cogs/utils/db_connection.py
+# 長駐的 SQLite 連線：一條專用的寫入連線 + 少量讀取連線，WAL 模式下讀寫互不阻擋
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+READER_COUNT = 4
+STATEMENT_CACHE_SIZE = 128  # 每條連線快取的預編譯語句數 (相同的 SQL 字串會直接重用)
+BUSY_TIMEOUT_MS = 5000  # 與 get_gacha_data.update 的連線同時寫入時的等待時間
+PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",  # WAL 下只在 checkpoint 時 fsync，斷電最多遺失最後幾筆交易
+    "PRAGMA cache_size = -16000",  # 每條連線約 16MB 的頁面快取
+    "PRAGMA mmap_size = 67108864",  # 64MB 的記憶體映射讀取
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+)
+
+
+class ConnectionManager:
+    """管理同一個資料庫檔案的寫入連線與讀取連線池。
+
+    read() 與 write() 都是 context manager；write() 在結束時提交，發生例外時回滾。
+    連線可跨執行緒使用，但同一時間只會借給一個使用者。
+    """
+
+    def __init__(self, db_path: Path, readers: int = READER_COUNT):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._writer.execute("PRAGMA journal_mode = WAL")  # 寫入資料庫檔案，之後所有連線都使用 WAL
+        self._readers = queue.LifoQueue()
+        self._all_readers = []
+        for _ in range(readers):
+            reader = self._connect()
+            self._readers.put(reader)
+            self._all_readers.append(reader)
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            isolation_level=None,  # 交易由 write() 明確控制
+        )
+        con.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            con.execute(pragma)
+        return con
+
+    @contextmanager
+    def read(self):
+        """借出一條讀取連線 (WAL 下不會被寫入阻擋)。"""
+        con = self._readers.get()
+        try:
+            yield con
+        finally:
+            if con.in_transaction:  # 讀到一半發生例外時結束快照
+                con.rollback()
+            self._readers.put(con)
+
+    @contextmanager
+    def write(self):
+        """在寫入連線上開始一個交易 (BEGIN IMMEDIATE)，結束時提交。"""
+        with self._write_lock:
+            con = self._writer
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                yield con
+            except BaseException:
+                con.rollback()
+                raise
+            con.commit()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        with self._write_lock:
+            self._writer.close()
+        for reader in self._all_readers:
+            reader.close()
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(db_path: Path) -> ConnectionManager:
+    """取得 db_path 的連線管理器 (每個資料庫檔案一個，第一次使用時建立)。"""
+    key = Path(db_path).resolve()
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = ConnectionManager(key)
+        return manager
+
+
+def close_all():
+    """關閉所有長駐連線 (bot 關閉時呼叫)。"""
+    with _managers_lock:
+        for manager in _managers.values():
+            manager.close()
+        _managers.clear()
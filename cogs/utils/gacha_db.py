@@ -1,56 +1,126 @@
 # cogs/utils/gacha_db.py
 
 from pathlib import Path
-import sqlite3
 import datetime 
+import functools
+import time
 import pytz     
+
+from . import db_connection
+from .schema import RARITY_CODES, RARITY_NAMES, SERVER_CODES, SERVER_NAMES
+from .student_catalog import StudentCatalog
+from . import gacha_engine
+
 pwd = Path(__file__).parent
 DB_PATH = pwd / "../../gacha_data/gacha_data.db" # 確保路徑是正確的
 
-TARGET_TIMEZONE_FOR_PULL_TIME = pytz.timezone('Asia/Taipei')
+TARGET_TIMEZONE_FOR_PULL_TIME = pytz.timezone('Asia/Taipei') # pull_time (UNIX 秒) 顯示用的時區
 
-def get_character_pools(server: str) -> dict:
-    """從資料庫獲取指定伺服器的所有角色卡池。"""
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
+# 抽卡結果的稀有度代碼 (gacha_engine) -> gacha_history.rarity；Pick Up 與 Fes 限定都歸入原本的星級
+HISTORY_RARITY = {
+    gacha_engine.RARITY_R: RARITY_CODES["R"],
+    gacha_engine.RARITY_SR: RARITY_CODES["SR"],
+    gacha_engine.RARITY_PICKUP_SR: RARITY_CODES["SR"],
+    gacha_engine.RARITY_SSR: RARITY_CODES["SSR"],
+    gacha_engine.RARITY_PICKUP_SSR: RARITY_CODES["SSR"],
+    gacha_engine.RARITY_PICKUP_FES: RARITY_CODES["SSR"],
+}
 
-    pools = {
-        "R": [], "SR": [], "SSR": [], # 常駐
-        "Limited_Normal": [],       # 普通限定 (is_limited == 1)
-        "Limited_Fes": []           # Fes 限定 (is_limited == 3)
-    }
-    
-    server_condition = "WHERE in_global = 1" if server == "global" else ""
-    
+# 固定的 SQL 字串：長駐連線會快取預編譯好的語句，每次呼叫直接重用
+SELECT_STUDENTS = "SELECT id, name_jp, name_tw, name_en, star_grade, is_limited, in_global FROM students_list ORDER BY id"
+INSERT_HISTORY = "INSERT INTO gacha_history (user_id, server, epoch, banner_id, char_id, rarity, pull_time) VALUES (?, ?, ?, ?, ?, ?, ?)"
+# 角色名稱不存在抽卡記錄中：依伺服器取 students_list 的名稱 (與 StudentCatalog.name 相同)，已移除的學生顯示編號
+HISTORY_CHAR_NAME = "COALESCE(CASE h.server WHEN 0 THEN s.name_tw ELSE s.name_jp END, CAST(h.char_id AS TEXT)) AS char_name"
+SELECT_HISTORY_EPOCHS = "SELECT server, epoch FROM history_epochs"
+SELECT_USER_RARITY_COUNTS = """
+    SELECT rarity, COUNT(*) FROM gacha_history
+    WHERE user_id = ? AND server = ? AND epoch = ? AND banner_id = ?
+    GROUP BY rarity
+"""
+UPSERT_HISTORY_STATS = """
+    INSERT INTO gacha_history_stats (user_id, server, epoch, banner_id, total, ssr, sr, r, last_pull_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, server, epoch, banner_id) DO UPDATE SET
+        total = total + excluded.total,
+        ssr = ssr + excluded.ssr,
+        sr = sr + excluded.sr,
+        r = r + excluded.r,
+        last_pull_time = max(last_pull_time, excluded.last_pull_time)
+"""
+SELECT_USER_STATS = """
+    SELECT total, ssr, sr, r, last_pull_time FROM gacha_history_stats
+    WHERE user_id = ? AND server = ? AND epoch = ? AND banner_id = ?
+"""
+SELECT_USER_SSR_HISTORY = f"""
+    SELECT {HISTORY_CHAR_NAME}, h.pull_time FROM gacha_history h
+    LEFT JOIN students_list s ON s.id = h.char_id
+    WHERE h.user_id = ? AND h.server = ? AND h.epoch = ? AND h.banner_id = ? AND h.rarity = {RARITY_CODES["SSR"]}
+    ORDER BY h.pull_time DESC
+    LIMIT ?
+"""
+# 舊卡池期的記錄：每個伺服器保留最近 HISTORY_KEEP_EPOCHS 期 (含目前這期)，更舊的分批刪除
+HISTORY_KEEP_EPOCHS = 3
+HISTORY_PRUNE_BATCH = 1000
+PRUNE_HISTORY_BATCH = """
+    DELETE FROM gacha_history WHERE id IN (
+        SELECT id FROM gacha_history WHERE server = ? AND epoch <= ? LIMIT ?
+    )
+"""
+PRUNE_HISTORY_STATS_BATCH = """
+    DELETE FROM gacha_history_stats WHERE (user_id, server, epoch, banner_id) IN (
+        SELECT user_id, server, epoch, banner_id FROM gacha_history_stats WHERE server = ? AND epoch <= ? LIMIT ?
+    )
+"""
+SSR_HISTORY_LIMIT = 20 # 一個 embed 欄位 (1024 字) 大約放得下的 SSR 記錄數
+HISTORY_PAGE_SIZE = 10
 
-    cur.execute(f"SELECT id, name_jp, name_tw, star_grade, is_limited FROM students_list {server_condition}")
-    all_students = cur.fetchall()
-    
-    for char in all_students:
-        name = char["name_tw"] if server == "global" else char["name_jp"]
-        char_info = {"id": char["id"], "name": name}
-
-        if char["star_grade"] == 1 and char["is_limited"] == 0:  
-            pools["R"].append(char_info)
-        elif char["star_grade"] == 2 and char["is_limited"] == 0:  
-            pools["SR"].append(char_info)
-        elif char["star_grade"] == 3:
-            if char["is_limited"] == 0:
-                pools["SSR"].append(char_info)
-            elif char["is_limited"] == 1: # 限定角色
-                pools["Limited_Normal"].append(char_info)
-            elif char["is_limited"] == 3: # Fes角色
-                pools["Limited_Fes"].append(char_info)
-    con.close()
-    return pools
+@functools.lru_cache(maxsize=None)
+def history_page_query(by_rarity: bool, by_char: bool, direction: str) -> str:
+    """抽卡記錄分頁查詢 (以 (pull_time, id) 為 keyset)。
+
+    direction 為 "first" (最新一頁)、"before" (比游標舊的一頁) 或 "after" (比游標新的一頁，
+    結果為由舊到新)。每種組合只產生一次字串，連線的語句快取可以直接重用。
+    """
+    conditions = ["h.user_id = ?", "h.server = ?", "h.epoch = ?", "h.banner_id = ?"]
+    if by_rarity:
+        conditions.append("h.rarity = ?")
+    if by_char:
+        conditions.append("h.char_id = ?")
+    if direction == "before":
+        conditions.append("(h.pull_time, h.id) < (?, ?)")
+    elif direction == "after":
+        conditions.append("(h.pull_time, h.id) > (?, ?)")
+    order = "ASC" if direction == "after" else "DESC"
+    return (
+        f"SELECT h.id, h.char_id, {HISTORY_CHAR_NAME}, h.rarity, h.pull_time"
+        " FROM gacha_history h LEFT JOIN students_list s ON s.id = h.char_id"
+        f" WHERE {' AND '.join(conditions)} ORDER BY h.pull_time {order}, h.id {order} LIMIT ?"
+    )
+
+# 高頻查詢與代表性參數：tools/check_query_plans.py 會確認它們都有用到索引
+HOT_QUERIES = {
+    "get_user_rarity_counts": (SELECT_USER_RARITY_COUNTS, (0, 0, 0, 1)),
+    "get_user_banner_stats": (SELECT_USER_STATS, (0, 0, 0, 1)),
+    "get_user_ssr_history": (SELECT_USER_SSR_HISTORY, (0, 0, 0, 1, SSR_HISTORY_LIMIT)),
+    "get_user_history_page": (history_page_query(False, False, "before"), (0, 0, 0, 1, 0, 0, HISTORY_PAGE_SIZE)),
+    "get_user_history_page (稀有度)": (history_page_query(True, False, "after"), (0, 0, 0, 1, 3, 0, 0, HISTORY_PAGE_SIZE)),
+    "get_user_history_page (角色)": (history_page_query(False, True, "before"), (0, 0, 0, 1, 0, 0, 0, HISTORY_PAGE_SIZE)),
+    "get_user_history_page (稀有度 + 角色)": (history_page_query(True, True, "before"), (0, 0, 0, 1, 3, 0, 0, 0, HISTORY_PAGE_SIZE)),
+    "prune_history_batch": (PRUNE_HISTORY_BATCH, (0, 0, HISTORY_PRUNE_BATCH)),
+    "prune_history_batch (統計表)": (PRUNE_HISTORY_STATS_BATCH, (0, 0, HISTORY_PRUNE_BATCH)),
+}
+
+def get_db() -> db_connection.ConnectionManager:
+    """目前 DB_PATH 的長駐連線 (第一次使用時開啟)。"""
+    return db_connection.get_manager(DB_PATH)
+
+def get_student_catalog() -> StudentCatalog:
+    """從資料庫載入所有學生，建立兩個伺服器共用的學生名冊。"""
+    with get_db().read() as con:
+        return StudentCatalog(con.execute(SELECT_STUDENTS).fetchall())
 
 def get_current_banners(server: str) -> list:
     """從資料庫獲取指定伺服器的當前卡池資訊。"""
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
-
     table_name = f"current_banner_{'gl' if server == 'global' else 'jp'}"
     name_column = "name_tw" if server == "global" else "name_jp"
     
@@ -58,6 +128,7 @@ def get_current_banners(server: str) -> list:
     query = f"""
         SELECT
             b.type,
+            b.banner_id,
             s_rateup.id as rateup_char_id,          
             s_rateup.{name_column} as rateup_char_name, 
             s_rateup.star_grade as rateup_char_rarity,
@@ -65,11 +136,13 @@ def get_current_banners(server: str) -> list:
         FROM {table_name} b
         LEFT JOIN students_list s_rateup ON b.rateup_id = s_rateup.id 
     """
-    cur.execute(query)
+    with get_db().read() as con:
+        rows = con.execute(query).fetchall()
     
     banners = []
-    for row in cur.fetchall():
+    for row in rows:
         banner_info = {
+            "id": row["banner_id"], # banners 登錄表的編號，抽卡記錄與選單都用它指定卡池
             "gachaType": row["type"],
             "rateups": []
         }
@@ -82,55 +155,116 @@ def get_current_banners(server: str) -> list:
             })
         banners.append(banner_info)
         
-    con.close()
     return banners
 
-def record_pulls(user_id: int, server: str, banner_name: str, pull_results: list):
-    """將抽卡結果記錄到資料庫。"""
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    
-    records_to_insert = []
-    current_time_with_tz = datetime.datetime.now(TARGET_TIMEZONE_FOR_PULL_TIME)
-    formatted_pull_time = current_time_with_tz.strftime('%Y-%m-%d %H:%M:%S')
-    for result in pull_results:
-        clean_rarity = result["rarity"].split('_')[-1]
-        
-        if "id" not in result or "name" not in result:
-            continue
-
-        records_to_insert.append((
-            user_id,
-            result["id"],
-            result["name"],
-            clean_rarity,
-            banner_name,
-            server,
-            formatted_pull_time
-        ))
-    
-    if records_to_insert:
-        cur.executemany(
-            "INSERT INTO gacha_history (user_id, char_id, char_name, rarity, banner_name, server, pull_time) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            records_to_insert
+def get_history_epochs() -> dict:
+    """每個伺服器目前的卡池期數 {server: epoch}；卡池變更時 update 會把期數加一。"""
+    with get_db().read() as con:
+        return {SERVER_NAMES[code]: epoch for code, epoch in con.execute(SELECT_HISTORY_EPOCHS).fetchall()}
+
+def build_history_rows(user_id: int, server: str, epoch: int, banner_id: int, pull_results: list, catalog: StudentCatalog) -> list:
+    """把抽卡結果 [(學生索引, 稀有度代碼), ...] 轉成 gacha_history 的資料列 (抽卡時間為現在)。"""
+    pull_time = int(time.time())
+    server_code = SERVER_CODES[server]
+    return [
+        (user_id, server_code, epoch, banner_id, catalog.student_id(student_idx), HISTORY_RARITY[rarity_code], pull_time)
+        for student_idx, rarity_code in pull_results
+        if rarity_code != gacha_engine.RARITY_ERROR
+    ]
+
+def summarize_history_rows(rows: list) -> list:
+    """把抽卡記錄依 (使用者, 伺服器, 期數, 卡池) 加總，轉成 UPSERT_HISTORY_STATS 的參數。"""
+    summary = {}
+    for user_id, server, epoch, banner_id, _, rarity, pull_time in rows:
+        key = (user_id, server, epoch, banner_id)
+        total, ssr, sr, r, last_pull_time = summary.get(key, (0, 0, 0, 0, pull_time))
+        summary[key] = (
+            total + 1, ssr + (rarity == RARITY_CODES["SSR"]), sr + (rarity == RARITY_CODES["SR"]), r + (rarity == RARITY_CODES["R"]),
+            max(last_pull_time, pull_time),
         )
-        con.commit()
-    
-    con.close()
+    return [key + counts for key, counts in summary.items()]
+
+def insert_history_rows(rows: list):
+    """在同一個交易中寫入多筆抽卡記錄 (build_history_rows 的結果) 並更新統計表。"""
+    if rows:
+        stats = summarize_history_rows(rows)
+        with get_db().write() as con:
+            con.executemany(INSERT_HISTORY, rows)
+            con.executemany(UPSERT_HISTORY_STATS, stats)
+
+def record_pulls(user_id: int, server: str, epoch: int, banner_id: int, pull_results: list, catalog: StudentCatalog):
+    """將抽卡結果 [(學生索引, 稀有度代碼), ...] 直接 (同步) 記錄到資料庫；bot 內請改用 PullRecorder。"""
+    insert_history_rows(build_history_rows(user_id, server, epoch, banner_id, pull_results, catalog))
+
+def prune_history_batch(keep_epochs: int = HISTORY_KEEP_EPOCHS, batch_size: int = HISTORY_PRUNE_BATCH) -> int:
+    """刪除一批超出保留期數的舊記錄 (與其統計)，回傳刪除的筆數；回傳 0 代表已清完。"""
+    deleted = 0
+    with get_db().write() as con:
+        for server, epoch in con.execute(SELECT_HISTORY_EPOCHS).fetchall():
+            params = (server, epoch - keep_epochs, batch_size)
+            deleted += con.execute(PRUNE_HISTORY_BATCH, params).rowcount
+            deleted += con.execute(PRUNE_HISTORY_STATS_BATCH, params).rowcount
+    return deleted
 
 # --- 修改後的函式 ---
-def get_user_history_for_banner(user_id: int, banner_name: str) -> list:
-    """從資料庫獲取指定用戶在特定卡池的抽卡歷史記錄。"""
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
-    
-    cur.execute(
-        "SELECT * FROM gacha_history WHERE user_id = ? AND banner_name = ? ORDER BY pull_time DESC",
-        (user_id, banner_name)
-    )
-    history = cur.fetchall()
-    
-    con.close()
-    return history
-# --- 修改結束 ---
\ No newline at end of file
+def get_user_rarity_counts(user_id: int, server: str, epoch: int, banner_id: int) -> dict:
+    """直接由抽卡記錄統計各稀有度的張數 {稀有度: 張數} (不經過統計表)。"""
+    with get_db().read() as con:
+        rows = con.execute(SELECT_USER_RARITY_COUNTS, (user_id, SERVER_CODES[server], epoch, banner_id)).fetchall()
+    return {RARITY_NAMES[rarity]: count for rarity, count in rows}
+
+def get_user_banner_stats(user_id: int, server: str, epoch: int, banner_id: int):
+    """使用者在某期某個卡池的統計 (total/ssr/sr/r/last_pull_time)，沒有記錄時回傳 None。
+
+    統計表缺少這個卡池的資料時 (例如從舊備份還原、統計表還沒重建)，改由抽卡記錄直接統計。
+    """
+    with get_db().read() as con:
+        stats = con.execute(SELECT_USER_STATS, (user_id, SERVER_CODES[server], epoch, banner_id)).fetchone()
+    if stats is not None:
+        return stats
+    counts = get_user_rarity_counts(user_id, server, epoch, banner_id)
+    if not counts:
+        return None
+    return {
+        "total": sum(counts.values()), "ssr": counts.get("SSR", 0), "sr": counts.get("SR", 0), "r": counts.get("R", 0),
+        "last_pull_time": None,
+    }
+
+def get_user_history_page(user_id: int, server: str, epoch: int, banner_id: int, rarity: str = None, char_id: int = None,
+                          before: tuple = None, after: tuple = None, limit: int = HISTORY_PAGE_SIZE) -> list:
+    """取得一頁抽卡記錄 (新的在前；rarity 欄位為 RARITY_CODES 的代碼)。
+
+    before / after 為 (pull_time, id) 游標：before 取比游標舊的一頁，after 取比游標新的一頁。
+    每次只讀 limit 筆，與使用者的記錄總數無關。
+    """
+    direction = "before" if before else "after" if after else "first"
+    params = [user_id, SERVER_CODES[server], epoch, banner_id]
+    if rarity:
+        params.append(RARITY_CODES[rarity])
+    if char_id is not None:
+        params.append(char_id)
+    if before or after:
+        params.extend(before or after)
+    params.append(limit)
+    query = history_page_query(bool(rarity), char_id is not None, direction)
+    with get_db().read() as con:
+        rows = con.execute(query, params).fetchall()
+    return rows[::-1] if direction == "after" else rows
+
+def get_user_ssr_history(user_id: int, server: str, epoch: int, banner_id: int, limit: int = SSR_HISTORY_LIMIT) -> list:
+    """使用者在某期某個卡池最近抽到的 limit 張 SSR (char_name, pull_time)，新的在前。"""
+    with get_db().read() as con:
+        return con.execute(SELECT_USER_SSR_HISTORY, (user_id, SERVER_CODES[server], epoch, banner_id, limit)).fetchall()
+
+def pull_time_to_datetime(pull_time: int) -> datetime.datetime:
+    """gacha_history.pull_time (UNIX 秒) 轉成顯示用時區的時間。"""
+    return datetime.datetime.fromtimestamp(pull_time, TARGET_TIMEZONE_FOR_PULL_TIME)
+# --- 修改結束 ---
+
+def explain_query_plan(con, sql: str, params=()) -> list:
+    """回傳 EXPLAIN QUERY PLAN 每一步的說明文字。"""
+    return [row[3] for row in con.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+def is_full_scan(plan: list) -> bool:
+    """查詢計畫中是否有整張表 (或整個索引) 掃描，或需要額外排序。"""
+    return any(step.startswith("SCAN") or "TEMP B-TREE" in step for step in plan)
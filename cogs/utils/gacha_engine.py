@@ -0,0 +1,297 @@
+# cogs/utils/gacha_engine.py
+# 預先編譯的卡池抽卡表：載入資料時一次算好每個卡池的權重與卡池內容，抽卡時只需查表
+import random
+from dataclasses import dataclass
+
+import numpy as np
+
+from .student_catalog import StudentCatalog
+
+# 抽卡類別: R, SR, SSR_常駐, SSR_PickUp, SSR_Limited_Normal_Other, SSR_Limited_Fes_PickUp, SSR_Limited_Fes_Other
+# 索引:     0,  1,  2,         3,            4,                        5,                         6
+RESULT_CATEGORIES = ("R", "SR", "SSR_Perm", "SSR_PickUp", "SSR_Lim_Norm_Other", "SSR_Fes_PickUp", "SSR_Fes_Other")
+CAT_R, CAT_SR, CAT_SSR_PERM, CAT_SSR_PICKUP, CAT_LIM_NORM_OTHER, CAT_FES_PICKUP, CAT_FES_OTHER = range(len(RESULT_CATEGORIES))
+
+BASE_WEIGHTS = (78.5, 18.5, 3.0, 0, 0, 0, 0)
+SSR_CATEGORIES = (CAT_SSR_PERM, CAT_SSR_PICKUP, CAT_LIM_NORM_OTHER, CAT_FES_PICKUP, CAT_FES_OTHER)
+PICKUP_CATEGORIES = (CAT_SSR_PICKUP, CAT_FES_PICKUP)
+SIM_PERCENTILES = (50, 75, 90, 99)
+
+# 抽卡結果顯示用的稀有度 (create_single_image 依此決定外框)，結果中以索引表示
+RARITY_DISPLAYS = ("R", "SR", "SSR", "Pickup_SR", "Pickup_SSR", "Pickup_Fes", "Error")
+RARITY_R, RARITY_SR, RARITY_SSR, RARITY_PICKUP_SR, RARITY_PICKUP_SSR, RARITY_PICKUP_FES, RARITY_ERROR = range(len(RARITY_DISPLAYS))
+
+
+class AliasTable:
+    """Walker alias method 抽樣表：建表 O(n)，每次抽樣 O(1)。"""
+    __slots__ = ("prob", "alias", "outcomes", "size", "_arrays")
+
+    def __init__(self, outcomes, weights):
+        size = len(weights)
+        total = float(sum(weights))
+        scaled = [w * size / total for w in weights]
+        prob = [1.0] * size
+        alias = list(range(size))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        # 剩下的都是浮點誤差造成的 ~1.0，直接視為 1
+        self.prob = tuple(prob)
+        self.alias = tuple(alias)
+        self.outcomes = tuple(outcomes)
+        self.size = size
+        self._arrays = (np.array(prob), np.array(alias, dtype=np.intp), np.array(outcomes, dtype=np.int8))
+
+    def sample(self, rand=random.random):
+        u = rand() * self.size
+        i = int(u)
+        if i >= self.size:  # rand() 理論上 < 1，保險起見
+            i = self.size - 1
+        return self.outcomes[i] if u - i < self.prob[i] else self.outcomes[self.alias[i]]
+
+    def sample_many(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        """一次抽 n 個樣本 (NumPy 向量化)。"""
+        prob, alias, outcomes = self._arrays
+        u = rng.random(n) * self.size
+        i = u.astype(np.intp)
+        np.minimum(i, self.size - 1, out=i)
+        return outcomes[np.where(u - i < prob[i], i, alias[i])]
+
+
+@dataclass(frozen=True)
+class CompiledBanner:
+    """單一 (伺服器, 卡池) 的不可變抽卡表。
+
+    weights / last_pull_weights 為正規化後 (總和 100) 的七個類別權重，
+    results[類別] 為該類別可抽出的結果 (已套用 Pick Up 移除與 fallback)，
+    每個結果都是 (學生索引, 稀有度代碼) 的 tuple；學生索引對應 StudentCatalog，
+    錯誤結果的學生索引為 -1。
+    """
+    server: str
+    gacha_type: str
+    pickup: object  # 當期 Pick Up 角色 (字典) 或 None
+    weights: tuple
+    last_pull_weights: tuple
+    results: tuple
+    table: AliasTable
+    last_pull_table: AliasTable
+    # 批次抽卡用：results 攤平後的學生索引、各類別的起點/數量，以及 fallback 後實際的類別
+    result_indices: np.ndarray
+    result_offsets: np.ndarray
+    result_sizes: np.ndarray
+    result_categories: np.ndarray
+
+    def keeps_category(self, category: int) -> bool:
+        """該類別抽到的是自己的角色 (沒有因為卡池是空的而 fallback 到其他類別)。"""
+        return self.result_categories[category] == category
+
+    def has_pickup(self) -> bool:
+        """卡池實際抽得到 Pick Up 角色；Pick Up 權重 fallback 到其他類別時不算。"""
+        return any(self.weights[c] > 0 and self.keeps_category(c) for c in PICKUP_CATEGORIES)
+
+    def draw(self, last_pull: bool = False):
+        """抽一次；不做任何配置，回傳預先建好的 (學生索引, 稀有度代碼)。"""
+        category = (self.last_pull_table if last_pull else self.table).sample()
+        results = self.results[category]
+        return results[int(random.random() * len(results))]
+
+    def draw_many(self, n: int, rng: np.random.Generator = None):
+        """一次抽 n 次，依序視為連續的十連 (每第 10 抽套用 SR 保底)。
+
+        回傳 (categories, student_indices) 兩個長度 n 的 NumPy 陣列；
+        categories 為 fallback 後實際抽到的類別 (RESULT_CATEGORIES 的索引)。
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        categories = self.table.sample_many(rng, n)
+        last_pull_positions = np.arange(9, n, 10)
+        if last_pull_positions.size:
+            categories[last_pull_positions] = self.last_pull_table.sample_many(rng, last_pull_positions.size)
+        members = (rng.random(n) * self.result_sizes[categories]).astype(np.intp)
+        student_indices = self.result_indices[self.result_offsets[categories] + members]
+        return self.result_categories[categories], student_indices
+
+
+def _normalize(weights):
+    # 權重正規化 (確保總和為100)
+    active_weights = [w for w in weights if w > 0]
+    if active_weights:
+        current_total_weight = sum(active_weights)
+        if abs(current_total_weight - 100.0) > 1e-5:
+            factor = 100.0 / current_total_weight
+            weights = [w * factor for w in weights]
+    else:  # 所有權重都為0，強制設為 R
+        weights[0] = 100.0
+    return tuple(weights)
+
+
+def compile_banner(server: str, catalog: StudentCatalog, pools_source: dict, all_banners_for_server: list, choice: int) -> CompiledBanner:
+    """依照原本 pull_logic 的規則，為指定卡池編譯出抽卡表。choice 超出範圍時視為常駐池。
+
+    pools_source 為 StudentCatalog.pools() 的結果 (學生索引陣列)。
+    """
+    pool_r = pools_source["R"]
+    pool_sr = pools_source["SR"]
+    pool_ssr_permanent = pools_source["SSR"]  # 常駐三星
+    pool_limited_normal = pools_source["Limited_Normal"]  # 普通限定
+    pool_limited_fes = pools_source["Limited_Fes"]  # Fes 限定
+    pool_concurrent_limited_others = pool_r[:0]
+
+    current_pickup_char = None
+    pickup_idx = -1  # Pick Up 角色的學生索引
+    weights = list(BASE_WEIGHTS)
+    gacha_type = "NormalGacha"
+
+    if -1 < choice < len(all_banners_for_server):
+        selected_banner = all_banners_for_server[choice]
+        gacha_type = selected_banner["gachaType"]
+
+        if selected_banner.get("rateups"):
+            current_pickup_char = selected_banner["rateups"][0]  # 只取第一個 pick up
+            pickup_idx = catalog.index.get(current_pickup_char["id"], -1)
+
+            # 從相應卡池中移除 UP 角，避免重複計算機率
+            if current_pickup_char["rarity"] == "SR":
+                pool_sr = pool_sr[pool_sr != pickup_idx]
+            elif gacha_type == "FesGacha":
+                pool_limited_fes = pool_limited_fes[pool_limited_fes != pickup_idx]
+            elif gacha_type == "LimitedGacha":
+                pool_limited_normal = pool_limited_normal[pool_limited_normal != pickup_idx]
+            else:  # PickupGacha (常駐UP)
+                pool_ssr_permanent = pool_ssr_permanent[pool_ssr_permanent != pickup_idx]
+
+        # --- 權重調整 ---
+        if gacha_type == "PickupGacha":  # 常駐 UP
+            if current_pickup_char and current_pickup_char["rarity"] == "SSR":
+                weights[CAT_SSR_PERM] -= 0.7
+                weights[CAT_SSR_PICKUP] += 0.7
+
+        elif gacha_type == "LimitedGacha":  # 普通限定 UP，總三星率 3%
+            weights[CAT_SSR_PICKUP] = 0.7
+
+            # 「同期其他 UP 的限定 SSR」: 機率與常駐 SSR 一樣
+            concurrent_limited_up_others = [
+                catalog.index.get(b_info["rateups"][0]["id"], -1)
+                for b_idx, b_info in enumerate(all_banners_for_server)
+                if b_idx != choice and b_info["gachaType"] == "LimitedGacha" and b_info.get("rateups")
+            ]
+            pool_concurrent_limited_others = pool_limited_normal[
+                np.isin(pool_limited_normal, concurrent_limited_up_others) & (pool_limited_normal != pickup_idx)
+            ]
+
+            num_permanent_ssr = len(pool_ssr_permanent)
+            num_concurrent_limited_others = len(pool_concurrent_limited_others)
+            total_off_banner_pool_size = num_permanent_ssr + num_concurrent_limited_others
+            if total_off_banner_pool_size > 0:
+                weights[CAT_SSR_PERM] = (num_permanent_ssr / total_off_banner_pool_size) * 2.3
+                weights[CAT_LIM_NORM_OTHER] = (num_concurrent_limited_others / total_off_banner_pool_size) * 2.3
+            else:  # 單 UP 角
+                weights[CAT_SSR_PERM] = 2.3
+                weights[CAT_LIM_NORM_OTHER] = 0
+
+        elif gacha_type == "FesGacha":  # 總三星率 6%
+            weights[CAT_FES_PICKUP] = 0.7
+            # 其他 Fes 限定角均分 0.9%，常駐三星均分剩餘 4.4%
+            weights[CAT_FES_OTHER] = 0.9 if len(pool_limited_fes) else 0
+            weights[CAT_SSR_PERM] = 4.4
+
+    # 十連保底 SR：R 的機率全給 SR
+    last_pull_weights = list(weights)
+    last_pull_weights[CAT_SR] += last_pull_weights[CAT_R]
+    last_pull_weights[CAT_R] = 0
+
+    # 各類別實際可抽出的角色與顯示用稀有度
+    pickup_rarity = RARITY_PICKUP_SR if current_pickup_char and current_pickup_char["rarity"] == "SR" else RARITY_PICKUP_SSR
+    is_ssr_pickup = bool(current_pickup_char) and current_pickup_char["rarity"] == "SSR"
+    has_pickup_idx = pickup_idx >= 0
+    category_sources = [
+        (pool_r, RARITY_R),
+        (pool_sr, RARITY_SR),
+        (pool_ssr_permanent, RARITY_SSR),
+        ([pickup_idx] if has_pickup_idx and is_ssr_pickup and gacha_type != "FesGacha" else [], pickup_rarity),
+        (pool_concurrent_limited_others, RARITY_SSR),
+        ([pickup_idx] if has_pickup_idx and gacha_type == "FesGacha" else [], pickup_rarity),
+        (pool_limited_fes, RARITY_SSR),  # Fes其他角色當作普通SSR顯示，但它是限定
+    ]
+
+    # Fallback：抽到空的類別時改給 R，連 R 都沒有就回傳錯誤
+    if len(pool_r):
+        fallback = tuple((int(idx), RARITY_R) for idx in pool_r)
+    else:
+        fallback = ((-1, RARITY_ERROR),)
+    results = tuple(
+        tuple((int(idx), rarity) for idx in pool) if len(pool) else fallback
+        for pool, rarity in category_sources
+    )
+
+    weights = _normalize(weights)
+    last_pull_weights = _normalize(last_pull_weights)
+
+    result_sizes = np.array([len(r) for r in results], dtype=np.intp)
+    result_offsets = np.concatenate(([0], np.cumsum(result_sizes)[:-1])).astype(np.intp)
+    result_indices = np.array([idx for rs in results for idx, _ in rs], dtype=np.int32)
+    result_categories = np.array(
+        [category if len(pool) else CAT_R for category, (pool, _) in enumerate(category_sources)], dtype=np.int8
+    )
+
+    def build_table(w):
+        active = [i for i, value in enumerate(w) if value > 0]
+        return AliasTable(active, [w[i] for i in active])
+
+    return CompiledBanner(
+        server=server,
+        gacha_type=gacha_type,
+        pickup=current_pickup_char,
+        weights=weights,
+        last_pull_weights=last_pull_weights,
+        results=results,
+        table=build_table(weights),
+        last_pull_table=build_table(last_pull_weights),
+        result_indices=result_indices,
+        result_offsets=result_offsets,
+        result_sizes=result_sizes,
+        result_categories=result_categories,
+    )
+
+
+def compile_server(server: str, catalog: StudentCatalog, banners: list) -> list:
+    """編譯伺服器上每一個卡池，另在最後附上一個「無卡池」時使用的常駐表。"""
+    pools_source = catalog.pools(server)
+    compiled = [compile_banner(server, catalog, pools_source, banners, i) for i in range(len(banners))]
+    compiled.append(compile_banner(server, catalog, pools_source, banners, -1))
+    return compiled
+
+
+def simulate(compiled: CompiledBanner, n: int, seed: int = None) -> dict:
+    """模擬 n 抽，統計各類別出率以及「距離下一次抽到目標」的抽數分布。
+
+    有 Pick Up 的卡池以 Pick Up 角色為目標，否則以任意 SSR 為目標。
+    """
+    categories, _ = compiled.draw_many(n, np.random.default_rng(seed))
+    counts = np.bincount(categories, minlength=len(RESULT_CATEGORIES))
+    has_pickup = compiled.has_pickup()
+    target = PICKUP_CATEGORIES if has_pickup else SSR_CATEGORIES
+
+    hit_positions = np.flatnonzero(np.isin(categories, target))
+    gaps = np.diff(hit_positions, prepend=-1)  # 第一次與每次之間各花了幾抽
+    stats = {
+        "pulls": n,
+        "target": "pickup" if has_pickup else "SSR",
+        "hits": int(hit_positions.size),
+        "ssr_rate": float(counts[list(SSR_CATEGORIES)].sum() / n * 100),
+        "pickup_rate": float(counts[list(PICKUP_CATEGORIES)].sum() / n * 100),
+        "category_rates": {cat: float(counts[i] / n * 100) for i, cat in enumerate(RESULT_CATEGORIES)},
+        "percentiles": {},
+        "mean": None,
+        "within_200": None,
+    }
+    if gaps.size:
+        stats["percentiles"] = {p: int(v) for p, v in zip(SIM_PERCENTILES, np.percentile(gaps, SIM_PERCENTILES, method="higher"))}
+        stats["mean"] = float(gaps.mean())
+        stats["within_200"] = float((gaps <= 200).mean() * 100)
+    return stats
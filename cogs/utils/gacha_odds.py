@@ -0,0 +1,72 @@
+# cogs/utils/gacha_odds.py
+# 依編譯好的卡池權重精確計算機率 (不需模擬)
+from dataclasses import dataclass
+
+from .gacha_engine import CompiledBanner, PICKUP_CATEGORIES, SSR_CATEGORIES
+
+TEN_PULL = 10
+
+
+@dataclass(frozen=True)
+class BannerOdds:
+    """單一卡池的精確機率；抽卡視為連續的十連，每第 10 抽套用 SR 保底。"""
+    ssr_rate: float  # 一般抽的 SSR 機率 (0~1)
+    pickup_rate: float
+    last_pull_ssr_rate: float  # 第 10 抽 (保底) 的 SSR 機率
+    last_pull_pickup_rate: float
+    ten_pull_ssr_distribution: tuple  # 十連抽到 k 張 SSR 的機率，k = 0..10
+
+    def _miss_probability(self, pulls: int, rate: float, last_pull_rate: float) -> float:
+        cycles, remainder = divmod(pulls, TEN_PULL)
+        return (1 - rate) ** ((TEN_PULL - 1) * cycles + remainder) * (1 - last_pull_rate) ** cycles
+
+    def _expected_pulls(self, rate: float, last_pull_rate: float) -> float:
+        # E[T] = Σ P(T > n)；以十抽為週期的等比級數
+        cycle_miss = (1 - rate) ** (TEN_PULL - 1) * (1 - last_pull_rate)
+        if cycle_miss >= 1:
+            return float("inf")
+        within_cycle = sum((1 - rate) ** j for j in range(TEN_PULL))
+        return within_cycle / (1 - cycle_miss)
+
+    def pickup_within(self, pulls: int) -> float:
+        """pulls 抽內至少抽到一次 Pick Up 的機率。"""
+        return 1 - self._miss_probability(pulls, self.pickup_rate, self.last_pull_pickup_rate)
+
+    def ssr_within(self, pulls: int) -> float:
+        """pulls 抽內至少抽到一張 SSR 的機率。"""
+        return 1 - self._miss_probability(pulls, self.ssr_rate, self.last_pull_ssr_rate)
+
+    def expected_pulls_to_pickup(self) -> float:
+        return self._expected_pulls(self.pickup_rate, self.last_pull_pickup_rate)
+
+    def expected_pulls_to_ssr(self) -> float:
+        return self._expected_pulls(self.ssr_rate, self.last_pull_ssr_rate)
+
+    def ten_pull_at_least_ssr(self, k: int) -> float:
+        """一次十連 (含保底) 至少抽到 k 張 SSR 的機率。"""
+        return sum(self.ten_pull_ssr_distribution[max(k, 0):])
+
+
+def compute_odds(compiled: CompiledBanner) -> BannerOdds:
+    """由 CompiledBanner 的權重計算精確機率；fallback 到 R 的類別不計入。"""
+    def rate(weights, categories):
+        return sum(weights[c] for c in categories if compiled.keeps_category(c)) / 100.0
+
+    ssr_rate = rate(compiled.weights, SSR_CATEGORIES)
+    last_pull_ssr_rate = rate(compiled.last_pull_weights, SSR_CATEGORIES)
+
+    # 十連 SSR 張數分布 (Poisson binomial)：9 次一般抽 + 1 次保底抽
+    distribution = [1.0]
+    for p in [ssr_rate] * (TEN_PULL - 1) + [last_pull_ssr_rate]:
+        distribution = [
+            (distribution[k] if k < len(distribution) else 0.0) * (1 - p) + (distribution[k - 1] * p if k > 0 else 0.0)
+            for k in range(len(distribution) + 1)
+        ]
+
+    return BannerOdds(
+        ssr_rate=ssr_rate,
+        pickup_rate=rate(compiled.weights, PICKUP_CATEGORIES),
+        last_pull_ssr_rate=last_pull_ssr_rate,
+        last_pull_pickup_rate=rate(compiled.last_pull_weights, PICKUP_CATEGORIES),
+        ten_pull_ssr_distribution=tuple(distribution),
+    )
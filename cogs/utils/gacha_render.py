@@ -0,0 +1,267 @@
+# cogs/utils/gacha_render.py
+# 抽卡結果圖的繪製；不依賴 discord，可在獨立的繪圖行程中載入 (素材在 import 時就讀好)
+import functools
+import io
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+import PIL.Image
+
+from . import icon_store
+
+ASSETS_DIR = Path(__file__).parent.parent.parent / "assets"
+IMAGE_DIR = Path(__file__).parent.parent.parent / "gacha_data" / "images"
+CARD_CACHE_SIZE = 300 # 每張 160x160 RGBA 約 100KB
+COMPACT_FACTOR = 2 # compact 模式把畫布長寬各縮小為 1/2
+
+try:
+    
+    STAR_1 = PIL.Image.open(ASSETS_DIR / "star.png")
+    STAR_2 = PIL.Image.open(ASSETS_DIR / "two_star.png")
+    STAR_3 = PIL.Image.open(ASSETS_DIR / "three_star.png")
+    BACKGROUND = PIL.Image.open(ASSETS_DIR / "BackGround.png") 
+    PURPLE_GLOW = PIL.Image.open(ASSETS_DIR / "purple_glow.png")
+    YELLOW_GLOW = PIL.Image.open(ASSETS_DIR / "yellow_glow.png")
+    BORDER = PIL.Image.open(ASSETS_DIR / "border.png")
+    PURPLE_BORDER = PIL.Image.open(ASSETS_DIR / "purple_border.png")
+    YELLOW_BORDER = PIL.Image.open(ASSETS_DIR / "yellow_border.png")
+    BLUE_BORDER = PIL.Image.open(ASSETS_DIR / "blue_border.png")
+    # PIL.Image.open 是延遲解碼；thread 執行池的多個工作者會同時第一次使用這些素材，在 import 時就先解碼完
+    for asset in (STAR_1, STAR_2, STAR_3, BACKGROUND, PURPLE_GLOW, YELLOW_GLOW, BORDER, PURPLE_BORDER, YELLOW_BORDER, BLUE_BORDER):
+        asset.load()
+
+    # 縮小 MASK 圖標尺寸 (沒有預先處理好的頭像時才需要)
+    MASK = icon_store.load_mask(ASSETS_DIR / "mask.png")
+    
+    # 縮小 Pickup 圖標尺寸
+    original_Pickup= PIL.Image.open(ASSETS_DIR / "Pickup.png")
+    original_Pickup_width, original_Pickup_height = original_Pickup.size
+    new_width = int(original_Pickup_width * 0.35)
+    new_height = int(original_Pickup_height * 0.35)
+    PICKUP_ICON = original_Pickup.resize((new_width, new_height), PIL.Image.Resampling.LANCZOS)
+except FileNotFoundError as e:
+    raise FileNotFoundError(f"缺少核心素材圖片，請檢查 assets 資料夾: {e}")
+
+_atlas = None # 每個行程第一次用到時才 mmap
+
+def get_atlas():
+    """目前行程的頭像圖集 (icon_store.IconAtlas)，沒有圖集時回傳 None。"""
+    global _atlas
+    if _atlas is None:
+        _atlas = icon_store.IconAtlas.open() or False
+    return _atlas or None
+
+def reset_atlas():
+    """資料更新後重新開啟圖集 (舊的映射在沒有圖片引用後自動釋放)。"""
+    global _atlas
+    _atlas = None
+
+def load_student_icon(student_id: int) -> PIL.Image.Image:
+    """取得已縮放並套上遮罩的頭像：優先使用圖集，其次是處理好的單張頭像，最後才從原始圖片現場處理。"""
+    atlas = get_atlas()
+    if atlas is not None and student_id in atlas:
+        return atlas.tile(student_id)
+    try:
+        with PIL.Image.open(icon_store.render_icon_path(student_id)) as icon:
+            return icon.convert("RGBA")
+    except FileNotFoundError:
+        with PIL.Image.open(IMAGE_DIR / f"{student_id}.png") as icon:
+            return icon_store.prepare_icon(icon, MASK)
+
+def render_card(student_id: int, rarity_display: str):
+    """畫出一張 160x160 的卡片，回傳 (卡片, 是否完整)；找不到頭像時只畫外框。"""
+    base_char_image = PIL.Image.new("RGBA", (160, 160), (0, 0, 0, 0))
+    complete = rarity_display == "Error" # 錯誤卡片本來就沒有頭像
+    if not complete:
+        try:
+            char_pil_img = load_student_icon(student_id)
+            if rarity_display == "R":
+                base_char_image.alpha_composite(BLUE_BORDER)
+            elif rarity_display == "SR":
+                base_char_image.alpha_composite(YELLOW_BORDER)
+            elif rarity_display in ("SSR", "Pickup_SSR", "Pickup_Fes", "SSR_Lim_Norm_Other", "SSR_Fes_Other"):
+                base_char_image.alpha_composite(PURPLE_BORDER)
+            base_char_image.alpha_composite(char_pil_img, (30, 20))
+            complete = True
+        except FileNotFoundError:
+            print(f"警告：找不到學生圖片 {student_id}.png")
+        except Exception as e:
+            print(f"載入學生圖片 {student_id}.png 時發生錯誤: {e}")
+
+    is_pickup = "Pickup" in rarity_display # 例如 "Pickup_SR", "Pickup_SSR", "Pickup_Fes"
+    # 這裡獲取BORDER的尺寸以計算居中位置
+    border_width, border_height = BORDER.size
+    border_x = (160 - border_width) // 2
+    border_y = (160 - border_height) // 2
+    if rarity_display == "R":
+        base_char_image.alpha_composite(BORDER, (border_x, border_y))
+        base_char_image.alpha_composite(STAR_1)
+    elif rarity_display == "SR" or rarity_display == "Pickup_SR":
+        base_char_image.alpha_composite(YELLOW_GLOW)
+        base_char_image.alpha_composite(BORDER, (border_x, border_y))
+        base_char_image.alpha_composite(STAR_2)
+        if is_pickup:
+            base_char_image.alpha_composite(PICKUP_ICON , (30, 10))
+    elif rarity_display in ("SSR", "Pickup_SSR", "Pickup_Fes", "SSR_Lim_Norm_Other", "SSR_Fes_Other"):
+        base_char_image.alpha_composite(PURPLE_GLOW)
+        base_char_image.alpha_composite(BORDER, (border_x, border_y))
+        base_char_image.alpha_composite(STAR_3)
+        if is_pickup:
+            base_char_image.alpha_composite(PICKUP_ICON , (30, 10))
+    elif rarity_display == "Error":
+        pass
+    return base_char_image, complete
+
+class CardImageCache:
+    """以 (學生 id, 顯示稀有度) 為 key 的 LRU 卡片快取；快取內的圖片為共用物件，請勿修改。"""
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cards = OrderedDict()
+        self._lock = threading.Lock() # 預熱在背景執行緒進行
+
+    def get(self, key):
+        with self._lock:
+            card = self._cards.get(key)
+            if card is None:
+                self.misses += 1
+                return None
+            self._cards.move_to_end(key)
+            self.hits += 1
+            return card
+
+    def peek(self, key):
+        with self._lock:
+            return self._cards.get(key)
+
+    def put(self, key, card):
+        with self._lock:
+            self._cards[key] = card
+            self._cards.move_to_end(key)
+            while len(self._cards) > self.maxsize:
+                self._cards.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cards.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._cards), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+CARD_CACHE = CardImageCache(CARD_CACHE_SIZE)
+
+def get_card(key: tuple) -> PIL.Image.Image:
+    """取得 (學生 id, 顯示稀有度) 的卡片，優先使用快取。"""
+    card = CARD_CACHE.get(key)
+    if card is None:
+        card, complete = render_card(*key)
+        if complete: # 找不到頭像的卡片不快取，等圖片下載後再重畫
+            CARD_CACHE.put(key, card)
+    return card
+
+def warm_cards(keys) -> int:
+    """預先畫好指定的卡片，回傳快取中的卡片數。"""
+    for key in keys:
+        if CARD_CACHE.peek(key) is None:
+            card, complete = render_card(*key)
+            if complete:
+                CARD_CACHE.put(key, card)
+    return CARD_CACHE.stats()["size"]
+
+# --- 版面範本：背景只轉換一次，每種張數的卡片位置只計算一次 ---
+BACKGROUND_RGBA = BACKGROUND.convert("RGBA")
+CARD_SIZE = 160
+GRID_COLS = 5
+GRID_CELL = (120, 140) # 卡片在格線中的間距 (卡片彼此重疊)
+GRID_PADDING = 10
+
+@dataclass(frozen=True)
+class Layout:
+    """n 張卡片的版面；slots[i] = (背景上的位置, 卡片上的裁切範圍)，完全在畫面外時為 None。"""
+    count: int
+    slots: tuple
+
+def _clip(rect, bounds):
+    left, top, right, bottom = rect
+    b_left, b_top, b_right, b_bottom = bounds
+    return max(left, b_left), max(top, b_top), min(right, b_right), min(bottom, b_bottom)
+
+@functools.lru_cache(maxsize=64)
+def get_layout(count: int) -> Layout:
+    """計算 count 張卡片的位置。多張時卡片排成每行 5 張的格線並置中，超出格線範圍的部分會被裁掉。"""
+    bg_width, bg_height = BACKGROUND_RGBA.size
+    bg_rect = (0, 0, bg_width, bg_height)
+    if count == 1:
+        x = (bg_width - CARD_SIZE) // 2
+        y = (bg_height - CARD_SIZE) // 2
+        card_rects = [(x, y, x + CARD_SIZE, y + CARD_SIZE)]
+        bounds = bg_rect
+    else:
+        cell_width, cell_height = GRID_CELL
+        rows = math.ceil(count / GRID_COLS)
+        grid_width = GRID_COLS * cell_width + GRID_PADDING * 2
+        grid_height = rows * cell_height + GRID_PADDING * 2
+        grid_x = (bg_width - grid_width) // 2
+        grid_y = (bg_height - grid_height) // 2
+        card_rects = []
+        for i in range(count):
+            x = grid_x + GRID_PADDING + (i % GRID_COLS * cell_width) + (cell_width - CARD_SIZE) // 2
+            y = grid_y + GRID_PADDING + (i // GRID_COLS * cell_height) + (cell_height - CARD_SIZE) // 2
+            card_rects.append((x, y, x + CARD_SIZE, y + CARD_SIZE))
+        bounds = _clip((grid_x, grid_y, grid_x + grid_width, grid_y + grid_height), bg_rect)
+
+    slots = []
+    for x, y, _, _ in card_rects:
+        left, top, right, bottom = _clip((x, y, x + CARD_SIZE, y + CARD_SIZE), bounds)
+        if right <= left or bottom <= top: # 完全在畫面外
+            slots.append(None)
+        else:
+            slots.append(((left, top), (left - x, top - y, right - x, bottom - y)))
+    return Layout(count, tuple(slots))
+
+LAYOUTS = {count: get_layout(count) for count in (1, 10)} # 單抽與十連在 import 時就算好
+
+def compose_results(card_keys: list) -> PIL.Image.Image:
+    """把抽到的卡片直接合成到背景範本的副本上 (尚未編碼)。"""
+    final_bg_image = BACKGROUND_RGBA.copy()
+    if not card_keys:
+        return final_bg_image
+    layout = get_layout(len(card_keys))
+    for key, slot in zip(card_keys, layout.slots):
+        if slot is not None:
+            final_bg_image.alpha_composite(get_card(key), *slot)
+    return final_bg_image
+
+# --- 編碼模式：在檔案大小與編碼時間之間取捨 ---
+def _save(image: PIL.Image.Image, **params) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, **params)
+    return buffer.getvalue()
+
+ENCODERS = {
+    # 名稱: (副檔名, 編碼函式)
+    "png": ("png", lambda image: _save(image, format="PNG")), # 預設 (zlib level 6)
+    "png_fast": ("png", lambda image: _save(image, format="PNG", compress_level=1)),
+    "png_palette": ("png", lambda image: _save(
+        image.quantize(colors=256, method=PIL.Image.Quantize.FASTOCTREE), format="PNG", compress_level=6
+    )),
+    "webp_lossless": ("webp", lambda image: _save(image, format="WEBP", lossless=True, quality=25, method=0)),
+    "webp": ("webp", lambda image: _save(image, format="WEBP", quality=85, method=4)),
+    "compact": ("png", lambda image: _save(image.reduce(COMPACT_FACTOR), format="PNG", compress_level=1)),
+}
+DEFAULT_ENCODER = "png"
+
+def encoder_extension(encoder: str) -> str:
+    return ENCODERS.get(encoder, ENCODERS[DEFAULT_ENCODER])[0]
+
+def encode_image(image: PIL.Image.Image, encoder: str = DEFAULT_ENCODER) -> bytes:
+    return ENCODERS.get(encoder, ENCODERS[DEFAULT_ENCODER])[1](image)
+
+def render_results(card_keys: list, encoder: str = DEFAULT_ENCODER) -> bytes:
+    """合成抽卡結果圖，直接在記憶體中以指定的模式編碼並回傳位元組。"""
+    return encode_image(compose_results(card_keys), encoder)
@@ -0,0 +1,87 @@
+# cogs/utils/gacha_snapshot.py
+# 抽卡用的不可變資料快照：學生名冊、兩個伺服器的卡池、編譯好的抽卡表與卡池期數
+# 資料更新後在背景執行緒建立新的快照，再由 Gacha cog 以單一參照替換發布；
+# 進行中的互動持有舊快照的參照，會在舊資料上完成
+from dataclasses import dataclass, field
+
+from . import gacha_db, gacha_engine, gacha_odds
+from .student_catalog import StudentCatalog
+
+SERVERS = ("global", "japan")
+
+
+@dataclass(frozen=True)
+class GachaSnapshot:
+    """某一次資料更新後的完整抽卡資料。
+
+    banners[server] 與 compiled[server] 以卡池索引對應 (compiled 最後一個為常駐表)，
+    banner_slots 為卡池登錄編號 -> (伺服器, 卡池索引)。
+    學生索引只在同一份快照內有意義，抽卡與繪圖必須使用同一份快照。
+    """
+    catalog: StudentCatalog
+    banners: dict
+    compiled: dict
+    history_epochs: dict  # 與卡池一起載入：抽卡與查詢都記在這些卡池所屬的那一期
+    banner_slots: dict
+    odds_cache: dict = field(default_factory=dict, compare=False)  # (server, choice) -> BannerOdds
+
+    def get_banner(self, server: str, choice: int) -> dict:
+        return self.banners[server][choice]
+
+    def get_compiled_banner(self, server: str, choice: int):
+        compiled = self.compiled[server]
+        if not 0 <= choice < len(compiled) - 1:
+            choice = -1  # 沒有選擇卡池或卡池已不存在，使用常駐表
+        return compiled[choice]
+
+    def pull_logic(self, server: str, choice: int, last_pull: bool):
+        """抽一次卡，回傳 (學生索引, 稀有度代碼)；機率與卡池內容已在建立快照時編譯好，這裡只需查表。"""
+        return self.get_compiled_banner(server, choice).draw(last_pull)
+
+    def pull_many(self, server: str, choice: int, n: int, rng=None):
+        """一次抽 n 次 (每第 10 抽有 SR 保底)，回傳 (類別, 學生索引) 兩個 NumPy 陣列。"""
+        return self.get_compiled_banner(server, choice).draw_many(n, rng)
+
+    def get_banner_odds(self, server: str, choice: int):
+        """取得卡池的精確機率 (依 (server, choice) 快取，快取隨快照一起替換)。"""
+        key = (server, choice)
+        odds = self.odds_cache.get(key)
+        if odds is None:
+            odds = self.odds_cache[key] = gacha_odds.compute_odds(self.get_compiled_banner(server, choice))
+        return odds
+
+    def card_key(self, result: tuple) -> tuple:
+        """(學生索引, 稀有度代碼) → 繪圖用的 (學生 id, 顯示稀有度)。"""
+        student_idx, rarity_code = result
+        student_id = self.catalog.student_id(student_idx) if student_idx >= 0 else 0
+        return student_id, gacha_engine.RARITY_DISPLAYS[rarity_code]
+
+    def warm_card_keys(self) -> set:
+        """當期 Pick Up 與所有三星角色的卡片。"""
+        keys = set()
+        for server in SERVERS:
+            for compiled in self.compiled[server]:
+                for category in gacha_engine.SSR_CATEGORIES:
+                    for result in compiled.results[category]:
+                        if result[0] >= 0:
+                            keys.add(self.card_key(result))
+        return keys
+
+
+def load_snapshot() -> GachaSnapshot:
+    """從資料庫讀取並編譯一份新的快照 (會阻塞，請在執行緒中呼叫)。"""
+    catalog = gacha_db.get_student_catalog() # 兩個伺服器共用的學生名冊
+    banners = {server: tuple(gacha_db.get_current_banners(server)) for server in SERVERS}
+    banner_slots = {}
+    for server in SERVERS:
+        for i, banner in enumerate(banners[server]):
+            banner_slots.setdefault(banner["id"], (server, i))
+    # 預先編譯每個卡池的抽卡表 (最後一個為常駐表)
+    compiled = {server: tuple(gacha_engine.compile_server(server, catalog, list(banners[server]))) for server in SERVERS}
+    return GachaSnapshot(
+        catalog=catalog,
+        banners=banners,
+        compiled=compiled,
+        history_epochs=gacha_db.get_history_epochs(),
+        banner_slots=banner_slots,
+    )
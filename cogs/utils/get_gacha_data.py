@@ -1,18 +1,38 @@
-import requests
+import asyncio
+import hashlib
 import json
 from pathlib import Path
 import sqlite3
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import datetime
 import pytz
+import aiohttp
+
+from . import http_cache, http_client, icon_store, schema
 
 pwd = Path(__file__).parent.parent
 DB_PATH = pwd / "../gacha_data/gacha_data.db"
 IMAGE_DIR = pwd / "../gacha_data/images"
+HTTP_CACHE_DIR = pwd / "../gacha_data/http_cache"
+UPDATE_STATE_PATH = pwd / "../gacha_data/update_state.json" # 上次成功寫入資料庫的資料來源指紋
 UTC_PLUS_9 = pytz.timezone('Etc/GMT-9')
 SIMULATED_TIME_UTC9 = None
 
+API_URLS = {"char_jp": "https://schaledb.com/data/jp/students.min.json", 
+            "char_tw": "https://schaledb.com/data/tw/students.min.json", "char_en": "https://schaledb.com/data/en/students.min.json", 
+            "banner_jp": "https://raw.githubusercontent.com/electricgoat/ba-data/refs/heads/jp/DB/ShopRecruitExcelTable.json", 
+            "banner_gl": "https://raw.githubusercontent.com/electricgoat/ba-data/refs/heads/global/Excel/ShopRecruitExcelTable.json"}
+ICON_URL = "https://schaledb.com/images/student/icon/{student_id}.webp"
+REQUIRED_SOURCES = ("char_jp", "banner_jp", "banner_gl")
+VALID_BANNER_TYPES = ["PickupGacha", "NormalGacha", "LimitedGacha", "FesGacha"]
+# fetch_cached 的結果：內容有更新 / 伺服器回 304 / 連線失敗改用快取
+FETCH_MODIFIED, FETCH_NOT_MODIFIED, FETCH_STALE = "modified", "not_modified", "stale"
+
+# 卡池變更時只把該伺服器的期數加一，舊記錄之後由 gacha_db.prune_history_batch 在背景分批刪除
+ADVANCE_HISTORY_EPOCH = "UPDATE history_epochs SET epoch = epoch + 1, started_at = ? WHERE server = ?"
+SELECT_BANNER_ID = "SELECT id FROM banners WHERE server = ? AND gacha_type = ? AND rateup_id = ? AND sale_from = ? AND sale_to = ?"
+INSERT_BANNER = "INSERT INTO banners (server, gacha_type, rateup_id, sale_from, sale_to) VALUES (?, ?, ?, ?, ?)"
+
 def initialize_database():
     """初始化資料庫和資料夾，僅建立表結構，不刪除核心資料。"""
     IMAGE_DIR.mkdir(parents=True, exist_ok=True)
@@ -27,26 +47,43 @@ def initialize_database():
     )""")
     
     cur.execute("DROP TABLE IF EXISTS current_banner_jp")
-    cur.execute("CREATE TABLE current_banner_jp (type TEXT, rateup_id INTEGER)")
+    cur.execute("CREATE TABLE current_banner_jp (type TEXT, rateup_id INTEGER, banner_id INTEGER)")
     
     cur.execute("DROP TABLE IF EXISTS current_banner_gl") 
-    cur.execute("CREATE TABLE current_banner_gl (type TEXT, rateup_id INTEGER)")
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS gacha_history (
-        id INTEGER PRIMARY KEY,
-        user_id INTEGER NOT NULL,
-        char_id INTEGER NOT NULL,
-        char_name TEXT NOT NULL,
-        rarity TEXT NOT NULL,
-        banner_name TEXT NOT NULL,
-        server TEXT NOT NULL,
-        pull_time TEXT NOT NULL
-    )""")
+    cur.execute("CREATE TABLE current_banner_gl (type TEXT, rateup_id INTEGER, banner_id INTEGER)")
 
     con.commit()
+    schema.migrate(con) # 抽卡記錄等資料表依 PRAGMA user_version 升級到目前版本
     con.close()
 
+def migrate_database():
+    """只升級資料庫結構 (不會刪除記錄)；啟動時跳過首次更新的情況使用。"""
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(DB_PATH)
+    try:
+        schema.migrate(con)
+    finally:
+        con.close()
+
+def register_banner(cur, server: str, gacha_type: str, rateup_id, sale_from: int, sale_to: int) -> int:
+    """取得卡池在 banners 登錄表中的編號，第一次出現時登錄。
+
+    rateup_id 為 None (常駐) 時記為 0；sale_from / sale_to 為開放期間的 UNIX 秒。
+    """
+    key = (schema.SERVER_CODES[server], gacha_type, rateup_id or 0)
+    cur.execute(SELECT_BANNER_ID, key + (sale_from, sale_to))
+    row = cur.fetchone()
+    if row:
+        return row[0]
+    # 結構遷移時登錄的卡池沒有開放期間 (0, 0)：補上期間並沿用同一個編號，抽卡記錄不會中斷
+    cur.execute(SELECT_BANNER_ID, key + (0, 0))
+    row = cur.fetchone()
+    if row:
+        cur.execute("UPDATE banners SET sale_from = ?, sale_to = ? WHERE id = ?", (sale_from, sale_to, row[0]))
+        return row[0]
+    cur.execute(INSERT_BANNER, key + (sale_from, sale_to))
+    return cur.lastrowid
+
 def set_simulated_time(year=None, month=None, day=None, hour=0, minute=0, second=0):
     global SIMULATED_TIME_UTC9
     if year and month and day:
@@ -63,22 +100,106 @@ def set_simulated_time(year=None, month=None, day=None, hour=0, minute=0, second
         print("模擬時間已清除，將使用實際當前時間。")
         return True, None
 
-def fetch_url(url, is_json=True):
+async def fetch_cached(client: http_client.HttpClient, cache: http_cache.ResponseCache, url: str):
+    """以條件式請求下載，回傳 (內容, 狀態)；下載失敗且沒有快取時內容為 None。"""
     try:
-        response = requests.get(url, timeout=15)
-        response.raise_for_status()
-        return response.json() if is_json else response.content
-    except requests.exceptions.RequestException as e:
-        print(f"下載失敗: {url}, 錯誤: {e}")
-        return None
+        status, body, headers = await client.get(url, headers=cache.conditional_headers(url))
+        if status == 304:
+            cached = await asyncio.to_thread(cache.load, url) # 讀檔 + 雜湊數 MB 的內容，不在事件迴圈上做
+            if cached is not None:
+                return cached, FETCH_NOT_MODIFIED
+            status, body, headers = await client.get(url) # 快取的內容不見了，重新完整下載
+        if status != 200:
+            raise http_client.HttpStatusError(url, status)
+        await asyncio.to_thread(cache.store, url, body, headers)
+        return body, FETCH_MODIFIED
+    except (http_client.HttpStatusError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        cached = await asyncio.to_thread(cache.load, url)
+        print(f"下載失敗: {url}, 錯誤: {e!r}{'，改用上次下載的內容' if cached is not None else ''}")
+        return cached, FETCH_STALE
+
+async def fetch_sources(client: http_client.HttpClient, urls: dict = None):
+    """同時下載所有資料來源，回傳 ({來源: 內容 bytes}, {來源: 狀態})。"""
+    urls = urls or API_URLS
+    cache = http_cache.ResponseCache(HTTP_CACHE_DIR)
+    results = await asyncio.gather(*(fetch_cached(client, cache, url) for url in urls.values()))
+    bodies = {key: body for key, (body, _) in zip(urls, results)}
+    statuses = {key: status for key, (_, status) in zip(urls, results)}
+    return bodies, statuses
+
+def sources_fingerprint(bodies: dict) -> str:
+    """所有資料來源內容的雜湊；與上次寫入時相同代表資料沒有變動。"""
+    digest = hashlib.sha256()
+    for key in sorted(bodies):
+        digest.update(key.encode("utf-8"))
+        digest.update(hashlib.sha256(bodies[key] or b"").digest())
+    return digest.hexdigest()
+
+def load_update_state() -> dict:
+    try:
+        with open(UPDATE_STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
 
-def download_and_save_image(student_id, save_path):
-    url = f"https://schaledb.com/images/student/icon/{student_id}.webp"
-    image_data = fetch_url(url, is_json=False)
-    if image_data:
-        with open(save_path, "wb") as f: f.write(image_data)
-        return True
-    return False
+def save_update_state(state: dict):
+    tmp_path = UPDATE_STATE_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1)
+    tmp_path.replace(UPDATE_STATE_PATH)
+
+def can_skip_update(fingerprint: str, now: datetime.datetime) -> bool:
+    """資料來源與上次寫入時相同、期間沒有卡池開始或結束，且上次的頭像都下載成功時，不需要重新寫入。"""
+    if SIMULATED_TIME_UTC9 is not None: # 手動設定模擬時間時一律重新計算卡池
+        return False
+    state = load_update_state()
+    if state.get("fingerprint") != fingerprint or not state.get("complete"):
+        return False
+    valid_until = state.get("valid_until")
+    if valid_until is not None and now.timestamp() >= valid_until:
+        return False
+    return is_database_data_sufficient()
+
+def next_banner_change(data, current_time: datetime.datetime):
+    """current_time 之後第一個卡池開始或結束的時間 (UNIX 秒)，沒有時回傳 None。"""
+    if not data or not isinstance(data.get("DataList"), list): return None
+    now = int(current_time.timestamp())
+    boundaries = []
+    for banner in data["DataList"]:
+        if banner.get("IsLegacy") or banner.get("CategoryType") not in VALID_BANNER_TYPES: continue
+        try:
+            start = int(UTC_PLUS_9.localize(datetime.datetime.strptime(banner["SalePeriodFrom"], "%Y-%m-%d %H:%M:%S")).timestamp())
+            end = int(UTC_PLUS_9.localize(datetime.datetime.strptime(banner["SalePeriodTo"], "%Y-%m-%d %H:%M:%S")).timestamp())
+        except (ValueError, KeyError): continue
+        boundaries += [t for t in (start, end + 1) if t > now] # 結束時間當下仍在開放中，下一秒才結束
+    return min(boundaries, default=None)
+
+async def download_and_save_image(client: http_client.HttpClient, student_id, save_path: Path) -> bool:
+    url = ICON_URL.format(student_id=student_id)
+    try:
+        status, image_data, _ = await client.get(url)
+    except (http_client.HttpStatusError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"下載失敗: {url}, 錯誤: {e!r}")
+        return False
+    if not image_data:
+        return False
+    await asyncio.to_thread(save_path.write_bytes, image_data)
+    return True
+
+async def download_images(client: http_client.HttpClient, image_tasks: list) -> list:
+    """同時下載缺少的頭像 (共用連線池，同時數量由 client 限制)，回傳每張是否成功。"""
+    if not image_tasks:
+        return []
+    progress = tqdm(total=len(image_tasks), desc="下載學生頭像")
+    async def download(student_id, save_path):
+        try:
+            return await download_and_save_image(client, student_id, save_path)
+        finally:
+            progress.update()
+    try:
+        return await asyncio.gather(*(download(*task) for task in image_tasks))
+    finally:
+        progress.close()
 
 def process_student_data(region_data, region_key, students_dict):
     student_iterable = region_data.values() if isinstance(region_data, dict) else region_data
@@ -92,15 +213,53 @@ def process_student_data(region_data, region_key, students_dict):
             if region_key == "char_tw": students_dict[char_id]["name_tw"] = char.get("Name")
             elif region_key == "char_en": students_dict[char_id]["name_en"] = char.get("Name")
 
-def update():
-    print("<<<<< 開始更新轉蛋資料 >>>>>")
+def get_banners_from_db(cur, table_name):
+    try:
+        cur.execute(f"SELECT banner_id FROM {table_name}")
+        return {row[0] for row in cur.fetchall()}
+    except sqlite3.OperationalError:
+        return set()
 
-    def get_banners_from_db(cur, table_name):
-        try:
-            cur.execute(f"SELECT type, rateup_id FROM {table_name}")
-            return {tuple(row) for row in cur.fetchall()}
-        except sqlite3.OperationalError:
-            return set()
+def prepare_update(bodies: dict, statuses: dict):
+    """決定是否需要更新並解析下載的資料；需要時回傳更新計畫，中止或略過時回傳 None。"""
+    if not all(bodies.get(k) for k in REQUIRED_SOURCES):
+        print("一個或多個必要的 API 資料獲取失敗，更新中止。")
+        return None
+    changed = sorted(key for key, status in statuses.items() if status == FETCH_MODIFIED)
+    print(f"資料來源有更新的：{', '.join(changed) if changed else '無'}")
+
+    # 先以原始內容判斷是否略過，沒有變動時不必解析數 MB 的 JSON
+    current_time = SIMULATED_TIME_UTC9 if SIMULATED_TIME_UTC9 else datetime.datetime.now(UTC_PLUS_9)
+    fingerprint = sources_fingerprint(bodies)
+    if can_skip_update(fingerprint, current_time):
+        print("資料來源沒有變動，也沒有卡池開始或結束，略過這次更新。")
+        return None
+
+    try:
+        api_data = {key: json.loads(body) if body else None for key, body in bodies.items()}
+    except ValueError as e:
+        print(f"API 資料格式錯誤 ({e})，更新中止。")
+        return None
+    if not all(api_data.get(k) for k in REQUIRED_SOURCES):
+        print("一個或多個必要的 API 資料內容是空的，更新中止。")
+        return None
+
+    students = {}
+    process_student_data(api_data.get("char_jp"), "char_jp", students)
+    process_student_data(api_data.get("char_tw"), "char_tw", students)
+    process_student_data(api_data.get("char_en"), "char_en", students)
+    return {
+        "api_data": api_data,
+        "students": students,
+        "image_tasks": [(sid, IMAGE_DIR / f"{sid}.png") for sid in students if not (IMAGE_DIR / f"{sid}.png").exists()],
+        "fingerprint": fingerprint,
+        "current_time": current_time,
+        "simulated": SIMULATED_TIME_UTC9 is not None,
+    }
+
+def apply_update(plan: dict, downloaded: list):
+    """把 prepare_update 的計畫寫入資料庫，並更新處理好的頭像與圖集 (會阻塞，請在執行緒中呼叫)。"""
+    api_data, students, current_time = plan["api_data"], plan["students"], plan["current_time"]
 
     con = sqlite3.connect(DB_PATH)
     cur = con.cursor()
@@ -111,31 +270,11 @@ def update():
 
     initialize_database() # 這會清空 banner 表，建立其他不存在的表
 
-    api_urls = {"char_jp": "https://schaledb.com/data/jp/students.min.json", 
-                "char_tw": "https://schaledb.com/data/tw/students.min.json", "char_en": "https://schaledb.com/data/en/students.min.json", 
-                "banner_jp": "https://raw.githubusercontent.com/electricgoat/ba-data/refs/heads/jp/DB/ShopRecruitExcelTable.json", 
-                "banner_gl": "https://raw.githubusercontent.com/electricgoat/ba-data/refs/heads/global/Excel/ShopRecruitExcelTable.json"}
-    api_data = {}
-
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_url = {executor.submit(fetch_url, url): key for key, url in api_urls.items()}
-        for future in as_completed(future_to_url):
-            api_data[future_to_url[future]] = future.result()
-    if not all(api_data.get(k) for k in ["char_jp", "banner_jp", "banner_gl"]):
-        print("一個或多個必要的 API 資料獲取失敗，更新中止。")
-        return
-
-    students = {}
-    process_student_data(api_data.get("char_jp"), "char_jp", students)
-    process_student_data(api_data.get("char_tw"), "char_tw", students)
-    process_student_data(api_data.get("char_en"), "char_en", students)
-    image_tasks = [(sid, IMAGE_DIR / f"{sid}.png") for sid in students if not (IMAGE_DIR / f"{sid}.png").exists()]
-    if image_tasks:
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            list(tqdm(executor.map(lambda p: download_and_save_image(*p), image_tasks), total=len(image_tasks), desc="下載學生頭像"))
-
-    current_time = SIMULATED_TIME_UTC9 if SIMULATED_TIME_UTC9 else datetime.datetime.now(UTC_PLUS_9)
-    VALID_BANNER_TYPES = ["PickupGacha", "NormalGacha", "LimitedGacha", "FesGacha"]
+    # 產生抽卡畫面直接使用的頭像 (縮放 + 遮罩)，只重建來源有變動的
+    built, skipped = icon_store.update_render_icons(IMAGE_DIR, students.keys())
+    print(f"處理好的學生頭像：重建 {built} 張，沿用 {skipped} 張。")
+    if built or not icon_store.atlas_is_current(students.keys()):
+        print(f"頭像圖集已重建，共 {icon_store.build_atlas(students.keys())} 張。")
 
     def process_new_banners(data):
         if not data or not isinstance(data.get("DataList"), list): return []
@@ -144,55 +283,92 @@ def update():
             if banner.get("IsLegacy") or banner.get("CategoryType") not in VALID_BANNER_TYPES: continue
             try:
                 start, end = datetime.datetime.strptime(banner["SalePeriodFrom"], "%Y-%m-%d %H:%M:%S"), datetime.datetime.strptime(banner["SalePeriodTo"], "%Y-%m-%d %H:%M:%S")
-                if UTC_PLUS_9.localize(start) <= current_time <= UTC_PLUS_9.localize(end):
+                start, end = UTC_PLUS_9.localize(start), UTC_PLUS_9.localize(end)
+                if start <= current_time <= end:
                     rateup_id = banner.get("InfoCharacterId", [None])[0] if banner["CategoryType"] != "NormalGacha" else None
-                    active_banners.append((banner["CategoryType"], rateup_id))
+                    active_banners.append((banner["CategoryType"], rateup_id, int(start.timestamp()), int(end.timestamp())))
             except (ValueError, KeyError): continue
         return active_banners
 
-    new_jp_banners_list = process_new_banners(api_data.get("banner_jp"))
-    new_gl_banners_list = process_new_banners(api_data.get("banner_gl"))
-    
-    new_jp_banners_set = set(new_jp_banners_list)
-    new_gl_banners_set = set(new_gl_banners_list)
-
     con = sqlite3.connect(DB_PATH) # 重新連線
     cur = con.cursor()
 
-    history_cleared_jp = False
-    history_cleared_gl = False
+    # 每個卡池 (伺服器, 類型, Pick Up, 開放期間) 對應到固定的登錄編號
+    new_jp_banners_list = [
+        (gacha_type, rateup_id, register_banner(cur, "japan", gacha_type, rateup_id, sale_from, sale_to))
+        for gacha_type, rateup_id, sale_from, sale_to in process_new_banners(api_data.get("banner_jp"))
+    ]
+    new_gl_banners_list = [
+        (gacha_type, rateup_id, register_banner(cur, "global", gacha_type, rateup_id, sale_from, sale_to))
+        for gacha_type, rateup_id, sale_from, sale_to in process_new_banners(api_data.get("banner_gl"))
+    ]
+    new_jp_banners_set = {banner_id for _, _, banner_id in new_jp_banners_list}
+    new_gl_banners_set = {banner_id for _, _, banner_id in new_gl_banners_list}
 
-    #Fix for issue  清空抽卡記錄
+    # 卡池變更時進入新的一期：舊記錄不再被查詢到，之後在背景分批刪除 (不在這裡整批 DELETE)
+    epoch_started_at = datetime.datetime.now(UTC_PLUS_9).strftime('%Y-%m-%d %H:%M:%S')
+    rotated = False
 
     if old_jp_banners != new_jp_banners_set:
-        print("偵測到日服卡池變更，正在清空日服伺服器的抽卡記錄...") 
-        cur.execute("DELETE FROM gacha_history WHERE server = ?", ('japan',)) #
-        history_cleared_jp = True
+        print("偵測到日服卡池變更，日服的抽卡記錄進入新的一期。")
+        cur.execute(ADVANCE_HISTORY_EPOCH, (epoch_started_at, schema.SERVER_CODES['japan']))
+        rotated = True
     else:
-        print("日服卡池沒有變更，抽卡記錄不需要清空。")
+        print("日服卡池沒有變更，抽卡記錄維持目前這期。")
 
     if old_gl_banners != new_gl_banners_set:
-        print("偵測到國際服卡池變更，正在清空國際服伺服器的抽卡記錄...") 
-        cur.execute("DELETE FROM gacha_history WHERE server = ?", ('global',))
-        history_cleared_gl = True
+        print("偵測到國際服卡池變更，國際服的抽卡記錄進入新的一期。")
+        cur.execute(ADVANCE_HISTORY_EPOCH, (epoch_started_at, schema.SERVER_CODES['global']))
+        rotated = True
     else:
-        print("國際服卡池沒有變更，抽卡記錄不需要清空。")
+        print("國際服卡池沒有變更，抽卡記錄維持目前這期。")
 
-    if not history_cleared_jp and not history_cleared_gl:
-        print("沒有偵測到卡池變更，抽卡記錄不需要清空。")
+    if not rotated:
+        print("沒有偵測到卡池變更，抽卡記錄不需要換期。")
     
 
     cur.executemany("INSERT OR REPLACE INTO students_list VALUES (?, ?, ?, ?, ?, ?, ?)", [tuple(s.values()) for s in students.values()])
     if new_jp_banners_list:
-        cur.executemany("INSERT INTO current_banner_jp (type, rateup_id) VALUES (?, ?)", new_jp_banners_list)
+        cur.executemany("INSERT INTO current_banner_jp (type, rateup_id, banner_id) VALUES (?, ?, ?)", new_jp_banners_list)
     if new_gl_banners_list:
-        cur.executemany("INSERT INTO current_banner_gl (type, rateup_id) VALUES (?, ?)", new_gl_banners_list)
+        cur.executemany("INSERT INTO current_banner_gl (type, rateup_id, banner_id) VALUES (?, ?, ?)", new_gl_banners_list)
     
     cur.execute("DELETE FROM students_list WHERE id = ?", (10099,))
     con.commit()
     con.close()
-    
+
+    # 記下這次寫入的資料來源；下次來源沒變動且還沒到卡池開始/結束的時間時就不必重做
+    # 模擬時間寫入的是那個時間點的卡池，記為未完成，清除模擬時間後的第一次更新一定重新寫入
+    changes = [t for t in (next_banner_change(api_data.get(k), current_time) for k in ("banner_jp", "banner_gl")) if t is not None]
+    complete = all(downloaded) and not plan["simulated"]
+    save_update_state({"fingerprint": plan["fingerprint"], "valid_until": min(changes, default=None), "complete": complete})
+
+async def update_async() -> bool:
+    """下載資料來源並寫入資料庫；回傳是否有寫入新資料 (所有來源都沒有變動時略過，回傳 False)。
+
+    下載都在事件迴圈上以共用的連線池進行，只有解析、頭像處理與資料庫寫入交給執行緒。
+    """
+    print("<<<<< 開始更新轉蛋資料 >>>>>")
+    await asyncio.to_thread(migrate_database) # 先升級結構，舊的卡池才有登錄編號可以比較
+    IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+
+    async with http_client.HttpClient() as client:
+        # 先下載：必要的資料拿不到時不動資料庫，目前的卡池維持原樣
+        bodies, statuses = await fetch_sources(client)
+        plan = await asyncio.to_thread(prepare_update, bodies, statuses)
+        if plan is None:
+            print(">>>>> 轉蛋資料沒有更新 >>>>>")
+            return False
+        downloaded = await download_images(client, plan["image_tasks"])
+        print(f"HTTP 請求 {client.requests} 次 (重試 {client.retries} 次)。")
+
+    await asyncio.to_thread(apply_update, plan, downloaded)
     print(">>>>> 轉蛋資料更新結束 >>>>>")
+    return True
+
+def update() -> bool:
+    """同 update_async，給沒有事件迴圈的腳本使用。"""
+    return asyncio.run(update_async())
 
 # --- 新增函式：檢查資料庫是否有足夠資料 ---
 def is_database_data_sufficient() -> bool:
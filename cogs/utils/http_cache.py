@@ -0,0 +1,84 @@
+# cogs/utils/http_cache.py
+# 資料來源的磁碟回應快取：記下每個網址的 ETag / Last-Modified 與內容，
+# 下次以條件式請求 (If-None-Match / If-Modified-Since) 下載，304 或連線失敗時沿用快取的內容
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+INDEX_NAME = "index.json"
+INDEX_VERSION = 1
+
+
+def body_name(url: str) -> str:
+    return f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]}.body"
+
+
+class ResponseCache:
+    """網址 -> (驗證標頭, 內容) 的磁碟快取；可由多個下載執行緒同時使用。
+
+    內容與索引都先寫到暫存檔再替換，更新到一半中斷也不會留下不完整的快取。
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._entries = self._load_index()
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.directory / INDEX_NAME, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return index.get("entries", {}) if index.get("version") == INDEX_VERSION else {}
+
+    def _save_index(self):
+        index_path = self.directory / INDEX_NAME
+        tmp_path = index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "entries": self._entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
+        tmp_path.replace(index_path)
+
+    def load(self, url: str):
+        """快取的內容；沒有快取或檔案與記錄的雜湊不符時回傳 None。"""
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None:
+            return None
+        try:
+            body = (self.directory / entry["file"]).read_bytes()
+        except FileNotFoundError:
+            return None
+        return body if hashlib.sha256(body).hexdigest() == entry["sha256"] else None
+
+    def conditional_headers(self, url: str) -> dict:
+        """條件式請求的標頭；只有快取的內容還在時才帶上，否則 304 之後沒有內容可用。"""
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None or not (self.directory / entry["file"]).exists():
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url: str, body: bytes, headers) -> str:
+        """記下 200 回應的內容與驗證標頭，回傳內容的 SHA-256。"""
+        digest = hashlib.sha256(body).hexdigest()
+        name = body_name(url)
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = (self.directory / name).with_suffix(".tmp")
+            tmp_path.write_bytes(body)
+            tmp_path.replace(self.directory / name)
+            self._entries[url] = {
+                "file": name,
+                "sha256": digest,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+            }
+            self._save_index()
+        return digest
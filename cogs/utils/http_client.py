@@ -0,0 +1,74 @@
+# cogs/utils/http_client.py
+# 資料更新用的共用 HTTP 連線池 (aiohttp)：keep-alive 重用連線、限制每個主機的連線數與同時請求數，
+# 連線錯誤、逾時、429 與 5xx 以隨機抖動的指數退避重試
+import asyncio
+import random
+
+import aiohttp
+
+CONNECTION_LIMIT = 16  # 所有主機合計的連線數
+LIMIT_PER_HOST = 6  # 每個主機最多幾條連線 (頭像都在同一個主機上，靠 keep-alive 重用)
+MAX_CONCURRENCY = 32  # 同時進行中的請求數；超過的在 semaphore 上等待，不會佔用連線
+KEEPALIVE_TIMEOUT = 30  # 秒；閒置的連線保留多久
+REQUEST_TIMEOUT = 15  # 秒；單次請求 (含讀取內容) 的上限
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 0.5  # 秒；第 n 次重試前等待 0 ~ BACKOFF_BASE * 2^n 之間的隨機時間
+BACKOFF_MAX = 8
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class HttpStatusError(Exception):
+    """重試後仍不是 200 / 304 的回應。"""
+
+    def __init__(self, url: str, status: int):
+        super().__init__(f"{url} 回應 HTTP {status}")
+        self.url = url
+        self.status = status
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次 (從 0 開始) 重試前的等待時間 (full jitter)。"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class HttpClient:
+    """一次資料更新共用的 aiohttp session；以 async with 使用，結束時關閉所有連線。"""
+
+    def __init__(self, concurrency: int = MAX_CONCURRENCY, limit_per_host: int = LIMIT_PER_HOST):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._connector_args = {"limit": CONNECTION_LIMIT, "limit_per_host": limit_per_host, "keepalive_timeout": KEEPALIVE_TIMEOUT}
+        self._session = None
+        self.requests = 0  # 實際送出的請求數 (含重試)
+        self.retries = 0
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(**self._connector_args),
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+    async def get(self, url: str, headers: dict = None):
+        """GET url，回傳 (狀態碼, 內容 bytes, 回應標頭)；只有 200 與 304 會回傳，其他狀態丟出 HttpStatusError。
+
+        連線錯誤與逾時重試後仍失敗時丟出 aiohttp.ClientError / asyncio.TimeoutError。
+        """
+        for attempt in range(MAX_ATTEMPTS):
+            last_attempt = attempt == MAX_ATTEMPTS - 1
+            try:
+                async with self._semaphore:
+                    self.requests += 1
+                    async with self._session.get(url, headers=headers) as response:
+                        if response.status in (200, 304):
+                            return response.status, await response.read(), response.headers
+                        status = response.status
+                if status not in RETRY_STATUSES or last_attempt:
+                    raise HttpStatusError(url, status)
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+                if last_attempt:
+                    raise
+            self.retries += 1
+            await asyncio.sleep(backoff_delay(attempt))
@@ -0,0 +1,193 @@
+# cogs/utils/icon_store.py
+# 學生頭像的「可直接合成」版本：下載時就先解碼、縮放並套上遮罩，抽卡時只需讀檔合成
+import hashlib
+import json
+import mmap
+from pathlib import Path
+
+import PIL.Image
+import PIL.ImageChops
+
+pwd = Path(__file__).parent.parent
+ASSETS_DIR = pwd.parent / "assets"
+RENDER_DIR = pwd / "../gacha_data/images_render"
+MANIFEST_NAME = "manifest.json"  # 記錄每張頭像的來源雜湊與處理版本
+ATLAS_INDEX_NAME = "atlas.json"  # 頭像圖集的索引：圖集檔名 + 每張頭像的 [位移, 寬, 高]
+ATLAS_VERSION = 1
+
+ICON_SCALE = 0.875  # create_single_image 使用的頭像縮放比例
+DERIVATIVE_VERSION = 1  # 處理方式改變時遞增，所有頭像會重新產生
+
+
+def load_mask(mask_path: Path = ASSETS_DIR / "mask.png") -> PIL.Image.Image:
+    """讀取並縮小頭像遮罩 (與頭像相同比例)。"""
+    with PIL.Image.open(mask_path) as original_mask:
+        new_size = (int(original_mask.width * ICON_SCALE), int(original_mask.height * ICON_SCALE))
+        return original_mask.resize(new_size, PIL.Image.Resampling.LANCZOS)
+
+
+def prepare_icon(icon: PIL.Image.Image, mask: PIL.Image.Image) -> PIL.Image.Image:
+    """把原始頭像轉成 RGBA、縮小並乘上遮罩。"""
+    icon = icon.convert("RGBA")
+    new_size = (int(icon.width * ICON_SCALE), int(icon.height * ICON_SCALE))
+    icon = icon.resize(new_size, PIL.Image.Resampling.LANCZOS)
+    return PIL.ImageChops.multiply(icon, mask)
+
+
+def render_icon_path(student_id: int) -> Path:
+    return RENDER_DIR / f"{student_id}.png"
+
+
+def load_manifest() -> dict:
+    try:
+        with open(RENDER_DIR / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest: dict):
+    manifest_path = RENDER_DIR / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    tmp_path.replace(manifest_path)
+
+
+def update_render_icons(image_dir: Path, student_ids) -> tuple:
+    """為每個學生產生處理好的頭像，只重建來源圖片有變動 (或版本不符) 的部分。
+
+    回傳 (重建數量, 略過數量)。
+    """
+    RENDER_DIR.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest()
+    mask = load_mask()
+    built = skipped = 0
+
+    for student_id in student_ids:
+        source_path = Path(image_dir) / f"{student_id}.png"
+        try:
+            source_bytes = source_path.read_bytes()
+        except FileNotFoundError:
+            continue
+        source_hash = hashlib.sha256(source_bytes).hexdigest()
+        entry = manifest.get(str(student_id))
+        target_path = render_icon_path(student_id)
+        if entry and entry.get("source_sha256") == source_hash and entry.get("version") == DERIVATIVE_VERSION and target_path.exists():
+            skipped += 1
+            continue
+
+        try:
+            with PIL.Image.open(source_path) as icon:
+                derivative = prepare_icon(icon, mask)
+        except Exception as e:
+            print(f"處理學生頭像 {student_id} 失敗: {e}")
+            continue
+        derivative.save(target_path, format="PNG", compress_level=1)  # 無損、解碼快
+        manifest[str(student_id)] = {"source_sha256": source_hash, "version": DERIVATIVE_VERSION}
+        built += 1
+
+    save_manifest(manifest)
+    return built, skipped
+
+
+# --- 頭像圖集：所有處理好的頭像以未壓縮的 RGBA 串接成單一檔案，抽卡時以 mmap 直接取用 ---
+def build_atlas(student_ids) -> int:
+    """把處理好的頭像打包成圖集，回傳收錄的頭像數。
+
+    圖集檔名包含內容雜湊，索引最後才以原子方式替換，
+    已經 mmap 舊圖集的行程不受影響。
+    """
+    tiles = {}
+    chunks = []
+    offset = 0
+    for student_id in sorted(set(int(sid) for sid in student_ids)):
+        try:
+            with PIL.Image.open(render_icon_path(student_id)) as icon:
+                data = icon.convert("RGBA").tobytes()
+                tiles[str(student_id)] = [offset, icon.width, icon.height]
+        except FileNotFoundError:
+            continue
+        chunks.append(data)
+        offset += len(data)
+
+    atlas_bytes = b"".join(chunks)
+    atlas_name = f"atlas_{hashlib.sha256(atlas_bytes).hexdigest()[:16]}.rgba"
+    atlas_path = RENDER_DIR / atlas_name
+    if not atlas_path.exists():
+        tmp_path = atlas_path.with_suffix(".tmp")
+        tmp_path.write_bytes(atlas_bytes)
+        tmp_path.replace(atlas_path)
+
+    index_path = RENDER_DIR / ATLAS_INDEX_NAME
+    tmp_path = index_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": ATLAS_VERSION, "file": atlas_name, "tiles": tiles}, f)
+    tmp_path.replace(index_path)
+
+    # 清掉舊的圖集 (Windows 上仍被 mmap 的檔案刪不掉，下次更新再試)
+    for old_path in RENDER_DIR.glob("atlas_*.rgba"):
+        if old_path.name != atlas_name:
+            try:
+                old_path.unlink()
+            except OSError:
+                pass
+    return len(tiles)
+
+
+def atlas_is_current(student_ids) -> bool:
+    """圖集是否存在且收錄了所有已處理的頭像。"""
+    index = _load_atlas_index()
+    if index is None or not (RENDER_DIR / index["file"]).exists():
+        return False
+    available = {str(sid) for sid in student_ids if render_icon_path(sid).exists()}
+    return available <= index["tiles"].keys()
+
+
+def _load_atlas_index():
+    try:
+        with open(RENDER_DIR / ATLAS_INDEX_NAME, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return index if index.get("version") == ATLAS_VERSION else None
+
+
+class IconAtlas:
+    """以 mmap 唯讀開啟的頭像圖集；tile() 回傳直接指向映射記憶體的圖片 (不複製)。
+
+    同一份圖集在多個繪圖行程中共用作業系統的 page cache。
+    """
+
+    def __init__(self, path: Path, tiles: dict):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self._tiles = {int(sid): tuple(tile) for sid, tile in tiles.items()}
+
+    @classmethod
+    def open(cls):
+        """開啟 RENDER_DIR 中目前的圖集，沒有 (或是空的) 時回傳 None。"""
+        index = _load_atlas_index()
+        if index is None or not index["tiles"]:
+            return None
+        try:
+            return cls(RENDER_DIR / index["file"], index["tiles"])
+        except (OSError, ValueError) as e:
+            print(f"開啟頭像圖集失敗: {e}")
+            return None
+
+    def __contains__(self, student_id: int) -> bool:
+        return student_id in self._tiles
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def tile(self, student_id: int):
+        """回傳唯讀的 RGBA 頭像，不在圖集中時回傳 None。"""
+        tile = self._tiles.get(student_id)
+        if tile is None:
+            return None
+        offset, width, height = tile
+        buffer = self._view[offset:offset + width * height * 4]
+        return PIL.Image.frombuffer("RGBA", (width, height), buffer, "raw", "RGBA", 0, 1)
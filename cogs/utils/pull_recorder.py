@@ -0,0 +1,112 @@
+# cogs/utils/pull_recorder.py
+# 抽卡記錄的延遲寫入：互動只把資料列放進記憶體佇列，背景工作定期以單一交易批次寫入
+import asyncio
+import time
+from collections import deque
+
+from . import gacha_db, stats_window
+
+FLUSH_SIZE = 500  # 累積到這麼多筆就立刻寫入
+FLUSH_INTERVAL = 0.5  # 秒；最多等待這麼久就寫入
+
+
+
+class PullRecorder:
+    """gacha_history 的 write-behind 佇列。
+
+    record() 在事件迴圈上呼叫，不會碰資料庫；背景工作每 FLUSH_INTERVAL 秒
+    (或累積 FLUSH_SIZE 筆時) 在執行緒中以 executemany 一次寫入。
+    close() 會寫完佇列中剩下的記錄。
+    """
+
+    def __init__(self, flush_size: int = FLUSH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending = deque()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()  # 一次只寫一批；等待中的 flush() 會等前一批提交後才回傳
+        self._task = None
+        self._closing = False
+        self.recorded = 0
+        self.flushed = 0
+        self.failed_flushes = 0
+        self.batches = 0
+        self.max_depth = 0
+        self._flush_times = stats_window.window()
+        self._batch_sizes = stats_window.window()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="pull-recorder")
+
+    def record(self, user_id: int, server: str, epoch: int, banner_id: int, pull_results: list, catalog):
+        """把一次抽卡的結果放進佇列 (抽卡時間與卡池期數在此時決定)。"""
+        rows = gacha_db.build_history_rows(user_id, server, epoch, banner_id, pull_results, catalog)
+        self._pending.extend(rows)
+        self.recorded += len(rows)
+        self.max_depth = max(self.max_depth, len(self._pending))
+        if len(self._pending) >= self.flush_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """把目前佇列中的記錄寫入資料庫，回傳寫入的筆數；失敗時記錄放回佇列等下次重試。
+
+        背景工作正在寫入時會先等那一批提交，回傳時呼叫前已放進佇列的記錄都已寫入 (或失敗放回)。
+        """
+        async with self._flush_lock:
+            return await self._flush_pending()
+
+    async def _flush_pending(self) -> int:
+        if not self._pending:
+            return 0
+        batch = list(self._pending)
+        self._pending.clear()
+        started_at = time.monotonic()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, gacha_db.insert_history_rows, batch)
+        except Exception as e:
+            self.failed_flushes += 1
+            self._pending.extendleft(reversed(batch))
+            print(f"寫入抽卡記錄時發生錯誤 ({len(batch)} 筆，稍後重試): {e}")
+            return 0
+        self._flush_times.append(time.monotonic() - started_at)
+        self._batch_sizes.append(len(batch))
+        self.flushed += len(batch)
+        self.batches += 1
+        return len(batch)
+
+    async def close(self):
+        """停止背景工作並寫完剩下的記錄 (cog 卸載、bot 關閉時呼叫)。"""
+        self._closing = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        while self._pending:
+            if not await self.flush():
+                break  # 資料庫無法寫入，放棄剩下的記錄
+        if self._pending:
+            print(f"警告：有 {len(self._pending)} 筆抽卡記錄無法寫入。")
+
+    def stats(self) -> dict:
+        """佇列深度與最近 STATS_WINDOW 次寫入的時間 (毫秒) 與批次大小。"""
+        return {
+            "depth": len(self._pending),
+            "max_depth": self.max_depth,
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "failed_flushes": self.failed_flushes,
+            "batches": self.batches,
+            "batch_p50": stats_window.percentile(self._batch_sizes, 50),
+            "flush_p50_ms": stats_window.ms(stats_window.percentile(self._flush_times, 50)),
+            "flush_p95_ms": stats_window.ms(stats_window.percentile(self._flush_times, 95)),
+        }
@@ -0,0 +1,209 @@
+# cogs/utils/render_pool.py
+# 抽卡結果圖的繪圖執行池：把 PIL 的解碼、合成與編碼移出 discord.py 的事件迴圈
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from . import gacha_render, icon_store, stats_window
+
+CONFIG_PATH = Path(__file__).parent.parent.parent / "config/render.txt"
+DEFAULT_CONFIG = {
+    "executor": "process",  # process：獨立行程 (建議)；thread：同一行程內的執行緒
+    "workers": min(4, os.cpu_count() or 1),
+    "queue_depth": 32,  # 除了正在繪製的工作外，最多再排隊幾個
+    "encoder": gacha_render.DEFAULT_ENCODER,  # 結果圖的編碼模式，見 gacha_render.ENCODERS
+}
+
+
+class RenderQueueFull(Exception):
+    """繪圖佇列已滿。"""
+
+
+class RenderFailed(Exception):
+    """繪圖工作者異常結束 (記憶體不足、PIL 當掉等)；執行池已重建，之後的工作可以繼續。"""
+
+
+def load_render_config(path: Path = CONFIG_PATH) -> dict:
+    """讀取 config/render.txt (每行 key=value，# 開頭為註解)，未設定的項目使用預設值。"""
+    config = dict(DEFAULT_CONFIG)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f.read().splitlines():
+                line = line.split("#", 1)[0].strip()
+                if "=" not in line:
+                    continue
+                key, value = (part.strip() for part in line.split("=", 1))
+                if key in ("workers", "queue_depth"):
+                    config[key] = max(int(value), 1 if key == "workers" else 0)
+                elif key == "encoder" and value not in gacha_render.ENCODERS:
+                    print(f"警告：未知的編碼模式 '{value}'，使用 {config['encoder']}。")
+                elif key in config:
+                    config[key] = value
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        print(f"警告：繪圖設定檔 '{path}' 格式錯誤 ({e})，部分設定使用預設值。")
+    return config
+
+
+def _init_worker(image_dir, render_dir, warm_keys):
+    # 每個繪圖行程啟動時：素材已在 import gacha_render 時載入，這裡再預熱卡片快取
+    gacha_render.IMAGE_DIR = image_dir
+    icon_store.RENDER_DIR = render_dir
+    gacha_render.warm_cards(warm_keys)
+
+
+_worker_generation = 0  # 工作者目前使用的資料版本 (RenderPool.refresh 時遞增)
+
+
+def _sync_worker(generation):
+    # 資料更新後第一次收到新版本的工作時，改用新的頭像圖集；卡片快取保留
+    global _worker_generation
+    if generation != _worker_generation:
+        _worker_generation = generation
+        gacha_render.reset_atlas()
+
+
+def _cache_report():
+    # 卡片快取只存在於各工作者中，隨每個工作的結果一起帶回主行程
+    return os.getpid(), gacha_render.CARD_CACHE.stats()
+
+
+def _render_job(card_keys, encoder, submitted_at, generation=0):
+    _sync_worker(generation)
+    started_at = time.monotonic()
+    data = gacha_render.render_results(card_keys, encoder)
+    return data, started_at - submitted_at, time.monotonic() - started_at, _cache_report()
+
+
+def _warm_job(generation, warm_keys):
+    _sync_worker(generation)
+    gacha_render.warm_cards(warm_keys)
+    return _cache_report()
+
+
+
+class RenderPool:
+    """有上限的繪圖執行池；佇列滿時 render() 會丟出 RenderQueueFull。"""
+
+    def __init__(self, workers: int, queue_depth: int, executor: str = "process", warm_keys=(), encoder: str = gacha_render.DEFAULT_ENCODER):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.executor_kind = executor
+        self.encoder = encoder
+        self.extension = gacha_render.encoder_extension(encoder)
+        self._warm_keys = tuple(warm_keys)
+        self._executor = self._create_executor()
+        self.generation = 0
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self._wait_times = stats_window.window()
+        self._render_times = stats_window.window()
+        self._card_caches = {}  # 工作者 pid -> 最近一次回報的卡片快取統計
+
+    def _create_executor(self):
+        initargs = (gacha_render.IMAGE_DIR, icon_store.RENDER_DIR, self._warm_keys)
+        if self.executor_kind == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=initargs)
+        # 使用 spawn，避免在已有執行緒的 bot 行程中 fork
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=initargs,
+        )
+
+    def _restart(self, broken):
+        """工作者異常結束後換一個新的執行池 (同時失敗的多個工作只重建一次)。"""
+        if self._executor is not broken:
+            return
+        print("繪圖工作者異常結束，重建繪圖執行池。")
+        self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._create_executor()
+        self._card_caches.clear() # 舊工作者的快取已隨行程消失
+
+    @classmethod
+    def from_config(cls, warm_keys=(), path: Path = CONFIG_PATH):
+        config = load_render_config(path)
+        return cls(config["workers"], config["queue_depth"], config["executor"], warm_keys, config["encoder"])
+
+    async def start(self):
+        """先讓所有繪圖工作者啟動並完成預熱，避免第一次抽卡時才冷啟動。"""
+        loop = asyncio.get_running_loop()
+        reports = await asyncio.gather(*(loop.run_in_executor(self._executor, _cache_report) for _ in range(self.workers)))
+        self._card_caches.update(reports)
+
+    async def render(self, card_keys) -> bytes:
+        if self._in_flight >= self.workers + self.queue_depth:
+            self.rejected += 1
+            raise RenderQueueFull(f"繪圖佇列已滿 ({self._in_flight} 個工作)")
+        self._in_flight += 1
+        executor = self._executor
+        try:
+            loop = asyncio.get_running_loop()
+            data, wait_time, render_time, (pid, cache_stats) = await loop.run_in_executor(
+                executor, _render_job, list(card_keys), self.encoder, time.monotonic(), self.generation
+            )
+        except BrokenExecutor as e:
+            self._restart(executor)
+            raise RenderFailed(str(e)) from e
+        finally:
+            self._in_flight -= 1
+        self.completed += 1
+        self._wait_times.append(wait_time)
+        self._render_times.append(render_time)
+        self._card_caches[pid] = cache_stats
+        return data
+
+    async def refresh(self, warm_keys):
+        """資料更新後通知工作者：之後的工作改用新的頭像圖集，並預熱新卡池的卡片。
+
+        工作者與已快取的卡片都保留；預熱是盡力而為 (每個工作者不一定都會分到一份)，
+        沒預熱到的卡片在第一次抽到時補畫。
+        """
+        self.generation += 1
+        self._warm_keys = tuple(warm_keys) # 之後重建的執行池也以新的卡片預熱
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            reports = await asyncio.gather(*(
+                loop.run_in_executor(executor, _warm_job, self.generation, self._warm_keys) for _ in range(self.workers)
+            ))
+        except BrokenExecutor:
+            self._restart(executor)
+            return
+        self._card_caches.update(reports)
+
+    def stats(self) -> dict:
+        """工作數量、最近 STATS_WINDOW 次工作的等待/繪圖時間 (毫秒)，與各工作者卡片快取的合計。"""
+        caches = self._card_caches.values()
+        hits = sum(cache["hits"] for cache in caches)
+        misses = sum(cache["misses"] for cache in caches)
+        return {
+            "executor": self.executor_kind,
+            "encoder": self.encoder,
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "in_flight": self._in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "wait_p50_ms": stats_window.ms(stats_window.percentile(self._wait_times, 50)),
+            "wait_p95_ms": stats_window.ms(stats_window.percentile(self._wait_times, 95)),
+            "render_p50_ms": stats_window.ms(stats_window.percentile(self._render_times, 50)),
+            "render_p95_ms": stats_window.ms(stats_window.percentile(self._render_times, 95)),
+            "card_cache_workers": len(self._card_caches),
+            "card_cache_size": sum(cache["size"] for cache in caches),
+            "card_cache_hits": hits,
+            "card_cache_misses": misses,
+            "card_cache_hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,288 @@
+# cogs/utils/schema.py
+# 資料庫結構的版本化遷移：PRAGMA user_version 記錄目前的版本，initialize_database 時依序套用尚未執行的遷移
+# 已發佈的遷移不再修改 (其中的 SQL 與代碼都寫死)，結構有變動時在 MIGRATIONS 後面加一個新的
+import datetime
+import sqlite3
+
+# gacha_history 以小整數儲存伺服器與稀有度
+SERVER_CODES = {"global": 0, "japan": 1}
+SERVER_NAMES = {code: server for server, code in SERVER_CODES.items()}
+RARITY_CODES = {"R": 1, "SR": 2, "SSR": 3}  # 與 students_list.star_grade 相同
+RARITY_NAMES = {code: rarity for rarity, code in RARITY_CODES.items()}
+
+UNKNOWN_BANNER_ID = 0  # 第 3 版之前的記錄中，對應不到任何已登錄卡池的卡池名稱
+
+# 由抽卡記錄重建統計 (統計表重建時使用)
+BACKFILL_HISTORY_STATS = """
+    INSERT INTO gacha_history_stats (user_id, server, epoch, banner_id, total, ssr, sr, r, last_pull_time)
+    SELECT user_id, server, epoch, banner_id, COUNT(*),
+           SUM(rarity = 3), SUM(rarity = 2), SUM(rarity = 1), MAX(pull_time)
+    FROM gacha_history GROUP BY user_id, server, epoch, banner_id
+"""
+
+
+def _table_columns(cur, table_name: str) -> set:
+    cur.execute(f"PRAGMA table_info({table_name})")
+    return {row[1] for row in cur.fetchall()}
+
+
+def _migrate_1_history_epochs(cur):
+    """抽卡記錄、卡池期數與每期統計表 (沒有版本號的舊資料庫也從這裡開始，已存在的部分會略過)。"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS gacha_history (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        char_id INTEGER NOT NULL,
+        char_name TEXT NOT NULL,
+        rarity TEXT NOT NULL,
+        banner_name TEXT NOT NULL,
+        server TEXT NOT NULL,
+        epoch INTEGER NOT NULL DEFAULT 0,
+        pull_time TEXT NOT NULL
+    )""")
+    if "epoch" not in _table_columns(cur, "gacha_history"):
+        # 換期之前的資料庫：既有的記錄都屬於第 0 期
+        cur.execute("ALTER TABLE gacha_history ADD COLUMN epoch INTEGER NOT NULL DEFAULT 0")
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS history_epochs (
+        server TEXT PRIMARY KEY,
+        epoch INTEGER NOT NULL,
+        started_at TEXT NOT NULL
+    )""")
+    started_at = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9))).strftime('%Y-%m-%d %H:%M:%S')
+    cur.executemany(
+        "INSERT OR IGNORE INTO history_epochs (server, epoch, started_at) VALUES (?, 0, ?)",
+        [("global", started_at), ("japan", started_at)],
+    )
+
+    # 統計表只是抽卡記錄的彙總，舊版不分期的直接由記錄重建
+    stats_columns = _table_columns(cur, "gacha_history_stats")
+    if stats_columns and "epoch" not in stats_columns:
+        cur.execute("DROP TABLE gacha_history_stats")
+        stats_columns = set()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS gacha_history_stats (
+        user_id INTEGER NOT NULL,
+        server TEXT NOT NULL,
+        epoch INTEGER NOT NULL,
+        banner_name TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        ssr INTEGER NOT NULL,
+        sr INTEGER NOT NULL,
+        r INTEGER NOT NULL,
+        last_pull_time TEXT NOT NULL,
+        PRIMARY KEY (user_id, server, epoch, banner_name)
+    ) WITHOUT ROWID""")
+    if not stats_columns:
+        cur.execute("""
+        INSERT INTO gacha_history_stats (user_id, server, epoch, banner_name, total, ssr, sr, r, last_pull_time)
+        SELECT user_id, server, epoch, banner_name, COUNT(*),
+               SUM(rarity = 'SSR'), SUM(rarity = 'SR'), SUM(rarity = 'R'), MAX(pull_time)
+        FROM gacha_history GROUP BY user_id, server, epoch, banner_name
+        """)
+
+    for index_name in ("idx_history_user_banner_time", "idx_history_user_banner_rarity", "idx_history_user_banner_pulls",
+                       "idx_history_user_banner_char", "idx_history_server", "idx_history_stats_server"):
+        cur.execute(f"DROP INDEX IF EXISTS {index_name}")  # 不含 server 或 epoch 的舊索引
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_history_epoch_rarity ON gacha_history (user_id, server, epoch, banner_name, rarity, pull_time)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_history_epoch_pulls ON gacha_history (user_id, server, epoch, banner_name, pull_time)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_history_epoch_char ON gacha_history (user_id, server, epoch, banner_name, char_id, pull_time)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_history_server_epoch ON gacha_history (server, epoch)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_history_stats_server_epoch ON gacha_history_stats (server, epoch)")
+
+
+def _migrate_2_compact_history(cur):
+    """抽卡記錄改存整數：伺服器/稀有度代碼、UNIX 時間 (秒)，不再重複儲存角色名稱 (查詢時由 students_list 取得)。"""
+    cur.execute("""
+    CREATE TABLE gacha_history_new (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        server INTEGER NOT NULL,
+        epoch INTEGER NOT NULL,
+        banner_name TEXT NOT NULL,
+        char_id INTEGER NOT NULL,
+        rarity INTEGER NOT NULL,
+        pull_time INTEGER NOT NULL
+    )""")
+    # 舊的 pull_time 是台北時間 (UTC+8，無日光節約) 的字串；Fes 限定 Pick Up 以前存成 'Fes'，也是 SSR
+    # 舊版抽卡失敗時記下的 'Error' (char_id 0) 不是真的抽卡結果，不搬移
+    cur.execute("""
+    INSERT INTO gacha_history_new (id, user_id, server, epoch, banner_name, char_id, rarity, pull_time)
+    SELECT id, user_id,
+           CASE server WHEN 'japan' THEN 1 ELSE 0 END,
+           epoch, banner_name, char_id,
+           CASE rarity WHEN 'R' THEN 1 WHEN 'SR' THEN 2 WHEN 'SSR' THEN 3 WHEN 'Fes' THEN 3 END,
+           CAST(strftime('%s', pull_time, '-8 hours') AS INTEGER)
+    FROM gacha_history
+    WHERE rarity IN ('R', 'SR', 'SSR', 'Fes') AND char_id != 0
+    """)
+    cur.execute("DROP TABLE gacha_history")  # 舊的索引一併刪除
+    cur.execute("ALTER TABLE gacha_history_new RENAME TO gacha_history")
+    cur.execute("CREATE INDEX idx_history_epoch_rarity ON gacha_history (user_id, server, epoch, banner_name, rarity, pull_time)")
+    cur.execute("CREATE INDEX idx_history_epoch_pulls ON gacha_history (user_id, server, epoch, banner_name, pull_time)")
+    cur.execute("CREATE INDEX idx_history_epoch_char ON gacha_history (user_id, server, epoch, banner_name, char_id, pull_time)")
+    cur.execute("CREATE INDEX idx_history_server_epoch ON gacha_history (server, epoch)")
+
+    cur.execute("""
+    CREATE TABLE history_epochs_new (
+        server INTEGER PRIMARY KEY,
+        epoch INTEGER NOT NULL,
+        started_at TEXT NOT NULL
+    )""")
+    cur.execute("""
+    INSERT INTO history_epochs_new (server, epoch, started_at)
+    SELECT CASE server WHEN 'japan' THEN 1 ELSE 0 END, epoch, started_at FROM history_epochs
+    """)
+    cur.execute("DROP TABLE history_epochs")
+    cur.execute("ALTER TABLE history_epochs_new RENAME TO history_epochs")
+
+    cur.execute("DROP TABLE gacha_history_stats")
+    cur.execute("""
+    CREATE TABLE gacha_history_stats (
+        user_id INTEGER NOT NULL,
+        server INTEGER NOT NULL,
+        epoch INTEGER NOT NULL,
+        banner_name TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        ssr INTEGER NOT NULL,
+        sr INTEGER NOT NULL,
+        r INTEGER NOT NULL,
+        last_pull_time INTEGER NOT NULL,
+        PRIMARY KEY (user_id, server, epoch, banner_name)
+    ) WITHOUT ROWID""")
+    cur.execute("""
+    INSERT INTO gacha_history_stats (user_id, server, epoch, banner_name, total, ssr, sr, r, last_pull_time)
+    SELECT user_id, server, epoch, banner_name, COUNT(*), SUM(rarity = 3), SUM(rarity = 2), SUM(rarity = 1), MAX(pull_time)
+    FROM gacha_history GROUP BY user_id, server, epoch, banner_name
+    """)
+    cur.execute("CREATE INDEX idx_history_stats_server_epoch ON gacha_history_stats (server, epoch)")
+
+
+def _migrate_3_banner_registry(cur):
+    """卡池登錄表：每個 (伺服器, gachaType, Pick Up, 開放期間) 一個固定的整數編號，抽卡記錄改存編號而不是顯示名稱。"""
+    cur.execute("""
+    CREATE TABLE banners (
+        id INTEGER PRIMARY KEY,
+        server INTEGER NOT NULL,
+        gacha_type TEXT NOT NULL,
+        rateup_id INTEGER NOT NULL,
+        sale_from INTEGER NOT NULL,
+        sale_to INTEGER NOT NULL,
+        UNIQUE (server, gacha_type, rateup_id, sale_from, sale_to)
+    )""")
+
+    # 目前的卡池先以「期間不明」(0, 0) 登錄，下次 update 取得開放期間時沿用同一個編號補上
+    # 舊的卡池名稱依當時的規則 (常駐招募 / Pick Up 角色在該伺服器的名稱 / 特殊招募) 對應到編號
+    cur.execute("CREATE TEMP TABLE banner_name_map (server INTEGER, name TEXT, banner_id INTEGER)")
+    for server, table_name, name_column in ((0, "current_banner_gl", "name_tw"), (1, "current_banner_jp", "name_jp")):
+        if not _table_columns(cur, table_name):
+            continue
+        if "banner_id" not in _table_columns(cur, table_name):
+            cur.execute(f"ALTER TABLE {table_name} ADD COLUMN banner_id INTEGER")
+        cur.execute(f"""
+            SELECT b.rowid, b.type, b.rateup_id, s.{name_column}
+            FROM {table_name} b LEFT JOIN students_list s ON s.id = b.rateup_id
+        """)
+        for rowid, gacha_type, rateup_id, rateup_name in cur.fetchall():
+            cur.execute(
+                "INSERT OR IGNORE INTO banners (server, gacha_type, rateup_id, sale_from, sale_to) VALUES (?, ?, ?, 0, 0)",
+                (server, gacha_type, rateup_id or 0),
+            )
+            cur.execute(
+                "SELECT id FROM banners WHERE server = ? AND gacha_type = ? AND rateup_id = ? AND sale_from = 0 AND sale_to = 0",
+                (server, gacha_type, rateup_id or 0),
+            )
+            banner_id = cur.fetchone()[0]
+            cur.execute(f"UPDATE {table_name} SET banner_id = ? WHERE rowid = ?", (banner_id, rowid))
+            name = "常駐招募" if gacha_type == "NormalGacha" else rateup_name if rateup_id and rateup_name else "特殊招募"
+            cur.execute("INSERT INTO banner_name_map VALUES (?, ?, ?)", (server, name, banner_id))
+
+    cur.execute("""
+    CREATE TABLE gacha_history_new (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        server INTEGER NOT NULL,
+        epoch INTEGER NOT NULL,
+        banner_id INTEGER NOT NULL,
+        char_id INTEGER NOT NULL,
+        rarity INTEGER NOT NULL,
+        pull_time INTEGER NOT NULL
+    )""")
+    # 對應不到的名稱 (以前卡池的記錄) 記為 UNKNOWN_BANNER_ID，查詢不到，隨舊的期數一起清除
+    cur.execute("""
+    INSERT INTO gacha_history_new (id, user_id, server, epoch, banner_id, char_id, rarity, pull_time)
+    SELECT h.id, h.user_id, h.server, h.epoch,
+           COALESCE((SELECT MIN(m.banner_id) FROM banner_name_map m WHERE m.server = h.server AND m.name = h.banner_name), ?),
+           h.char_id, h.rarity, h.pull_time
+    FROM gacha_history h
+    """, (UNKNOWN_BANNER_ID,))
+    cur.execute("DROP TABLE banner_name_map")
+    cur.execute("DROP TABLE gacha_history")
+    cur.execute("ALTER TABLE gacha_history_new RENAME TO gacha_history")
+    cur.execute("CREATE INDEX idx_history_epoch_rarity ON gacha_history (user_id, server, epoch, banner_id, rarity, pull_time)")
+    cur.execute("CREATE INDEX idx_history_epoch_pulls ON gacha_history (user_id, server, epoch, banner_id, pull_time)")
+    cur.execute("CREATE INDEX idx_history_epoch_char ON gacha_history (user_id, server, epoch, banner_id, char_id, pull_time)")
+    cur.execute("CREATE INDEX idx_history_server_epoch ON gacha_history (server, epoch)")
+
+    cur.execute("DROP TABLE gacha_history_stats")
+    cur.execute("""
+    CREATE TABLE gacha_history_stats (
+        user_id INTEGER NOT NULL,
+        server INTEGER NOT NULL,
+        epoch INTEGER NOT NULL,
+        banner_id INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        ssr INTEGER NOT NULL,
+        sr INTEGER NOT NULL,
+        r INTEGER NOT NULL,
+        last_pull_time INTEGER NOT NULL,
+        PRIMARY KEY (user_id, server, epoch, banner_id)
+    ) WITHOUT ROWID""")
+    cur.execute("""
+    INSERT INTO gacha_history_stats (user_id, server, epoch, banner_id, total, ssr, sr, r, last_pull_time)
+    SELECT user_id, server, epoch, banner_id, COUNT(*), SUM(rarity = 3), SUM(rarity = 2), SUM(rarity = 1), MAX(pull_time)
+    FROM gacha_history GROUP BY user_id, server, epoch, banner_id
+    """)
+    cur.execute("CREATE INDEX idx_history_stats_server_epoch ON gacha_history_stats (server, epoch)")
+
+
+# 第 n 個遷移把資料庫從版本 n-1 升到 n
+MIGRATIONS = (
+    _migrate_1_history_epochs,
+    _migrate_2_compact_history,
+    _migrate_3_banner_registry,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_version(con: sqlite3.Connection) -> int:
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(con: sqlite3.Connection) -> int:
+    """把資料庫升級到 SCHEMA_VERSION，回傳套用的遷移數。
+
+    每個遷移與新的版本號在同一個交易中提交，中途失敗時停在上一個版本。
+    """
+    version = get_version(con)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"資料庫版本 ({version}) 比程式支援的 ({SCHEMA_VERSION}) 新")
+    isolation_level = con.isolation_level
+    con.isolation_level = None  # 交易由這裡明確控制 (DDL 也包含在交易中)
+    try:
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            migration = MIGRATIONS[target - 1]
+            cur = con.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                migration(cur)
+                cur.execute(f"PRAGMA user_version = {target}")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            cur.execute("COMMIT")
+            print(f"資料庫結構已升級到第 {target} 版 ({migration.__name__})")
+    finally:
+        con.isolation_level = isolation_level
+    return SCHEMA_VERSION - version
@@ -0,0 +1,22 @@
+# cogs/utils/stats_window.py
+# 繪圖執行池與抽卡記錄佇列共用的統計小工具：只保留最近 STATS_WINDOW 筆的百分位數
+from collections import deque
+
+STATS_WINDOW = 1000  # 統計最近幾次工作的時間
+
+
+def window() -> deque:
+    """只保留最近 STATS_WINDOW 筆的樣本。"""
+    return deque(maxlen=STATS_WINDOW)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def ms(value):
+    """秒 → 毫秒 (四捨五入到 0.1)，沒有樣本時為 None。"""
+    return None if value is None else round(value * 1000, 1)
@@ -0,0 +1,50 @@
+# cogs/utils/student_catalog.py
+# 學生名冊：以平行陣列保存所有學生資料，卡池與抽卡結果只需傳遞整數索引
+import numpy as np
+
+SERVER_NAME_LOCALE = {"global": "tw", "japan": "jp"}  # 各伺服器顯示用的名稱語系
+POOL_NAMES = ("R", "SR", "SSR", "Limited_Normal", "Limited_Fes")
+
+
+class StudentCatalog:
+    """students_list 的 struct-of-arrays 版本。
+
+    ids / star_grades / is_limited / in_global 為 NumPy 陣列，
+    names[語系] 為各語系名稱的 tuple，index 為 id → 陣列索引。
+    """
+    __slots__ = ("ids", "star_grades", "is_limited", "in_global", "names", "index")
+
+    def __init__(self, rows):
+        rows = list(rows)
+        self.ids = np.array([row["id"] for row in rows], dtype=np.int64)
+        self.star_grades = np.array([row["star_grade"] or 0 for row in rows], dtype=np.int8)
+        self.is_limited = np.array([row["is_limited"] or 0 for row in rows], dtype=np.int8)
+        self.in_global = np.array([bool(row["in_global"]) for row in rows], dtype=bool)
+        self.names = {
+            "jp": tuple(row["name_jp"] for row in rows),
+            "tw": tuple(row["name_tw"] for row in rows),
+            "en": tuple(row["name_en"] for row in rows),
+        }
+        self.index = {int(student_id): i for i, student_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def student_id(self, idx: int) -> int:
+        return int(self.ids[idx])
+
+    def name(self, idx: int, server: str) -> str:
+        return self.names[SERVER_NAME_LOCALE.get(server, "jp")][idx]
+
+    def pools(self, server: str) -> dict:
+        """依稀有度/限定類型分好的卡池，每個卡池都是學生索引的 NumPy 陣列。"""
+        available = self.in_global if server == "global" else np.ones(len(self), dtype=bool)
+        star, limited = self.star_grades, self.is_limited
+        masks = {
+            "R": (star == 1) & (limited == 0),
+            "SR": (star == 2) & (limited == 0),
+            "SSR": (star == 3) & (limited == 0),  # 常駐
+            "Limited_Normal": (star == 3) & (limited == 1),  # 普通限定
+            "Limited_Fes": (star == 3) & (limited == 3),  # Fes 限定
+        }
+        return {name: np.flatnonzero(masks[name] & available).astype(np.int32) for name in POOL_NAMES}
@@ -2,8 +2,9 @@ from dctoken import *
 import discord
 from discord.ext import commands
 from cogs.utils import get_gacha_data # 依然需要 import
+from cogs.utils import db_connection
 import traceback
-import asyncio # 新增 import
+import asyncio
 
 # 設定 Bot
 intents = discord.Intents.default()
@@ -23,14 +24,14 @@ async def run_initial_database_setup():
     if needs_update:
         print("資料庫資料不足或不存在，執行首次資料更新...")
         try:
-            # 由於 get_gacha_data.update 是同步的，在 async on_ready 中用 run_in_executor
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(None, get_gacha_data.update)
+            await get_gacha_data.update_async()
             print("首次資料更新完成。")
         except Exception as e:
             print(f"首次資料更新時發生嚴重錯誤: {e}")
     else:
         print("資料庫已有足夠資料，跳過首次資料更新。")
+        # 舊版建立的資料庫升級到目前的結構；重建大型抽卡記錄表可能要數十秒，不能卡住 gateway 心跳
+        await asyncio.to_thread(get_gacha_data.migrate_database)
     print("首次資料庫檢查與更新流程結束。")
 
 
@@ -58,4 +59,7 @@ async def on_ready():
             print(f'載入 Cog {extension} 失敗.')
             traceback.print_exc()
 
-bot.run(token)
+# 繪圖執行池以 spawn 啟動子行程時會重新 import 本檔，因此只在直接執行時啟動 bot
+if __name__ == "__main__":
+    bot.run(token)
+    db_connection.close_all() # 關閉長駐的資料庫連線 (順便 checkpoint WAL)
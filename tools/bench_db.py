@@ -0,0 +1,292 @@
+# tools/bench_db.py
+# 資料庫存取的每次呼叫延遲：每次重新連線 (舊方式，rollback journal) vs 長駐連線 (WAL)，
+# 大量抽卡同時寫入時，各自提交與延遲寫入佇列的比較，卡池變更時整批 DELETE 與換期 + 分批清除的比較，
+# 以及抽卡記錄改用整數欄位 (schema 第 2 版) 前後的資料表與索引大小
+#
+#   python -m tools.bench_db
+#   python -m tools.bench_db --history 200000 --calls 2000
+import argparse
+import random
+import shutil
+import sqlite3
+import sys
+import time
+
+from cogs.utils import get_gacha_data, schema
+from tools.fixtures import FIXTURE_POOLS, build_fixture_db
+
+USER_COUNT = 500
+BANNER_IDS = (1, 2, 3)  # 假的卡池登錄編號
+SEED_START = 1717167600  # 2024-06-01 00:00 (台北時間)
+SEED_SPAN = 28 * 86400
+
+
+def seed_records(rows: int, seed: int) -> list:
+    """rows 筆隨機抽卡 (使用者, 伺服器, 卡池編號, 學生, 稀有度, UNIX 時間)，時間依序分布在 28 天內。"""
+    rng = random.Random(seed)
+    students = [(sid, rarity) for rarity in ("R", "SR", "SSR") for sid in FIXTURE_POOLS[rarity][0]]
+    records = []
+    for n in range(rows):
+        sid, rarity = rng.choice(students)
+        records.append((
+            rng.randrange(USER_COUNT), rng.choice(("global", "japan")), rng.choice(BANNER_IDS),
+            sid, rarity, SEED_START + n * SEED_SPAN // rows,
+        ))
+    return records
+
+
+def seed_history(db_path, rows: int, seed: int):
+    """在假資料庫塞入 rows 筆抽卡記錄 (USER_COUNT 位使用者、數個卡池，都在第 0 期) 並重建統計表。"""
+    con = sqlite3.connect(db_path)
+    con.executemany(
+        "INSERT INTO gacha_history (user_id, server, epoch, banner_id, char_id, rarity, pull_time) VALUES (?, ?, 0, ?, ?, ?, ?)",
+        [
+            (user_id, schema.SERVER_CODES[server], banner_id, sid, schema.RARITY_CODES[rarity], pull_time)
+            for user_id, server, banner_id, sid, rarity, pull_time in seed_records(rows, seed)
+        ],
+    )
+    con.execute("DELETE FROM gacha_history_stats")
+    con.execute(schema.BACKFILL_HISTORY_STATS)
+    con.commit()
+    con.close()
+
+
+def history_storage(db_path) -> dict:
+    """抽卡記錄相關的資料表與索引各占多少位元組 (需要 SQLite 的 dbstat)。"""
+    con = sqlite3.connect(db_path)
+    try:
+        return dict(con.execute(
+            "SELECT name, SUM(pgsize) FROM dbstat WHERE name LIKE '%history%' GROUP BY name ORDER BY name"
+        ).fetchall())
+    finally:
+        con.close()
+
+
+def bench_storage(rows: int, seed: int):
+    """同樣的抽卡記錄，以第 1 版 (文字欄位) 與遷移到目前版本後的大小。"""
+    import tempfile
+    from pathlib import Path
+    db_path = Path(tempfile.mkdtemp(prefix="gacha_storage_")) / "history.db"
+    con = sqlite3.connect(db_path)
+    con.execute("CREATE TABLE students_list (id INTEGER PRIMARY KEY, name_jp TEXT, name_tw TEXT, name_en TEXT, star_grade INTEGER, is_limited INTEGER, in_global INTEGER)")
+    # 每個假卡池是一個 Pick Up 卡池，舊版的卡池名稱即 Pick Up 角色的名稱 (遷移時才對應得到卡池編號)
+    pickups = dict(zip(BANNER_IDS, FIXTURE_POOLS["SSR"][0]))
+    con.executemany("INSERT INTO students_list VALUES (?, ?, ?, ?, 3, 0, 1)", [(sid, f"學生{sid}", f"學生{sid}", "") for sid in pickups.values()])
+    for table in ("current_banner_gl", "current_banner_jp"):
+        con.execute(f"CREATE TABLE {table} (type TEXT, rateup_id INTEGER)")
+        con.executemany(f"INSERT INTO {table} VALUES ('PickupGacha', ?)", [(sid,) for sid in pickups.values()])
+    con.commit()
+    con.isolation_level = None
+    schema.MIGRATIONS[0](con.cursor())
+    con.execute("PRAGMA user_version = 1")
+    con.execute("BEGIN")
+    con.executemany(
+        "INSERT INTO gacha_history (user_id, char_id, char_name, rarity, banner_name, server, pull_time) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (user_id, sid, f"學生{sid}", rarity, f"學生{pickups[banner_id]}", server,
+             time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(pull_time + 8 * 3600)))
+            for user_id, server, banner_id, sid, rarity, pull_time in seed_records(rows, seed)
+        ],
+    )
+    con.execute("COMMIT")
+    con.execute("DROP TABLE gacha_history_stats")  # 再執行一次第 1 版的遷移，由記錄重建統計表
+    con.execute("BEGIN")
+    schema.MIGRATIONS[0](con.cursor())
+    con.execute("COMMIT")
+    con.execute("VACUUM")
+    try:
+        before = history_storage(db_path)
+    except sqlite3.OperationalError:
+        print("\n這個 SQLite 沒有 dbstat，略過資料表大小的比較。")
+        return
+    start = time.perf_counter()
+    schema.migrate(con)
+    migrate_ms = (time.perf_counter() - start) * 1000
+    con.execute("VACUUM")
+    con.close()
+    after = history_storage(db_path)
+
+    print(f"\n抽卡記錄的資料表與索引 ({rows:,} 筆，第 1 版 → 第 {schema.SCHEMA_VERSION} 版，遷移 {migrate_ms:.0f} ms)：")
+    for name in sorted(before.keys() | after.keys()):
+        old, new = before.get(name), after.get(name)
+        old_text = f"{old / 1024:>10.0f} KB" if old else f"{'-':>13}"
+        new_text = f"{new / 1024:>10.0f} KB" if new else f"{'-':>13}"
+        print(f"  {name:<34}{old_text}{new_text}")
+    print(f"  {'合計':<32}{sum(before.values()) / 1024:>10.0f} KB{sum(after.values()) / 1024:>10.0f} KB")
+
+
+# --- 舊方式：每次呼叫都重新連線 ---
+def legacy_get_current_banners(db_path, server):
+    con = sqlite3.connect(db_path)
+    con.row_factory = sqlite3.Row
+    table_name = f"current_banner_{'gl' if server == 'global' else 'jp'}"
+    rows = con.execute(
+        f"SELECT b.type, s.id, s.name_tw, s.star_grade, s.is_limited FROM {table_name} b LEFT JOIN students_list s ON b.rateup_id = s.id"
+    ).fetchall()
+    con.close()
+    return rows
+
+
+def legacy_history(db_path, user_id, banner_id):
+    con = sqlite3.connect(db_path)
+    con.row_factory = sqlite3.Row
+    rows = con.execute(
+        "SELECT * FROM gacha_history WHERE user_id = ? AND banner_id = ? ORDER BY pull_time DESC", (user_id, banner_id)
+    ).fetchall()
+    con.close()
+    return rows
+
+
+def legacy_history_summary(db_path, user_id, banner_id):
+    # 舊的 /gacha-history：讀出所有欄位再在 Python 中統計、篩選 SSR
+    rows = legacy_history(db_path, user_id, banner_id)
+    counts = [sum(1 for pull in rows if pull["rarity"] == schema.RARITY_CODES[rarity]) for rarity in ("SSR", "SR", "R")]
+    return counts, [pull for pull in rows if pull["rarity"] == schema.RARITY_CODES["SSR"]]
+
+
+def legacy_rotate(db_path, server):
+    # 舊的卡池變更：在 update 的交易中整批刪除該伺服器的記錄
+    con = sqlite3.connect(db_path)
+    con.execute("DELETE FROM gacha_history WHERE server = ?", (schema.SERVER_CODES[server],))
+    con.commit()
+    con.close()
+
+
+def legacy_record(db_path, records):
+    con = sqlite3.connect(db_path)
+    con.executemany(
+        "INSERT INTO gacha_history (user_id, server, epoch, banner_id, char_id, rarity, pull_time) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        records,
+    )
+    con.commit()
+    con.close()
+
+
+def measure(func, calls: int) -> dict:
+    samples = []
+    for n in range(calls):
+        start = time.perf_counter()
+        func(n)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {pct: samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000 for pct in (50, 95, 99)}
+
+
+def bench_write_burst(gacha_db, catalog, ten_pull, interactions: int):
+    """大量「再抽一次！」同時湧入：每次互動各自提交 vs 延遲寫入佇列。"""
+    import asyncio
+    from cogs.utils.pull_recorder import PullRecorder
+
+    start = time.perf_counter()
+    for n in range(interactions):
+        gacha_db.record_pulls(n, "global", 0, BANNER_IDS[0], ten_pull, catalog)
+    direct = time.perf_counter() - start
+
+    async def burst():
+        recorder = PullRecorder()
+        recorder.start()
+        loop_blocked = 0.0
+        for n in range(interactions):
+            started_at = time.perf_counter()
+            recorder.record(n, "global", 0, BANNER_IDS[0], ten_pull, catalog)
+            loop_blocked += time.perf_counter() - started_at
+            if n % 20 == 0:
+                await asyncio.sleep(0.001)  # 互動之間讓出事件迴圈
+        start = time.perf_counter()
+        await recorder.close()
+        return loop_blocked, time.perf_counter() - start, recorder.stats()
+
+    loop_blocked, drain, stats = asyncio.run(burst())
+    print(f"\n{interactions} 次十連同時寫入：")
+    print(f"  每次互動各自提交：{interactions} 個交易，事件迴圈被占用 {direct * 1000:.1f} ms")
+    print(
+        f"  延遲寫入佇列    ：{stats['batches']} 個交易 (每批約 {stats['batch_p50']} 筆)，"
+        f"事件迴圈被占用 {loop_blocked * 1000:.1f} ms，關閉時寫完剩餘記錄 {drain * 1000:.1f} ms"
+    )
+
+
+def bench_rotation(gacha_db, db_path, legacy_path):
+    """卡池變更：舊方式整批 DELETE vs 換期 (UPDATE 一列) + 背景分批清除。"""
+    start = time.perf_counter()
+    legacy_rotate(legacy_path, "global")
+    legacy_ms = (time.perf_counter() - start) * 1000
+
+    con = sqlite3.connect(db_path)
+    start = time.perf_counter()
+    for _ in range(gacha_db.HISTORY_KEEP_EPOCHS):  # 換期到第 0 期超出保留範圍
+        con.execute(get_gacha_data.ADVANCE_HISTORY_EPOCH, ("2024-07-01 00:00:00", schema.SERVER_CODES["global"]))
+        con.commit()
+    advance_ms = (time.perf_counter() - start) * 1000 / gacha_db.HISTORY_KEEP_EPOCHS
+    con.close()
+
+    batch_times = []
+    deleted = 0
+    while True:
+        start = time.perf_counter()
+        count = gacha_db.prune_history_batch()
+        batch_times.append(time.perf_counter() - start)
+        if not count:
+            break
+        deleted += count
+    print("\n卡池變更 (國際服)：")
+    print(f"  舊方式整批 DELETE：{legacy_ms:.1f} ms (寫入鎖一次占用這麼久)")
+    print(f"  換期             ：{advance_ms:.3f} ms")
+    print(
+        f"  背景分批清除     ：{len(batch_times) - 1} 批共 {deleted:,} 列，合計 {sum(batch_times) * 1000:.1f} ms，"
+        f"單批最長 {max(batch_times) * 1000:.1f} ms"
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="資料庫存取延遲：每次連線 vs 長駐連線")
+    parser.add_argument("--history", type=int, default=50_000, help="預先塞入的抽卡記錄數")
+    parser.add_argument("--calls", type=int, default=1000, help="每項量測的呼叫次數")
+    parser.add_argument("--seed", type=int, default=20240601)
+    parser.add_argument("--burst", type=int, default=500, help="同時寫入量測的互動數")
+    args = parser.parse_args(argv)
+
+    db_path = build_fixture_db()
+    seed_history(db_path, args.history, args.seed)
+    legacy_path = db_path.with_name("legacy.db")
+    shutil.copyfile(db_path, legacy_path)  # 舊方式使用預設的 rollback journal
+
+    from cogs.utils import gacha_db
+    catalog = gacha_db.get_student_catalog()
+    ten_pull = [(catalog.index[sid], 0) for sid in FIXTURE_POOLS["R"][0][:10]]
+    legacy_rows = [(1, 0, 0, BANNER_IDS[0], sid, 1, SEED_START + SEED_SPAN) for sid in FIXTURE_POOLS["R"][0][:10]]
+    epoch = gacha_db.get_history_epochs()["global"]
+
+    cases = (
+        ("get_current_banners",
+         lambda n: legacy_get_current_banners(legacy_path, "global"),
+         lambda n: gacha_db.get_current_banners("global")),
+        ("歷史統計 (GROUP BY rarity)",
+         lambda n: legacy_history_summary(legacy_path, n % USER_COUNT, BANNER_IDS[n % 3]),
+         lambda n: (gacha_db.get_user_rarity_counts(n % USER_COUNT, "global", epoch, BANNER_IDS[n % 3]),
+                    gacha_db.get_user_ssr_history(n % USER_COUNT, "global", epoch, BANNER_IDS[n % 3]))),
+        ("歷史統計 (統計表)",
+         lambda n: legacy_history_summary(legacy_path, n % USER_COUNT, BANNER_IDS[n % 3]),
+         lambda n: (gacha_db.get_user_banner_stats(n % USER_COUNT, "global", epoch, BANNER_IDS[n % 3]),
+                    gacha_db.get_user_ssr_history(n % USER_COUNT, "global", epoch, BANNER_IDS[n % 3]))),
+        ("一頁抽卡記錄 (keyset)",
+         lambda n: legacy_history(legacy_path, n % USER_COUNT, BANNER_IDS[n % 3]),
+         lambda n: gacha_db.get_user_history_page(n % USER_COUNT, "global", epoch, BANNER_IDS[n % 3], before=(SEED_START + SEED_SPAN * 2 // 3, 0))),
+        ("record_pulls (十連)",
+         lambda n: legacy_record(legacy_path, legacy_rows),
+         lambda n: gacha_db.record_pulls(1, "global", epoch, BANNER_IDS[0], ten_pull, catalog)),
+    )
+    print(f"抽卡記錄 {args.history:,} 筆，每項 {args.calls:,} 次呼叫 (毫秒)")
+    print(f"{'':<30}{'舊 p50':>9}{'舊 p95':>9}{'新 p50':>9}{'新 p95':>9}{'p50 加速':>10}")
+    for label, legacy, current in cases:
+        old = measure(legacy, args.calls)
+        new = measure(current, args.calls)
+        print(f"{label:<30}{old[50]:>9.3f}{old[95]:>9.3f}{new[50]:>9.3f}{new[95]:>9.3f}{old[50] / new[50]:>9.1f}x")
+
+    bench_write_burst(gacha_db, catalog, ten_pull, args.burst)
+    bench_rotation(gacha_db, db_path, legacy_path)
+    bench_storage(args.history, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+# tools/bench_pull.py
+# 抽卡引擎的效能量測與機率一致性檢查 (離線，使用 tools/fixtures.py 的假資料庫)
+#
+#   python -m tools.bench_pull                 # 量測 + 檢查
+#   python -m tools.bench_pull --check-only    # 只跑卡方檢定
+#
+# 檢查失敗時以 exit code 1 結束，修改抽卡路徑後跑一次即可確認機率沒有被改動。
+import argparse
+import math
+import random
+import sys
+import time
+
+import numpy as np
+
+from tools.fixtures import FIXTURE_BANNERS, FIXTURE_POOLS, build_fixture_db
+
+CATEGORY_NAMES = ("R", "SR", "SSR_Perm", "SSR_PickUp", "SSR_Lim_Norm_Other", "SSR_Fes_PickUp", "SSR_Fes_Other")
+SIGNIFICANCE = 0.001
+
+
+def declared_weights(gacha_type: str, banner_index: int, last_pull: bool) -> list:
+    """公告機率 (未正規化)，獨立於抽卡引擎另外寫一份。
+
+    FesGacha 的 0.7% + 0.9% + 4.4% = 6% 是在 R/SR 不變的情況下加上去的，
+    正規化後實際的三星率為 6/103 ≈ 5.83%，這裡照現行行為檢查。
+    """
+    if gacha_type == "PickupGacha":
+        weights = [78.5, 18.5, 2.3, 0.7, 0, 0, 0]
+    elif gacha_type == "LimitedGacha":
+        # 同期其他限定與常駐三星依角色數均分 2.3%
+        num_permanent = len(FIXTURE_POOLS["SSR"][0])
+        num_others = sum(1 for i, (t, _) in enumerate(FIXTURE_BANNERS) if t == "LimitedGacha" and i != banner_index)
+        total = num_permanent + num_others
+        weights = [78.5, 18.5, 2.3 * num_permanent / total, 0.7, 2.3 * num_others / total, 0, 0]
+    elif gacha_type == "FesGacha":
+        weights = [78.5, 18.5, 4.4, 0, 0, 0.7, 0.9]
+    else:
+        weights = [78.5, 18.5, 3.0, 0, 0, 0, 0]
+    if last_pull:  # 十連保底：R 的機率全給 SR
+        weights[1] += weights[0]
+        weights[0] = 0
+    total = sum(weights)
+    return [w / total for w in weights]
+
+
+def make_classifier(catalog, gacha_type: str, pickup_id):
+    """依學生 id 判斷屬於哪個類別 (以學生索引查詢)，不依賴引擎回傳的類別標籤。"""
+    pool_category = {}
+    for pool_name, category in (("R", 0), ("SR", 1), ("SSR", 2), ("Limited_Normal", 4), ("Limited_Fes", 6)):
+        for sid in FIXTURE_POOLS[pool_name][0]:
+            pool_category[catalog.index[sid]] = category
+    if pickup_id is not None:
+        pool_category[catalog.index[pickup_id]] = 5 if gacha_type == "FesGacha" else 3
+    return pool_category
+
+
+def chi_square_sf(statistic: float, dof: int) -> float:
+    """卡方分布的右尾機率 Q(dof/2, x/2)，以不完全 gamma 函數計算。"""
+    if statistic <= 0:
+        return 1.0
+    a, x = dof / 2.0, statistic / 2.0
+    log_prefix = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:  # 級數展開求 P，再取 1 - P
+        term = total = 1.0 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1.0 - total * math.exp(log_prefix))
+    # 連分數求 Q (Lentz 法)
+    tiny = 1e-300
+    b = x + 1.0 - a
+    c = 1.0 / tiny
+    d = 1.0 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2.0
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1.0 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < 1e-15:
+            break
+    return h * math.exp(log_prefix)
+
+
+def chi_square(observed, expected_probs, n):
+    """回傳 (統計量, 自由度, p 值)；期望為 0 的類別若有觀測值，直接視為不通過。"""
+    statistic = 0.0
+    dof = -1
+    for obs, prob in zip(observed, expected_probs):
+        if prob <= 0:
+            if obs:
+                return math.inf, 0, 0.0
+            continue
+        expected = prob * n
+        statistic += (obs - expected) ** 2 / expected
+        dof += 1
+    return statistic, dof, chi_square_sf(statistic, max(dof, 1))
+
+
+def check_conformance(cog, server: str, pulls: int, seed: int) -> bool:
+    print(f"\n== 機率一致性檢查 ({server}, 每項 {pulls:,} 抽, alpha={SIGNIFICANCE}) ==")
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    all_passed = True
+    for choice, (gacha_type, pickup_id) in enumerate(FIXTURE_BANNERS):
+        classify = make_classifier(cog.catalog, gacha_type, pickup_id)
+
+        def sample_pull_logic(last_pull):
+            return [classify[cog.pull_logic(server, choice, last_pull)[0]] for _ in range(pulls)]
+
+        def sample_pull_many(last_pull):
+            # pull_many 每第 10 抽為保底，保底與一般抽分開統計
+            _, indices = cog.pull_many(server, choice, pulls * 10 if last_pull else pulls * 10 // 9 + 10, rng)
+            is_last = np.zeros(indices.size, dtype=bool)
+            is_last[9::10] = True
+            return [classify[int(idx)] for idx in indices[is_last if last_pull else ~is_last][:pulls]]
+
+        for last_pull in (False, True):
+            expected = declared_weights(gacha_type, choice, last_pull)
+            for path, sampler in (("pull_logic", sample_pull_logic), ("pull_many", sample_pull_many)):
+                drawn = sampler(last_pull)
+                observed = np.bincount(drawn, minlength=len(CATEGORY_NAMES))
+                statistic, dof, p_value = chi_square(observed, expected, len(drawn))
+                passed = p_value >= SIGNIFICANCE
+                all_passed &= passed
+                label = f"{gacha_type}[{choice}]{' 第10抽' if last_pull else ''}"
+                rates = " ".join(
+                    f"{name}={obs / len(drawn) * 100:.3f}%({prob * 100:.3f}%)"
+                    for name, obs, prob in zip(CATEGORY_NAMES, observed, expected) if prob > 0 or obs
+                )
+                print(f"[{'通過' if passed else '失敗'}] {label:<24} {path:<10} chi2={statistic:8.2f} dof={dof} p={p_value:.4f}  {rates}")
+    return all_passed
+
+
+def benchmark(cog, server: str, seconds: float):
+    print(f"\n== 抽卡效能 ({server}) ==")
+    for choice, (gacha_type, _) in enumerate(FIXTURE_BANNERS):
+        # 單抽
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            for _ in range(1000):
+                cog.pull_logic(server, choice, False)
+            count += 1000
+        single_rate = count / (time.perf_counter() - start)
+
+        # 十連
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            for _ in range(100):
+                [cog.pull_logic(server, choice, i == 9) for i in range(10)]
+            count += 100
+        ten_rate = count / (time.perf_counter() - start)
+
+        # 批次
+        batch = 1_000_000
+        rng = np.random.default_rng()
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            cog.pull_many(server, choice, batch, rng)
+            count += batch
+        batch_rate = count / (time.perf_counter() - start)
+
+        print(
+            f"{gacha_type}[{choice}]: 單抽 {single_rate:,.0f} 抽/秒 | "
+            f"十連 {ten_rate:,.0f} 次/秒 ({ten_rate * 10:,.0f} 抽/秒) | "
+            f"批次 {batch_rate:,.0f} 抽/秒"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="抽卡引擎效能量測與機率一致性檢查")
+    parser.add_argument("--pulls", type=int, default=200_000, help="每項卡方檢定的抽數")
+    parser.add_argument("--seed", type=int, default=20240601)
+    parser.add_argument("--seconds", type=float, default=1.0, help="每項效能量測的時間")
+    parser.add_argument("--server", choices=("global", "japan"), default="global")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--bench-only", action="store_true")
+    group.add_argument("--check-only", action="store_true")
+    args = parser.parse_args(argv)
+
+    build_fixture_db()
+    from cogs.gacha import Gacha  # 需在假資料庫建立後才載入資料
+    cog = Gacha(None)
+
+    if not args.check_only:
+        benchmark(cog, args.server, args.seconds)
+    if args.bench_only:
+        return 0
+    passed = check_conformance(cog, args.server, args.pulls, args.seed)
+    print("\n全部通過" if passed else "\n有項目未通過，抽卡機率與公告不符！")
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+# tools/bench_render.py
+# 結果圖的合成與各編碼模式的時間/檔案大小 (離線，使用 tools/fixtures.py 的假資料庫與假頭像)
+#
+#   python -m tools.bench_render
+#   python -m tools.bench_render --rounds 50
+import argparse
+import statistics
+import sys
+import time
+
+import PIL.Image
+
+from tools.fixtures import build_fixture_db, build_fixture_icons
+
+# 具代表性的十連：7 R、1 SR、1 常駐 SSR、1 Pick Up (與實際最常見的結果相近)
+TEN_PULL_KEYS = [
+    (10001, "R"), (10002, "R"), (13001, "SR"), (10003, "R"), (10004, "R"),
+    (16002, "SSR"), (10005, "R"), (10006, "R"), (10007, "R"), (16001, "Pickup_SSR"),
+]
+SINGLE_PULL_KEYS = [(16001, "Pickup_SSR")]
+
+
+def measure(func, rounds: int) -> float:
+    """回傳 rounds 次的中位數 (毫秒)。"""
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def legacy_compose(gacha_render, card_keys: list):
+    """改用版面範本之前的合成方式 (每次轉換背景並建立中間格線畫布)，回傳 (圖片, 畫布配置的位元組數)。"""
+    char_images = [gacha_render.get_card(key) for key in card_keys]
+    converted = gacha_render.BACKGROUND.convert("RGBA")
+    final_bg_image = converted.copy()
+    allocated = 2 * final_bg_image.width * final_bg_image.height * 4
+    bg_width, bg_height = final_bg_image.size
+    if len(char_images) > 1:
+        cols, (img_width, img_height), padding = 5, (120, 140), 10
+        rows = -(-len(char_images) // cols)
+        grid_width = cols * img_width + padding * 2
+        grid_height = rows * img_height + padding * 2
+        card_grid_image = PIL.Image.new("RGBA", (grid_width, grid_height), (0, 0, 0, 0))
+        allocated += grid_width * grid_height * 4
+        for i, img in enumerate(char_images):
+            x_on_grid = padding + (i % cols * img_width) + (img_width - 160) // 2
+            y_on_grid = padding + (i // cols * img_height) + (img_height - 160) // 2
+            card_grid_image.alpha_composite(img, (x_on_grid, y_on_grid))
+        final_bg_image.alpha_composite(card_grid_image, ((bg_width - grid_width) // 2, (bg_height - grid_height) // 2))
+    else:
+        card = char_images[0]
+        final_bg_image.alpha_composite(card, ((bg_width - card.width) // 2, (bg_height - card.height) // 2))
+    return final_bg_image, allocated
+
+
+def bench_layouts(gacha_render, rounds: int):
+    print("\n== 合成：版面範本 vs 舊方式 (卡片已在快取中) ==")
+    print(f"{'':<6}{'舊 ms':>10}{'範本 ms':>10}{'舊 畫布KB':>12}{'範本 畫布KB':>12}{'結果相同':>8}")
+    for label, keys in (("十連", TEN_PULL_KEYS), ("單抽", SINGLE_PULL_KEYS)):
+        legacy_image, legacy_bytes = legacy_compose(gacha_render, keys)
+        image = gacha_render.compose_results(keys)
+        template_bytes = image.width * image.height * 4  # 只有背景範本的副本
+        same = legacy_image.tobytes() == image.tobytes()
+        legacy_ms = measure(lambda: legacy_compose(gacha_render, keys), rounds)
+        template_ms = measure(lambda: gacha_render.compose_results(keys), rounds)
+        print(f"{label:<6}{legacy_ms:>10.2f}{template_ms:>10.2f}{legacy_bytes / 1024:>12.0f}{template_bytes / 1024:>12.0f}{'是' if same else '否':>8}")
+
+
+def bench_encoders(gacha_render, rounds: int):
+    for label, keys in (("十連", TEN_PULL_KEYS), ("單抽", SINGLE_PULL_KEYS)):
+        image = gacha_render.compose_results(keys)
+        compose_ms = measure(lambda: gacha_render.compose_results(keys), rounds)
+        print(f"\n== {label} ({image.width}x{image.height}，合成 {compose_ms:.2f} ms) ==")
+        print(f"{'模式':<14}{'編碼 ms':>10}{'大小 KB':>10}{'相對 png':>10}")
+        baseline_size = None
+        for encoder in gacha_render.ENCODERS:
+            data = gacha_render.encode_image(image, encoder)
+            baseline_size = baseline_size or len(data)
+            encode_ms = measure(lambda: gacha_render.encode_image(image, encoder), rounds)
+            print(f"{encoder:<14}{encode_ms:>10.2f}{len(data) / 1024:>10.1f}{len(data) / baseline_size:>10.0%}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="結果圖合成與編碼模式的時間與大小比較")
+    parser.add_argument("--rounds", type=int, default=20, help="每項量測的次數 (取中位數)")
+    args = parser.parse_args(argv)
+
+    build_fixture_db()
+    build_fixture_icons()
+    from cogs.utils import gacha_render  # 需在假資料建立後才載入
+
+    bench_layouts(gacha_render, args.rounds)
+    bench_encoders(gacha_render, args.rounds)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+# tools/check_http_cache.py
+# 以本機的假 HTTP 伺服器檢查 get_gacha_data.update 的條件式下載與磁碟回應快取 (不需連網)
+# 假伺服器依 ETag / Last-Modified 回 304，並可切換成全部回 503 模擬資料來源故障；
+# 另以數百張假頭像檢查補抓頭像時共用少數幾條 keep-alive 連線
+#
+#   python -m tools.check_http_cache
+#
+# 有檢查失敗時以 exit code 1 結束。
+import asyncio
+import datetime
+import hashlib
+import json
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from tools.fixtures import FIXTURE_POOLS, build_fixture_db, build_fixture_icons
+
+SALE_FORMAT = "%Y-%m-%d %H:%M:%S"
+ICON_BACKFILL_COUNT = 300
+ICON_LATENCY = 0.02  # 秒；假伺服器回應每張頭像前的延遲，模擬實際的往返時間
+ICON_BACKFILL_LIMIT = 10  # 秒
+
+
+def student_payload(locale: str) -> bytes:
+    students = {}
+    for ids, star_grade, is_limited in FIXTURE_POOLS.values():
+        for sid in ids:
+            students[str(sid)] = {"Id": sid, "Name": f"{locale}{sid}", "StarGrade": star_grade, "IsLimited": is_limited, "IsReleased": [True, True]}
+    return json.dumps(students).encode("utf-8")
+
+
+def banner_payload(rateup_id: int, now: datetime.datetime) -> bytes:
+    period = {
+        "SalePeriodFrom": (now - datetime.timedelta(days=1)).strftime(SALE_FORMAT),
+        "SalePeriodTo": (now + datetime.timedelta(days=7)).strftime(SALE_FORMAT),
+    }
+    return json.dumps({"DataList": [
+        {"CategoryType": "NormalGacha", "IsLegacy": False, **period},
+        {"CategoryType": "PickupGacha", "IsLegacy": False, "InfoCharacterId": [rateup_id], **period},
+    ]}).encode("utf-8")
+
+
+class StandInServer:
+    """回應 /<來源名稱> 的假資料來源；記錄每次回應的狀態碼。"""
+
+    def __init__(self, bodies: dict):
+        self.bodies = bodies
+        self.down = False
+        self.statuses = []
+        self.connections = set()  # 用過的用戶端 (位址, 埠)，即實際開啟的連線
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # 支援 keep-alive
+            disable_nagle_algorithm = True  # 標頭與內容分開寫出時不被 Nagle + delayed ACK 拖慢
+
+            def do_GET(self):
+                stand_in.connections.add(self.client_address)
+                if self.path.startswith("/icon/"):
+                    time.sleep(ICON_LATENCY)
+                    return self._reply(200, b"icon", {"Content-Type": "image/webp"})
+                body = stand_in.bodies.get(self.path.lstrip("/"))
+                if stand_in.down or body is None:
+                    return self._reply(503 if stand_in.down else 404)
+                etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self._reply(304, headers={"ETag": etag})
+                self._reply(200, body, {"ETag": etag, "Last-Modified": formatdate(usegmt=True), "Content-Type": "application/json"})
+
+            def _reply(self, status, body=b"", headers=None):
+                stand_in.statuses.append(status)
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, key: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}/{key}"
+
+    def take_statuses(self) -> list:
+        statuses, self.statuses = sorted(self.statuses), []
+        return statuses
+
+    def icon_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}/icon/{{student_id}}.webp"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+async def backfill_icons(get_gacha_data, http_client, tasks: list) -> list:
+    async with http_client.HttpClient() as client:
+        return await get_gacha_data.download_images(client, tasks)
+
+
+def main(argv=None) -> int:
+    directory = Path(tempfile.mkdtemp(prefix="gacha_http_cache_"))
+    db_path = build_fixture_db(directory)
+    build_fixture_icons() # 頭像都已存在，update 不會去連實際的圖片網址
+    from cogs.utils import get_gacha_data, http_client, schema
+    get_gacha_data.HTTP_CACHE_DIR = directory / "http_cache"
+    get_gacha_data.UPDATE_STATE_PATH = directory / "update_state.json"
+
+    now = datetime.datetime.now(get_gacha_data.UTC_PLUS_9).replace(tzinfo=None)
+    pickups = list(FIXTURE_POOLS["SSR"][0])
+    server = StandInServer({
+        "char_jp": student_payload("jp"), "char_tw": student_payload("tw"), "char_en": student_payload("en"),
+        "banner_jp": banner_payload(pickups[0], now), "banner_gl": banner_payload(pickups[1], now),
+    })
+    get_gacha_data.API_URLS = {key: server.url(key) for key in server.bodies}
+
+    def epochs():
+        with sqlite3.connect(db_path) as con:
+            return dict(con.execute("SELECT server, epoch FROM history_epochs").fetchall())
+
+    results = []
+    def check(name, passed, detail=""):
+        results.append(passed)
+        print(f"[{'通過' if passed else '失敗'}] {name}{f'：{detail}' if detail else ''}")
+
+    try:
+        updated = get_gacha_data.update()
+        statuses = server.take_statuses()
+        check("第一次更新完整下載並寫入", updated and statuses == [200] * 5, statuses)
+
+        before = epochs()
+        updated = get_gacha_data.update()
+        statuses = server.take_statuses()
+        check("來源沒有變動時全部 304 並略過更新", not updated and statuses == [304] * 5, statuses)
+        check("略過更新時卡池期數不變", epochs() == before)
+
+        server.bodies["banner_jp"] = banner_payload(pickups[2], now)
+        updated = get_gacha_data.update()
+        statuses = server.take_statuses()
+        new_epochs = epochs()
+        check("只有變動的來源重新下載", updated and statuses == [200] + [304] * 4, statuses)
+        check("日服卡池變更時只有日服換期",
+              new_epochs[schema.SERVER_CODES["japan"]] == before[schema.SERVER_CODES["japan"]] + 1
+              and new_epochs[schema.SERVER_CODES["global"]] == before[schema.SERVER_CODES["global"]], new_epochs)
+
+        server.down = True
+        updated = get_gacha_data.update()
+        statuses = server.take_statuses()
+        check("資料來源故障時重試後沿用快取且不重寫資料庫",
+              not updated and statuses == [503] * 5 * http_client.MAX_ATTEMPTS and epochs() == new_epochs, f"{len(statuses)} 次 503")
+        server.down = False
+
+        state = get_gacha_data.load_update_state()
+        state["valid_until"] = int(time.time()) - 1
+        get_gacha_data.save_update_state(state)
+        updated = get_gacha_data.update()
+        statuses = server.take_statuses()
+        check("到了卡池開始/結束的時間時即使來源沒有變動也重新寫入", updated and statuses == [304] * 5, statuses)
+
+        for path in get_gacha_data.HTTP_CACHE_DIR.glob("*.body"):
+            path.unlink()
+        updated = get_gacha_data.update()
+        statuses = server.take_statuses()
+        check("快取內容遺失時不送條件式請求", not updated and statuses == [200] * 5, statuses)
+
+        def banner_count():
+            with sqlite3.connect(db_path) as con:
+                return con.execute("SELECT COUNT(*) FROM current_banner_jp").fetchone()[0]
+
+        get_gacha_data.set_simulated_time(2099, 1, 1)
+        get_gacha_data.update()
+        simulated_banners = banner_count()
+        get_gacha_data.set_simulated_time()
+        updated = get_gacha_data.update()
+        server.take_statuses()
+        check("清除模擬時間後重新寫入目前的卡池", simulated_banners == 0 and updated and banner_count() > 0,
+              f"模擬時 {simulated_banners} 個、清除後 {banner_count()} 個日服卡池")
+
+        get_gacha_data.ICON_URL = server.icon_url()
+        icon_dir = directory / "icon_backfill"
+        icon_dir.mkdir()
+        tasks = [(sid, icon_dir / f"{sid}.png") for sid in range(90001, 90001 + ICON_BACKFILL_COUNT)]
+        server.take_statuses()
+        server.connections.clear()
+        start = time.perf_counter()
+        downloaded = asyncio.run(backfill_icons(get_gacha_data, http_client, tasks))
+        elapsed = time.perf_counter() - start
+        check(f"補抓 {ICON_BACKFILL_COUNT} 張頭像", all(downloaded) and all(path.exists() for _, path in tasks), f"{elapsed:.2f} 秒")
+        check("補抓頭像在時間內完成", elapsed < ICON_BACKFILL_LIMIT, f"上限 {ICON_BACKFILL_LIMIT} 秒")
+        check("補抓頭像共用 keep-alive 連線", len(server.connections) <= http_client.LIMIT_PER_HOST,
+              f"{len(server.connections)} 條連線 (每個主機上限 {http_client.LIMIT_PER_HOST})")
+    finally:
+        server.close()
+
+    print(f"\n{'全部通過' if all(results) else '有檢查失敗'}")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
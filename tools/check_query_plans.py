@@ -0,0 +1,52 @@
+# tools/check_query_plans.py
+# 以 EXPLAIN QUERY PLAN 確認 gacha_history 的高頻查詢都有用到索引 (沒有整表掃描或額外排序)
+#
+#   python -m tools.check_query_plans                              # 使用假資料庫 (initialize_database 建立的結構)
+#   python -m tools.check_query_plans --db gacha_data/gacha_data.db  # 檢查實際的資料庫
+#
+# 有查詢退回整表掃描時以 exit code 1 結束。
+import argparse
+import sqlite3
+import sys
+
+from tools.fixtures import build_fixture_db
+
+
+def hot_queries() -> dict:
+    from cogs.utils import gacha_db, get_gacha_data
+    queries = dict(gacha_db.HOT_QUERIES)
+    queries["update: 卡池換期"] = (get_gacha_data.ADVANCE_HISTORY_EPOCH, ("", 0))
+    queries["update: 卡池登錄編號"] = (get_gacha_data.SELECT_BANNER_ID, (0, "PickupGacha", 0, 0, 0))
+    return queries
+
+
+def check(db_path) -> bool:
+    from cogs.utils import gacha_db
+    con = sqlite3.connect(db_path)
+    all_passed = True
+    try:
+        for name, (sql, params) in hot_queries().items():
+            plan = gacha_db.explain_query_plan(con, sql, params)
+            passed = not gacha_db.is_full_scan(plan)
+            all_passed &= passed
+            print(f"[{'通過' if passed else '失敗'}] {name}")
+            for step in plan:
+                print(f"        {step}")
+    finally:
+        con.close()
+    return all_passed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="檢查高頻查詢的查詢計畫")
+    parser.add_argument("--db", help="要檢查的資料庫 (預設建立假資料庫)")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or build_fixture_db()
+    passed = check(db_path)
+    print("\n全部查詢都有使用索引" if passed else "\n有查詢退回整表掃描！")
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+# tools/fixtures.py
+# 離線測試/效能量測用的假資料庫：固定的學生名單與卡池，不需連網
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import PIL.Image
+
+from cogs.utils import gacha_db, gacha_render, get_gacha_data, icon_store
+
+# 固定的學生編號區間 (id 範圍, star_grade, is_limited)
+FIXTURE_POOLS = {
+    "R": (range(10001, 10021), 1, 0),
+    "SR": (range(13001, 13026), 2, 0),
+    "SSR": (range(16001, 16041), 3, 0),
+    "Limited_Normal": (range(20001, 20009), 3, 1),
+    "Limited_Fes": (range(26001, 26006), 3, 3),
+}
+
+# 假頭像的來源：從 README 的截圖中裁出 120x120 (與實際頭像同尺寸) 的區塊，讓編碼量測接近真實內容
+REPO_DIR = Path(__file__).parent.parent
+ICON_SOURCES = ("image.png", "image-1.png", "output.png")
+ICON_SIZE = 120
+
+# 每種 gachaType 各一個卡池；兩個 LimitedGacha 同期，用來檢查「同期其他限定」的機率
+FIXTURE_BANNERS = [
+    ("NormalGacha", None),
+    ("PickupGacha", 16001),
+    ("LimitedGacha", 20001),
+    ("LimitedGacha", 20002),
+    ("FesGacha", 26001),
+]
+FIXTURE_SALE_PERIOD = (1717167600, 1719759600)  # 2024-06-01 ~ 2024-07-01 (UNIX 秒)
+
+
+def build_fixture_db(directory: Path = None) -> Path:
+    """建立假資料庫並讓 gacha_db / get_gacha_data 指向它，回傳資料庫路徑。"""
+    directory = Path(directory or tempfile.mkdtemp(prefix="gacha_fixture_"))
+    db_path = directory / "gacha_data.db"
+    gacha_db.DB_PATH = db_path
+    get_gacha_data.DB_PATH = db_path
+    get_gacha_data.IMAGE_DIR = gacha_render.IMAGE_DIR = directory / "images"
+    icon_store.RENDER_DIR = directory / "images_render"
+    get_gacha_data.initialize_database()
+
+    students = []
+    for ids, star_grade, is_limited in FIXTURE_POOLS.values():
+        for sid in ids:
+            students.append((sid, f"学生{sid}", f"學生{sid}", f"Student{sid}", star_grade, is_limited, 1))
+
+    con = sqlite3.connect(db_path)
+    con.executemany("INSERT OR REPLACE INTO students_list VALUES (?, ?, ?, ?, ?, ?, ?)", students)
+    cur = con.cursor()
+    for server, table in (("japan", "current_banner_jp"), ("global", "current_banner_gl")):
+        cur.executemany(f"INSERT INTO {table} (type, rateup_id, banner_id) VALUES (?, ?, ?)", [
+            (gacha_type, rateup_id, get_gacha_data.register_banner(cur, server, gacha_type, rateup_id, *FIXTURE_SALE_PERIOD))
+            for gacha_type, rateup_id in FIXTURE_BANNERS
+        ])
+    con.commit()
+    con.close()
+    return db_path
+
+
+def build_fixture_icons() -> int:
+    """在 build_fixture_db 指定的圖片資料夾中為每個假學生產生頭像 (並同 update 產生處理好的版本)。"""
+    image_dir = gacha_render.IMAGE_DIR
+    image_dir.mkdir(parents=True, exist_ok=True)
+    sources = [PIL.Image.open(REPO_DIR / name).convert("RGBA") for name in ICON_SOURCES]
+    student_ids = [sid for ids, _, _ in FIXTURE_POOLS.values() for sid in ids]
+    for n, sid in enumerate(student_ids):
+        source = sources[n % len(sources)]
+        max_x, max_y = source.width - ICON_SIZE, source.height - ICON_SIZE
+        x, y = (n * 37) % (max_x + 1), (n * 23) % (max_y + 1)
+        source.crop((x, y, x + ICON_SIZE, y + ICON_SIZE)).save(image_dir / f"{sid}.png")
+    icon_store.update_render_icons(image_dir, student_ids)
+    icon_store.build_atlas(student_ids)
+    return len(student_ids)
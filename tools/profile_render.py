@@ -0,0 +1,198 @@
+# tools/profile_render.py
+# 抽卡結果圖的效能與記憶體量測 (Gacha.create_single_image / generate_gacha_image)
+# 使用實際的 assets/ 素材與 tools/fixtures.py 的假頭像，涵蓋每一種稀有度的繪製分支
+#
+#   python -m tools.profile_render                          # 量測並印出結果
+#   python -m tools.profile_render --json before.json       # 另存成 JSON
+#   python -m tools.profile_render --compare before.json    # 與先前的 JSON 比較
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import PIL
+
+from tools.fixtures import FIXTURE_BANNERS, FIXTURE_POOLS, build_fixture_db, build_fixture_icons
+
+try:
+    import resource  # Windows 沒有此模組，不記錄 RSS
+except ImportError:
+    resource = None
+
+PERCENTILES = (50, 90, 99)
+# 每一種顯示稀有度各一張：(卡池類別的 FIXTURE_POOLS 名稱, 稀有度代碼名稱)
+RARITY_CASES = {
+    "R": ("R", "RARITY_R"),
+    "SR": ("SR", "RARITY_SR"),
+    "Pickup_SR": ("SR", "RARITY_PICKUP_SR"),
+    "SSR": ("SSR", "RARITY_SSR"),
+    "Pickup_SSR": ("SSR", "RARITY_PICKUP_SSR"),
+    "Pickup_Fes": ("Limited_Fes", "RARITY_PICKUP_FES"),
+    "Error": (None, "RARITY_ERROR"),
+}
+
+
+def percentiles(samples: list) -> dict:
+    ordered = sorted(samples)
+    result = {f"p{pct}": round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000, 3) for pct in PERCENTILES}
+    result["mean"] = round(sum(ordered) / len(ordered) * 1000, 3)
+    return result
+
+
+def timed(func, rounds: int, before=None) -> list:
+    samples = []
+    for _ in range(rounds):
+        if before:
+            before()
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def peak_python_memory(func) -> int:
+    """func 執行期間 tracemalloc 記錄到的 Python 配置峰值 (位元組)。
+
+    Pillow 的像素緩衝區由 C 配置，不會被 tracemalloc 記錄；編碼結果等 Python 物件則會。
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def max_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss  # macOS 單位為位元組
+
+
+def profile_cards(cog, gacha_engine, gacha_render, rounds: int) -> dict:
+    """每種稀有度：冷 (清空卡片快取) 與熱 (命中快取) 的單張卡片延遲。"""
+    results = {}
+    for display, (pool_name, code_name) in RARITY_CASES.items():
+        code = getattr(gacha_engine, code_name)
+        student_idx = cog.catalog.index[FIXTURE_POOLS[pool_name][0][0]] if pool_name else -1
+        result = (student_idx, code)
+        assert gacha_render.render_card(*cog.card_key(result))[1], f"{display} 卡片不完整"
+        cold = timed(lambda: cog.create_single_image(result), rounds, before=gacha_render.CARD_CACHE.clear)
+        warm = timed(lambda: cog.create_single_image(result), rounds)
+        gacha_render.CARD_CACHE.clear()
+        results[display] = {
+            "cold_ms": percentiles(cold),
+            "warm_ms": percentiles(warm),
+            "peak_python_bytes": peak_python_memory(lambda: cog.create_single_image(result)),
+        }
+    return results
+
+
+def sample_results(cog, count: int, rounds: int) -> list:
+    """依假卡池實際抽出 rounds 組結果 (輪流使用每個卡池)。"""
+    batches = []
+    for n in range(rounds):
+        choice = n % len(FIXTURE_BANNERS)
+        batches.append([cog.pull_logic("global", choice, count == 10 and i == 9) for i in range(count)])
+    return batches
+
+
+def profile_images(cog, gacha_render, rounds: int, seed: int) -> dict:
+    """單抽與十連整張結果圖 (合成 + 編碼) 的延遲、記憶體與各編碼模式的輸出大小。"""
+    random.seed(seed)
+    results = {}
+    for label, count in (("single", 1), ("ten", 10)):
+        batches = sample_results(cog, count, rounds)
+        batch_iter = iter(batches * 2)
+        gacha_render.CARD_CACHE.clear()
+        cold = timed(lambda: cog.generate_gacha_image(next(batch_iter)), rounds, before=gacha_render.CARD_CACHE.clear)
+        warm = timed(lambda: cog.generate_gacha_image(next(batch_iter)), rounds)
+        sizes = {
+            encoder: sum(len(cog.generate_gacha_image(batch, encoder).getvalue()) for batch in batches) // len(batches)
+            for encoder in gacha_render.ENCODERS
+        }
+        results[label] = {
+            "cold_ms": percentiles(cold),
+            "warm_ms": percentiles(warm),
+            "peak_python_bytes": peak_python_memory(lambda: cog.generate_gacha_image(batches[0])),
+            "mean_bytes": sizes,
+        }
+    return results
+
+
+def print_report(report: dict, baseline: dict = None):
+    def delta(path, value):
+        # 與 baseline 相同路徑的數值比較
+        node = baseline
+        for key in path:
+            if not isinstance(node, dict) or key not in node:
+                return ""
+            node = node[key]
+        if not node:
+            return ""
+        return f" ({(value - node) / node:+.0%})"
+
+    print(f"\n== 單張卡片 (毫秒，{report['rounds']} 次) ==")
+    print(f"{'稀有度':<12}{'冷 p50':>10}{'冷 p99':>10}{'熱 p50':>10}{'熱 p99':>10}{'Python 峰值 KB':>16}")
+    for display, data in report["cards"].items():
+        cold, warm = data["cold_ms"], data["warm_ms"]
+        print(
+            f"{display:<12}{cold['p50']:>10.3f}{cold['p99']:>10.3f}{warm['p50']:>10.3f}{warm['p99']:>10.3f}"
+            f"{data['peak_python_bytes'] / 1024:>16.1f}{delta(('cards', display, 'cold_ms', 'p50'), cold['p50'])}"
+        )
+
+    for label, data in report["images"].items():
+        cold, warm = data["cold_ms"], data["warm_ms"]
+        print(f"\n== {'十連' if label == 'ten' else '單抽'}結果圖 (毫秒) ==")
+        print(f"冷 (卡片快取清空)：p50 {cold['p50']:.2f}  p90 {cold['p90']:.2f}  p99 {cold['p99']:.2f}{delta(('images', label, 'cold_ms', 'p50'), cold['p50'])}")
+        print(f"熱 (卡片已快取)  ：p50 {warm['p50']:.2f}  p90 {warm['p90']:.2f}  p99 {warm['p99']:.2f}{delta(('images', label, 'warm_ms', 'p50'), warm['p50'])}")
+        print(f"Python 配置峰值：{data['peak_python_bytes'] / 1024:.1f} KB")
+        sizes = "  ".join(f"{encoder} {size / 1024:.1f}KB" for encoder, size in data["mean_bytes"].items())
+        print(f"平均輸出大小：{sizes}")
+
+    if report["max_rss_kb"] is not None:
+        print(f"\n行程 RSS 峰值：{report['max_rss_kb'] / 1024:.1f} MB")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="抽卡結果圖的效能與記憶體量測")
+    parser.add_argument("--rounds", type=int, default=50, help="每項量測的次數")
+    parser.add_argument("--seed", type=int, default=20240601)
+    parser.add_argument("--json", metavar="PATH", help="把結果另存成 JSON")
+    parser.add_argument("--compare", metavar="PATH", help="與先前 --json 存下的結果比較")
+    args = parser.parse_args(argv)
+
+    build_fixture_db()
+    build_fixture_icons()
+    from cogs.gacha import Gacha  # 需在假資料建立後才載入
+    from cogs.utils import gacha_engine, gacha_render
+    cog = Gacha(None)
+
+    report = {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "rounds": args.rounds,
+        "cards": profile_cards(cog, gacha_engine, gacha_render, args.rounds),
+        "images": profile_images(cog, gacha_render, args.rounds, args.seed),
+        "max_rss_kb": max_rss_kb(),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"\n結果已存到 {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())